@@ -5,23 +5,55 @@
 RPC 调用时如果遇到不可恢复的错误，如调用超时（HTTP 408），则抛出错误。对于业务代码的错误，不抛出错误，而交返回结果由业务自行处理。
 
 """
+import time
 from dataclasses import fields
-from typing import Dict, Optional, Tuple
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
 
-from flask import jsonify
+from flask import current_app
 
 from everyclass.common.flask import plugin_available
 
 _logger = None
 _sentry = None
 _resource_id_encrypt = None
+_resource_id_batch_encrypt = None
+_lazy_resource_id_encoding = False
 
 
-def init(logger=None, sentry=None, resource_id_encrypt_function=None):
+def init(logger=None, sentry=None, resource_id_encrypt_function=None,
+         http_pool_connections: int = None, http_pool_maxsize: int = None, http_pool_block: bool = None,
+         rpc_connect_timeout: float = None, rpc_read_timeout: float = None, rpc_deadline: float = None,
+         retry_policy=None, circuit_breaker: Dict = None, json_codec=None,
+         resource_id_batch_encrypt_function=None, lazy_resource_id_encoding: bool = None, metrics: Dict = None,
+         interceptors: List = None, compression: Dict = None, prefetch: Dict = None,
+         room_index: Dict = None):
     """初始化 everyclass.rpc 模块
 
+    :param http_pool_connections: 每个上游会话缓存的主机连接池数量
+    :param http_pool_maxsize: 每个主机保留的长连接数量
+    :param http_pool_block: 连接数达到上限后是否阻塞等待空闲连接
+    :param rpc_connect_timeout: 默认的单次请求连接超时（秒）
+    :param rpc_read_timeout: 默认的单次请求读取超时（秒）
+    :param rpc_deadline: 默认的单次调用总时限（秒），包含所有重试
+    :param retry_policy: 进程级重试策略（`everyclass.rpc.retry.RetryPolicy`）
+    :param circuit_breaker: 熔断配置，如 `{"per_endpoint": True, "error_rate_threshold": 0.5}`，
+                            参数见 `everyclass.rpc.circuit_breaker.CircuitBreakerRegistry`
+    :param json_codec: JSON 编解码器，可以为 `auto`（默认，安装了 orjson 时使用 orjson）、`orjson`、`json` 或
+                       `everyclass.rpc.codec.JsonCodec` 实例
+    :param resource_id_batch_encrypt_function: 批量加密函数 `f(resource_type, resource_ids) -> List[str]`，
+                                               解码大列表（如 card 的学生列表）时一次性加密所有 ID
+    :param lazy_resource_id_encoding: 为 True 时 `*_id_encoded` 字段在第一次访问时才加密
+    :param metrics: 调用指标配置，如 `{"sinks": [StatsdSink()]}`，参数见 `everyclass.rpc.metrics.MetricsRegistry`
+    :param interceptors: RPC 调用拦截器列表（`everyclass.rpc.interceptors.Interceptor`），替换已配置的拦截器
+    :param compression: 压缩配置，如 `{"accept": ["zstd", "gzip"], "request_encoding": "gzip"}`，
+                        参数见 `everyclass.rpc.compression.CompressionSettings`
+    :param prefetch: 缓存预热配置，如 `{"cards_from_rooms": True, "rate": 10}`，在后台协程中预热 `Entity` 的缓存，
+                     参数见 `everyclass.rpc.prefetch.PrefetchJob`。需要在开启 `Entity` 缓存之后调用
+    :param room_index: 空闲教室索引配置，如 `{"refresh_interval": 60}`，在后台构建索引，供
+                       `Entity.get_available_room_ids` 使用，参数见 `everyclass.rpc.room_index.RoomIndex`
     """
-    global _logger, _sentry, _resource_id_encrypt
+    global _logger, _sentry, _resource_id_encrypt, _resource_id_batch_encrypt, _lazy_resource_id_encoding
 
     if logger:
         _logger = logger
@@ -29,6 +61,45 @@ def init(logger=None, sentry=None, resource_id_encrypt_function=None):
         _sentry = sentry
     if resource_id_encrypt_function:
         _resource_id_encrypt = resource_id_encrypt_function
+    if resource_id_batch_encrypt_function:
+        _resource_id_batch_encrypt = resource_id_batch_encrypt_function
+    if lazy_resource_id_encoding is not None:
+        _lazy_resource_id_encoding = lazy_resource_id_encoding
+    if any(x is not None for x in (http_pool_connections, http_pool_maxsize, http_pool_block)):
+        from everyclass.rpc.session import registry
+        registry.configure(pool_connections=http_pool_connections,
+                           pool_maxsize=http_pool_maxsize,
+                           pool_block=http_pool_block)
+    if any(x is not None for x in (rpc_connect_timeout, rpc_read_timeout, rpc_deadline)):
+        from everyclass.rpc.http import HttpRpc
+        HttpRpc.set_default_timeout(connect=rpc_connect_timeout, read=rpc_read_timeout, deadline=rpc_deadline)
+    if retry_policy:
+        from everyclass.rpc.http import HttpRpc
+        HttpRpc.set_retry_policy(retry_policy)
+    if circuit_breaker is not None:
+        from everyclass.rpc.circuit_breaker import registry
+        registry.configure(**circuit_breaker)
+    if json_codec:
+        from everyclass.rpc.codec import set_codec
+        set_codec(json_codec)
+    if metrics is not None:
+        from everyclass.rpc.metrics import registry
+        registry.configure(**metrics)
+    if interceptors is not None:
+        from everyclass.rpc.interceptors import chain
+        chain.set(interceptors)
+    if compression is not None:
+        from everyclass.rpc.compression import settings
+        settings.configure(**compression)
+    if prefetch is not None:
+        from everyclass.rpc.prefetch import PrefetchJob
+        PrefetchJob(**prefetch).start()
+    if room_index is not None:
+        from everyclass.rpc.entity import Entity
+        from everyclass.rpc.room_index import RoomIndex
+        index = RoomIndex(**room_index)
+        index.start()
+        Entity.set_room_index(index)
 
 
 def _return_string(status_code, string, sentry_capture=False, log=None):
@@ -44,9 +115,9 @@ def _return_json(status_code: int, json, sentry_capture=False, log=None):
         _sentry.captureException()
     if log and _logger:
         _logger.info(log)
-    resp = jsonify(json)
-    resp.status_code = status_code
-    return resp
+    from everyclass.rpc.codec import get_codec
+    json_codec = get_codec()
+    return current_app.response_class(json_codec.dumps(json), status=status_code, mimetype=json_codec.content_type)
 
 
 def handle_exception_with_message(e: Exception) -> Tuple:
@@ -110,21 +181,134 @@ def handle_exception_with_json(e: Exception, lazy=False) -> Optional[Tuple]:
         return None
 
 
+_UNEXPECTED_FIELD_WARN_INTERVAL = 60.0  # 同一个类的同一个多余字段每分钟最多警告一次
+_unexpected_field_warned: Dict[Tuple[str, str], float] = {}
+
+
+def _warn_unexpected_fields(cls, keys: Iterable[str]) -> None:
+    """记录被丢弃的多余字段。同一字段在 `_UNEXPECTED_FIELD_WARN_INTERVAL` 秒内只警告一次，避免上游新增字段后刷屏"""
+    now = time.monotonic()
+    for key in keys:
+        warned_at = _unexpected_field_warned.get((cls.__name__, key))
+        if warned_at is not None and now - warned_at < _UNEXPECTED_FIELD_WARN_INTERVAL:
+            continue
+        _unexpected_field_warned[(cls.__name__, key)] = now
+        if _logger:
+            _logger.warning(
+                "Unexpected field `{}` is removed when converting dict to dataclass `{}`".format(key, cls.__name__))
+
+
+class Decoder:
+    """预先计算好的 dict → dataclass 转换器，每个类只在定义时构造一次。
+
+    一次遍历完成字段改名、值转换和多余字段的丢弃，然后调用构造函数。通过 `@decodable` 挂到类上后在 `make()` 中使用：
+
+    ```
+    @decodable(renames={"code": "student_id", "semester_list": "semesters"}, converters={"semesters": sorted})
+    @dataclass
+    class Foo:
+        student_id: str
+        semesters: List[str]
+
+        @classmethod
+        def make(cls, dct: Dict) -> "Foo":
+            return cls._decode(dct)
+    ```
+
+    :param cls: 目标 dataclass
+    :param renames: 响应字段名到 dataclass 字段名的映射
+    :param converters: dataclass 字段名到值转换函数的映射
+    :param ignore: 已知但不需要的响应字段，丢弃时不警告
+    """
+    __slots__ = ('cls', '_plan', '_ignore', '_known')
+
+    def __init__(self, cls, renames: Dict[str, str] = None, converters: Dict[str, Callable] = None,
+                 ignore: Iterable[str] = ()):
+        renames = renames or {}
+        converters = converters or {}
+        names = [f.name for f in fields(cls) if f.init]
+        sources = {name: key for key, name in renames.items()}
+        for name in list(sources) + list(converters):
+            if name not in names:
+                raise ValueError(f'{cls.__name__} has no field named {name}')
+        self.cls = cls
+        self._plan: Tuple[Tuple[str, str, Optional[Callable]], ...] = tuple(
+            (sources.get(name, name), name, converters.get(name)) for name in names)
+        self._ignore: Tuple[str, ...] = tuple(ignore)
+        self._known = frozenset(key for key, _, _ in self._plan) | frozenset(self._ignore)
+
+    def __call__(self, dct: Dict, **values):
+        """由 `dct` 构造对象。`values` 中的字段（如由其他字段计算出的值）直接传给构造函数，不再从 `dct` 读取"""
+        found = 0
+        for key, name, convert in self._plan:
+            if key not in dct:
+                continue
+            found += 1
+            if name not in values:
+                values[name] = dct[key] if convert is None else convert(dct[key])
+        for key in self._ignore:
+            if key in dct:
+                found += 1
+        if found != len(dct):
+            _warn_unexpected_fields(self.cls, [key for key in dct if key not in self._known])
+        return self.cls(**values)
+
+
+def decodable(renames: Dict[str, str] = None, converters: Dict[str, Callable] = None, ignore: Iterable[str] = ()):
+    """为 dataclass 构造 `Decoder` 并保存为 `cls._decode`，参数见 `Decoder`。需要放在所有类装饰器的最外层"""
+
+    def wrap(cls):
+        cls._decode = Decoder(cls, renames=renames, converters=converters, ignore=ignore)
+        return cls
+
+    return wrap
+
+
 def ensure_slots(cls, dct: Dict):
-    """移除 dataclass 中不存在的key，预防 dataclass 的 __init__ 中 unexpected argument 的发生。"""
-    _names = [x.name for x in fields(cls)]
-    _del = []
-    for key in dct:
-        if key not in _names:
-            _del.append(key)
-    for key in _del:
+    """移除 dataclass 中不存在的key，预防 dataclass 的 __init__ 中 unexpected argument 的发生。
+
+    保留用于兼容，新代码请使用 `Decoder`。
+    """
+    names = _field_names(cls)
+    unexpected = [key for key in dct if key not in names]
+    for key in unexpected:
         del dct[key]  # delete unexpected keys
-        from everyclass.rpc import _logger
-        _logger.warn(
-            "Unexpected field `{}` is removed when converting dict to dataclass `{}`".format(key, cls.__name__))
+    if unexpected:
+        _warn_unexpected_fields(cls, unexpected)
     return dct
 
 
+@lru_cache(maxsize=None)
+def _field_names(cls) -> FrozenSet[str]:
+    return frozenset(f.name for f in fields(cls))
+
+
+def add_slots(cls):
+    """为 dataclass 添加 `__slots__`，去掉每个实例的 `__dict__` 以减少内存占用，属性访问方式不变。
+
+    需要放在 `@dataclass` 之上：
+
+    ```
+    @add_slots
+    @dataclass
+    class Foo:
+        bar: str
+    ```
+    """
+    if '__slots__' in cls.__dict__:
+        raise TypeError(f'{cls.__name__} already specifies __slots__')
+    cls_dict = dict(cls.__dict__)
+    field_names = tuple(f.name for f in fields(cls))
+    cls_dict['__slots__'] = field_names
+    for name in field_names:
+        cls_dict.pop(name, None)  # 类属性上的默认值会与 slot 冲突，默认值已由 dataclass 生成的 __init__ 保存
+    cls_dict.pop('__dict__', None)
+    cls_dict.pop('__weakref__', None)
+    new_cls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    new_cls.__qualname__ = cls.__qualname__
+    return new_cls
+
+
 class RpcException(ConnectionError):
     """HTTP 4xx or 5xx"""
     pass
@@ -0,0 +1,33 @@
+"""
+everyclass.rpc 的命令行入口，目前只有缓存预热（参数见 `everyclass.rpc.prefetch.main`）：
+
+    python -m everyclass.rpc prefetch --base-url http://everyclass-entity --semester 2018-2019-1 \\
+        --current-semester 2018-2019-2 --disk-cache /var/cache/everyclass/entity.db --cards-from-rooms
+
+命令执行前对标准库打 gevent 补丁，否则协程池中的请求会依次阻塞。requests 等依赖必须在打补丁之后导入，因此命令所在的模块在
+`main` 中才导入。`python -m` 会先导入 `everyclass.rpc`（及其依赖的 flask），如果此时 ssl 已被导入则不再对其打补丁（https
+请求仍然可用，只是不会让出）。需要完整的补丁时通过 gevent 的启动器运行：
+
+    python -m gevent.monkey --module everyclass.rpc prefetch --base-url https://everyclass-entity ...
+"""
+import sys
+from typing import List
+
+USAGE = 'usage: python -m everyclass.rpc prefetch [-h] ...'
+
+
+def main(argv: List[str] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != 'prefetch':
+        print(USAGE, file=sys.stderr)
+        return 2
+
+    from gevent import monkey
+    monkey.patch_all(ssl='ssl' not in sys.modules)
+
+    from everyclass.rpc import prefetch
+    return prefetch.main(argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,6 @@
+"""
+everyclass.rpc 的 asyncio 版本（依赖 aiohttp）。
+
+模块结构与同步版本一致（`aio.entity.Entity`、`aio.auth.Auth`、`aio.identity.Login` 等），返回相同的结果类型并抛出相同的异常，
+超时、重试策略和熔断配置与同步版本共享。所有上游共用一个连接池，事件循环退出前应调用 `AsyncHttpRpc.close()`。
+"""
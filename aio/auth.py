@@ -0,0 +1,11 @@
+from everyclass.rpc import auth
+from everyclass.rpc.aio.http import AsyncHttpRpc
+
+
+class Auth(auth.Auth):
+    """`everyclass.rpc.auth.Auth` 的 asyncio 版本，所有方法都需要 await"""
+
+    @classmethod
+    async def _call(cls, decode=None, **kwargs):
+        resp = await AsyncHttpRpc.call(service='auth', **kwargs)
+        return decode(resp) if decode else resp
@@ -0,0 +1,124 @@
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+from everyclass.rpc import RpcException, RpcResourceNotFound, entity
+from everyclass.rpc.aio.http import AsyncHttpRpc
+from everyclass.rpc.aio.singleflight import SingleFlight
+from everyclass.rpc.cache import MISSING
+from everyclass.rpc.entity import BatchResult
+
+
+class Entity(entity.Entity):
+    """`everyclass.rpc.entity.Entity` 的 asyncio 版本，所有查询方法都需要 await
+
+    返回的结果类型与同步版本相同。未单独设置时，服务地址、请求 token 和结果缓存沿用同步版本的配置。
+
+    这里只重写了 `_call`、`_multi_get` 和 `search_iter`。`get_*`、`search` 等查询方法继承自同步版本，本身是普通函数，返回的是
+    `_call` 或 `_multi_get` 的协程，因此必须 await，漏掉 await 时得到的是协程对象而不是结果。配置方法和
+    `get_available_room_ids`（由本地索引回答）不需要 await。
+    """
+    _flights = SingleFlight()
+
+    @classmethod
+    async def _call(cls, url: str, decode: Callable[[Dict], Any], ok_status: str = "success", auth: bool = True,
+                    cache_key: Tuple = None, semester: str = None,
+                    error_message: str = 'API Server returns non-success status', flight_key: Tuple = None):
+        ttl, cached = cls._cache_lookup(cache_key, semester)
+        if cached is not MISSING:
+            return cached
+
+        disk_key = cls._disk_key(cache_key, semester)
+
+        async def fetch():
+            # 磁盘缓存的读写可能等待其他进程释放 SQLite 写锁，放到默认线程池中执行，不阻塞事件循环
+            loop = asyncio.get_event_loop()
+            resp = await loop.run_in_executor(None, cls.DISK_CACHE.get, disk_key) if disk_key else None
+            if resp is not None:
+                return cls._decode(resp, decode, ok_status, error_message, cache_key, ttl, url)
+            resp = await AsyncHttpRpc.call(method="GET",
+                                           url=url,
+                                           retry=True,
+                                           headers={'X-Auth-Token': cls.REQUEST_TOKEN} if auth else None,
+                                           service=cls.SERVICE,
+                                           prefer_msgpack=cls._prefer_msgpack(cache_key))
+            result = cls._decode(resp, decode, ok_status, error_message, cache_key, ttl, url)
+            if disk_key:  # 构造成功后才写入，无法构造的响应不会在重启后被反复读出
+                await loop.run_in_executor(None, cls.DISK_CACHE.set, disk_key, resp)
+            return result
+
+        if not cls.SINGLE_FLIGHT:
+            return await fetch()
+        return await cls._flights.do(flight_key or ("GET", url), fetch)
+
+    @classmethod
+    async def search_iter(cls, keyword: str, page_size: int = 100, max_pages: int = 100) -> AsyncIterator[Any]:
+        """`everyclass.rpc.entity.Entity.search_iter` 的异步生成器版本"""
+        keyword = keyword.replace("/", "")
+        page_index = 1
+        previous = None
+        next_page = asyncio.ensure_future(cls._search_page(keyword, page_index, page_size))
+        try:
+            while next_page is not None:
+                raw_items = await next_page
+                next_page = None
+                if cls._search_page_repeated(raw_items, previous):
+                    break
+                previous = raw_items
+                if len(raw_items) >= page_size and page_index < max_pages:
+                    page_index += 1
+                    next_page = asyncio.ensure_future(cls._search_page(keyword, page_index, page_size))
+                for item in cls._decode_search_items(raw_items):
+                    yield item
+        finally:
+            if next_page is not None:
+                next_page.cancel()  # 提前结束迭代时取消预取
+
+    @classmethod
+    async def _multi_get(cls, ids: List[str], single: Callable[[str], Any], batch_url: str, batch_field: str,
+                         decode: Callable[[Dict], Any], cache_key: Callable[[str], Tuple],
+                         semester: str = None) -> BatchResult:
+        found: Dict[str, Any] = {}
+        errors: Dict[str, Exception] = {}
+        pending = list(dict.fromkeys(ids))
+
+        if cls._batch_api_enabled():
+            pending = cls._take_cached(pending, cache_key, semester, found)
+            try:
+                for start in range(0, len(pending), cls.BATCH_SIZE):
+                    chunk = pending[start:start + cls.BATCH_SIZE]
+                    resp = await AsyncHttpRpc.call(method="POST",
+                                                   url=batch_url,
+                                                   data={batch_field: chunk},
+                                                   idempotent=True,
+                                                   headers={'X-Auth-Token': cls.REQUEST_TOKEN},
+                                                   service=cls.SERVICE,
+                                                   prefer_msgpack=cls._prefer_msgpack(cache_key(chunk[0])))
+                    cls._decode_batch(resp, decode, cache_key, semester, found, errors)
+                for item_id in pending:
+                    if item_id not in found and item_id not in errors:
+                        errors[item_id] = RpcResourceNotFound(404, f'{item_id} not found')
+                pending = []
+            except RpcResourceNotFound:
+                cls._batch_api_not_found()
+            except RpcException:
+                pass  # 批量接口失败时退回单个查询
+
+        pending = [item_id for item_id in pending if item_id not in found]
+        if pending:
+            semaphore = asyncio.Semaphore(cls.BATCH_CONCURRENCY)
+
+            async def bounded(item_id: str):
+                async with semaphore:
+                    return await single(item_id)
+
+            results = await asyncio.gather(*[bounded(item_id) for item_id in pending], return_exceptions=True)
+            for item_id, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    errors[item_id] = result
+                else:
+                    found[item_id] = result
+                    errors.pop(item_id, None)  # 批量接口返回 404 之前的批次中记录的错误
+
+        return BatchResult(ids=list(ids),
+                           results=[found.get(item_id) for item_id in ids],
+                           errors=errors)
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Dict, Optional, Tuple, Union
+
+import aiohttp
+
+from everyclass.rpc import compression
+from everyclass.rpc.http import CHUNK_SIZE, _CallState
+from everyclass.rpc.retry import RetryPolicy
+
+
+class AsyncHttpRpc:
+    """asyncio counterpart of `HttpRpc`.
+
+    Timeouts, deadlines (including `deadline_scope`), the retry policy and circuit breakers are shared with `HttpRpc`.
+    All upstreams share one `aiohttp.ClientSession` whose connector keeps connections alive.
+    """
+    LIMIT = 1000  # max connections in total
+    LIMIT_PER_HOST = 100  # max connections per upstream host
+    KEEPALIVE_TIMEOUT = 30.0
+
+    _session: Optional[aiohttp.ClientSession] = None
+    _session_loop: Optional[asyncio.AbstractEventLoop] = None  # the loop `_session` was created in
+
+    @classmethod
+    def configure(cls, limit: int = None, limit_per_host: int = None, keepalive_timeout: float = None) -> None:
+        """change connection pool settings. takes effect when the next session is created, see `close`"""
+        if limit is not None:
+            cls.LIMIT = limit
+        if limit_per_host is not None:
+            cls.LIMIT_PER_HOST = limit_per_host
+        if keepalive_timeout is not None:
+            cls.KEEPALIVE_TIMEOUT = keepalive_timeout
+
+    @classmethod
+    def session(cls) -> aiohttp.ClientSession:
+        """the shared session of the running event loop, created on first use"""
+        loop = asyncio.get_running_loop()
+        if cls._session is None or cls._session.closed or cls._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=cls.LIMIT,
+                                             limit_per_host=cls.LIMIT_PER_HOST,
+                                             keepalive_timeout=cls.KEEPALIVE_TIMEOUT)
+            cls._session = aiohttp.ClientSession(connector=connector, auto_decompress=False)  # see `_read_body`
+            cls._session_loop = loop
+        return cls._session
+
+    @classmethod
+    async def close(cls) -> None:
+        """close the shared session and its connections. call it when the event loop shuts down"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+        cls._session_loop = None
+
+    @classmethod
+    def pool_stats(cls) -> Dict[str, int]:
+        """connection pool limits and the number of connections currently in use"""
+        if cls._session is None or cls._session.closed:
+            return {}
+        connector = cls._session.connector
+        return {'limit'         : connector.limit,
+                'limit_per_host': connector.limit_per_host,
+                'in_use'        : len(getattr(connector, '_acquired', ()))}
+
+    @classmethod
+    async def _read_body(cls, response: aiohttp.ClientResponse) -> compression.StreamDecoder:
+        """read the body chunk by chunk and decompress it ourselves, so that the bytes on the wire and the time spent
+        decompressing can be measured"""
+        decoder = compression.StreamDecoder(response.headers.get('Content-Encoding'))
+        try:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                decoder.feed(chunk)
+        except compression.DecompressionError as e:
+            raise aiohttp.ClientPayloadError(f'Failed to decompress response: {e}') from e
+        return decoder
+
+    @classmethod
+    async def call(cls, method: str, url: str, params=None, retry: Optional[bool] = None, data=None, headers=None,
+                   timeout: Union[None, float, Tuple[float, float]] = None, deadline: Optional[float] = None,
+                   idempotent: Optional[bool] = None, retry_policy: Optional[RetryPolicy] = None,
+                   service: Optional[str] = None, endpoint: Optional[str] = None,
+                   prefer_msgpack: bool = False) -> Dict:
+        """call HTTP API. if server returns 4xx or 500 status code, raise exceptions.
+
+        Parameters are the same as `HttpRpc.call`. A cancelled call is recorded with the `cancelled` status, like a
+        killed greenlet in `HttpRpc.call`.
+        """
+        state = _CallState(method, url, params, retry, data,
+                           {k: v for k, v in headers.items() if v is not None} if headers else {}, timeout, deadline,
+                           idempotent, retry_policy, service, endpoint, prefer_msgpack)
+        session = cls.session()
+        try:
+            while True:
+                target_url, remaining = state.next_attempt()
+                attempt_timeout = aiohttp.ClientTimeout(total=remaining,
+                                                        sock_connect=min(state.attempt_timeout.connect, remaining),
+                                                        sock_read=min(state.attempt_timeout.read, remaining))
+                try:
+                    async with session.request(method, target_url, params=state.params, data=state.body,
+                                               headers=state.headers, timeout=attempt_timeout) as api_response:
+                        response_body = await cls._read_body(api_response)
+                except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    state.attempt_failed(e, isinstance(e, asyncio.TimeoutError), target_url)
+                except BaseException:
+                    state.attempt_aborted()
+                    raise
+                else:
+                    if state.attempt_answered(api_response.status, response_body):
+                        return state.finish(api_response.status, api_response.headers.get('Content-Type'),
+                                            response_body)
+                await asyncio.sleep(state.backoff())
+        except asyncio.CancelledError:
+            state.cancelled()
+            raise
+        except Exception as e:
+            state.failed(e)
+            raise
+        finally:
+            state.record()
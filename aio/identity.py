@@ -0,0 +1,21 @@
+"""`everyclass.rpc.identity` 的 asyncio 版本，所有接口方法都需要 await。服务地址沿用 `everyclass.rpc.identity.BASE_URL`"""
+from everyclass.rpc import identity
+from everyclass.rpc.aio.http import AsyncHttpRpc
+
+
+class _AsyncIdentityService:
+    @classmethod
+    async def _call(cls, decode, **kwargs):
+        return decode(await AsyncHttpRpc.call(service='identity', **kwargs))
+
+
+class Login(_AsyncIdentityService, identity.Login):
+    pass
+
+
+class Register(_AsyncIdentityService, identity.Register):
+    pass
+
+
+class UserCentre(_AsyncIdentityService, identity.UserCentre):
+    pass
@@ -0,0 +1,43 @@
+"""
+`everyclass.rpc.singleflight.SingleFlight` 的 asyncio 版本。
+
+事件循环是单线程的，查找与登记之间没有 await，因此同样不需要锁。
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 `await fn()`，如果已有相同 `key` 的调用正在进行，则等待并返回它的结果（或抛出它的异常）"""
+        call = self._calls.get(key)
+        if call is not None:
+            try:
+                return await asyncio.shield(call)
+            except asyncio.CancelledError:
+                if call.cancelled():
+                    return await self.do(key, fn)  # leader 被取消，由当前调用重新发起
+                raise
+
+        call = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._calls.pop(key, None)
+            call.cancel()
+            raise
+        except Exception as e:
+            self._calls.pop(key, None)
+            call.set_exception(e)
+            call.exception()  # 没有等待者时避免 "exception was never retrieved" 警告
+            raise
+        self._calls.pop(key, None)
+        call.set_result(result)
+        return result
+
+    def in_flight(self) -> int:
+        """正在进行的调用数"""
+        return len(self._calls)
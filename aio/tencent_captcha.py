@@ -0,0 +1,31 @@
+from flask import request
+
+from everyclass.rpc import tencent_captcha
+from everyclass.rpc.aio.http import AsyncHttpRpc
+
+
+class TencentCaptcha(tencent_captcha.TencentCaptcha):
+    """`everyclass.rpc.tencent_captcha.TencentCaptcha` 的 asyncio 版本"""
+
+    @classmethod
+    async def _call(cls, decode, **kwargs):
+        return decode(await AsyncHttpRpc.call(service='captcha', **kwargs))
+
+    @classmethod
+    async def verify(cls):
+        if not all(map(request.json.get, ["captcha_ticket", "captcha_rand"])):
+            return False
+        else:
+            return await cls._verify(request.json["captcha_ticket"],
+                                     request.json["captcha_rand"],
+                                     request.json["remote_addr"])
+
+    #  identity 服务上线前这个方法要被 server 调，先留着
+    @classmethod
+    async def verify_old(cls):
+        if not all(map(request.form.get, ["captcha-ticket", "captcha-rand"])):
+            return False
+        else:
+            return await cls._verify(request.form["captcha-ticket"],
+                                     request.form["captcha-rand"],
+                                     request.remote_addr)
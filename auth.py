@@ -1,11 +1,13 @@
 # flake8: noqa
 from dataclasses import dataclass, field
-from typing import Dict
+from typing import Dict, Sequence, Union
 
-from everyclass.rpc import ensure_slots
+from everyclass.rpc import decodable
+from everyclass.rpc.balancer import configure_base_url
 from everyclass.rpc.http import HttpRpc
 
 
+@decodable()
 @dataclass
 class VerifyEmailTokenResult:
     success: bool
@@ -13,9 +15,10 @@ class VerifyEmailTokenResult:
 
     @classmethod
     def make(cls, dct: Dict) -> "VerifyEmailTokenResult":
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct)
 
 
+@decodable()
 @dataclass
 class GetResultResult:
     success: bool
@@ -23,44 +26,51 @@ class GetResultResult:
 
     @classmethod
     def make(cls, dct: Dict) -> "GetResultResult":
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct)
 
 
 class Auth:
     BASE_URL = 'everyclass-auth'
 
     @classmethod
-    def set_base_url(cls, base_url: str) -> None:
-        cls.BASE_URL = base_url
+    def _call(cls, decode=None, **kwargs):
+        """调用 auth 接口，`decode` 不为 None 时用它转换响应"""
+        resp = HttpRpc.call(service='auth', **kwargs)
+        return decode(resp) if decode else resp
+
+    @classmethod
+    def set_base_url(cls, base_url: Union[str, Sequence[str]], **balancer_options) -> None:
+        """设置服务地址，参数同 `Entity.set_base_url`"""
+        cls.BASE_URL = configure_base_url('auth', base_url, **balancer_options)
 
     @classmethod
     def register_by_email(cls, request_id: str, student_id: str):
-        return HttpRpc.call(method='POST',
-                            url=f'{cls.BASE_URL}/register_by_email',
-                            data={'request_id': request_id,
-                                  'student_id': student_id},
-                            retry=True)
+        return cls._call(method='POST',
+                         url=f'{cls.BASE_URL}/register_by_email',
+                         data={'request_id': request_id,
+                               'student_id': student_id},
+                         retry=True)
 
     @classmethod
     def verify_email_token(cls, token: str):
-        resp = HttpRpc.call(method='POST',
-                            url=f'{cls.BASE_URL}/verify_email_token',
-                            data={"email_token": token},
-                            retry=True)
-        return VerifyEmailTokenResult.make(resp)
+        return cls._call(VerifyEmailTokenResult.make,
+                         method='POST',
+                         url=f'{cls.BASE_URL}/verify_email_token',
+                         data={"email_token": token},
+                         retry=True)
 
     @classmethod
     def register_by_password(cls, request_id: str, student_id: str, password: str):
-        return HttpRpc.call(method='POST',
-                            url=f'{cls.BASE_URL}/register_by_password',
-                            data={'request_id': request_id,
-                                  'student_id': student_id,
-                                  'password': password})
+        return cls._call(method='POST',
+                         url=f'{cls.BASE_URL}/register_by_password',
+                         data={'request_id': request_id,
+                               'student_id': student_id,
+                               'password': password})
 
     @classmethod
     def get_result(cls, request_id: str):
-        resp = HttpRpc.call(method='GET',
-                            url=f'{cls.BASE_URL}/get_result',
-                            data={'request_id': request_id},
-                            retry=True)
-        return GetResultResult.make(resp)
+        return cls._call(GetResultResult.make,
+                         method='GET',
+                         url=f'{cls.BASE_URL}/get_result',
+                         data={'request_id': request_id},
+                         retry=True)
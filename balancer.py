@@ -0,0 +1,224 @@
+"""
+客户端负载均衡。
+
+一个上游服务有多个副本时，可以把服务地址配置为副本地址列表，由客户端直接选择副本发出请求，省去经过代理转发的一跳：
+
+```
+Entity.set_base_url(["http://10.0.0.11:8000", "http://10.0.0.12:8000"], strategy="p2c")
+```
+
+此时服务地址被替换为虚拟地址 `balanced://<服务名>`，`HttpRpc` 每次尝试（包括重试和对冲请求）前从负载均衡器中选择一个副本，
+把虚拟地址替换为副本地址。选择策略：
+
+- `round_robin`：轮询
+- `least_outstanding`：选择进行中请求最少的副本
+- `p2c`：随机选两个副本，取进行中请求较少的一个（power of two choices），副本较多时比 `least_outstanding` 更不容易扎堆
+
+副本连续失败（连接错误、超时或 5xx）达到 `eject_after` 次后被摘除一段时间，之后重新参与选择；所有副本都被摘除时仍从全部副本中选择。
+配置了 `resolver` 或 `resolve_dns` 时每隔 `refresh_interval` 秒在后台重新解析副本列表。
+"""
+import itertools
+import random
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+from everyclass.rpc import RpcServerNotAvailable
+from everyclass.rpc.session import base_url_of
+
+SCHEME = 'balanced'
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+POWER_OF_TWO = 'p2c'
+
+
+class Replica:
+    """一个副本的状态"""
+    __slots__ = ('url', 'outstanding', 'failures', 'ejections', 'ejected_until', 'requests', 'errors')
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0  # 进行中的请求数
+        self.failures = 0  # 连续失败次数
+        self.ejections = 0  # 连续被摘除的次数，决定下一次摘除的时长
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def as_dict(self, now: float) -> Dict:
+        return {'outstanding': self.outstanding,
+                'requests'   : self.requests,
+                'errors'     : self.errors,
+                'ejected'    : self.ejected_until > now}
+
+
+class LoadBalancer:
+    """一个上游服务的负载均衡器
+
+    :param name: 服务名，虚拟地址为 `balanced://<name>`
+    :param endpoints: 副本地址列表，如 `["http://10.0.0.11:8000", "http://10.0.0.12:8000"]`
+    :param strategy: 选择策略，`round_robin`、`least_outstanding` 或 `p2c`
+    :param eject_after: 连续失败多少次后摘除副本
+    :param eject_duration: 第一次摘除的时长（秒），摘除结束后没有成功过就再次被摘除时时长翻倍
+    :param max_eject_duration: 摘除时长上限（秒）
+    :param resolver: 返回最新副本地址列表的函数（如查询服务发现），为 None 时使用 `endpoints`
+    :param resolve_dns: 为 True 时把副本地址中的主机名解析为全部 IP，每个 IP 作为一个副本（适用于 HTTP 上游）
+    :param refresh_interval: 重新解析副本列表的间隔（秒），只在配置了 `resolver` 或 `resolve_dns` 时生效
+    """
+
+    def __init__(self, name: str, endpoints: Sequence[str] = (), strategy: str = POWER_OF_TWO, eject_after: int = 3,
+                 eject_duration: float = 10, max_eject_duration: float = 300,
+                 resolver: Callable[[], Sequence[str]] = None, resolve_dns: bool = False,
+                 refresh_interval: float = 30):
+        if strategy not in (ROUND_ROBIN, LEAST_OUTSTANDING, POWER_OF_TWO):
+            raise ValueError(f'Unknown load balancing strategy {strategy}')
+        self.name = name
+        self.base_url = f'{SCHEME}://{name}'
+        self.endpoints = [endpoint.rstrip('/') for endpoint in endpoints]
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_duration = eject_duration
+        self.max_eject_duration = max_eject_duration
+        self.resolver = resolver
+        self.resolve_dns = resolve_dns
+        self.refresh_interval = refresh_interval
+
+        self._replicas: List[Replica] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._next_refresh = float('inf')
+        self.refresh()
+        if resolver is not None or resolve_dns:
+            self._next_refresh = time.monotonic() + refresh_interval
+
+    def _resolve(self) -> List[str]:
+        endpoints = [endpoint.rstrip('/') for endpoint in self.resolver()] if self.resolver else self.endpoints
+        if not self.resolve_dns:
+            return endpoints
+        resolved = []
+        for endpoint in endpoints:
+            parts = urlsplit(endpoint)
+            try:
+                infos = socket.getaddrinfo(parts.hostname, parts.port, type=socket.SOCK_STREAM)
+            except OSError:
+                resolved.append(endpoint)  # 解析失败时保留原地址
+                continue
+            port = f':{parts.port}' if parts.port else ''
+            for address in sorted({info[4][0] for info in infos}):
+                host = f'[{address}]' if ':' in address else address
+                resolved.append(f'{parts.scheme}://{host}{port}{parts.path}')
+        return resolved
+
+    def refresh(self) -> None:
+        """重新解析副本列表。仍然存在的副本保留其状态，解析结果为空时保留原列表"""
+        urls = list(dict.fromkeys(self._resolve()))
+        if not urls:
+            return
+        with self._lock:
+            existing = {replica.url: replica for replica in self._replicas}
+            self._replicas = [existing.get(url) or Replica(url) for url in urls]
+
+    def _maybe_refresh(self, now: float) -> None:
+        """到了刷新时间时在后台线程中刷新（gevent monkey patch 之后为协程），不阻塞当前调用"""
+        if now < self._next_refresh:
+            return
+        with self._lock:
+            if now < self._next_refresh:
+                return
+            self._next_refresh = now + self.refresh_interval
+        threading.Thread(target=self._refresh_quietly, daemon=True).start()
+
+    def _refresh_quietly(self) -> None:
+        from everyclass.rpc import _logger
+        try:
+            self.refresh()
+        except Exception as e:  # 刷新失败时继续使用原列表
+            if _logger:
+                _logger.warning(f'Failed to refresh replicas of {self.name}: {repr(e)}')
+
+    def pick(self) -> Replica:
+        """选择一个副本并把它的进行中请求数加一，请求结束后必须调用 `release`。没有可用的副本（如服务发现返回空列表）时
+        抛出 `RpcServerNotAvailable`"""
+        now = time.monotonic()
+        self._maybe_refresh(now)
+        with self._lock:
+            if not self._replicas:
+                raise RpcServerNotAvailable(f'No replica configured for {self.name}')
+            candidates = [replica for replica in self._replicas if replica.ejected_until <= now] or self._replicas
+            if len(candidates) == 1:
+                replica = candidates[0]
+            elif self.strategy == ROUND_ROBIN:
+                replica = candidates[next(self._counter) % len(candidates)]
+            elif self.strategy == LEAST_OUTSTANDING:
+                offset = next(self._counter) % len(candidates)  # 进行中请求数相同时轮流选择
+                rotated = candidates[offset:] + candidates[:offset]
+                replica = min(rotated, key=lambda r: r.outstanding)
+            else:
+                first, second = random.sample(candidates, 2)
+                replica = first if first.outstanding <= second.outstanding else second
+            replica.outstanding += 1
+            replica.requests += 1
+        return replica
+
+    def release(self, replica: Replica, success: Optional[bool]) -> None:
+        """请求结束。`success` 为 None 表示结果与副本健康无关（如调用被取消）"""
+        with self._lock:
+            replica.outstanding -= 1
+            if success is None:
+                return
+            if success:
+                replica.failures = 0
+                if replica.ejected_until <= time.monotonic():
+                    replica.ejections = 0
+                return
+            replica.errors += 1
+            replica.failures += 1
+            if replica.failures >= self.eject_after:
+                duration = min(self.eject_duration * 2 ** replica.ejections, self.max_eject_duration)
+                replica.ejected_until = time.monotonic() + duration
+                replica.ejections += 1
+                replica.failures = 0
+
+    def resolve(self, url: str, replica: Replica) -> str:
+        """把虚拟地址开头的 URL 替换为副本的地址"""
+        return replica.url + url[len(self.base_url):]
+
+    def stats(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {replica.url: replica.as_dict(now) for replica in self._replicas}
+
+
+class BalancerRegistry:
+    """虚拟地址到负载均衡器的映射"""
+
+    def __init__(self):
+        self._balancers: Dict[str, LoadBalancer] = {}
+
+    def register(self, name: str, endpoints: Sequence[str] = (), **options) -> str:
+        """为服务 `name` 配置副本列表，参数见 `LoadBalancer`，返回用作服务地址的虚拟地址"""
+        balancer = LoadBalancer(name, endpoints, **options)
+        self._balancers[balancer.base_url] = balancer
+        return balancer.base_url
+
+    def get(self, url: str) -> Optional[LoadBalancer]:
+        """URL 以虚拟地址开头时返回对应的负载均衡器，否则返回 None"""
+        if not url.startswith(SCHEME + '://'):
+            return None
+        return self._balancers.get(base_url_of(url))
+
+    def stats(self) -> Dict[str, Dict]:
+        return {balancer.name: balancer.stats() for balancer in list(self._balancers.values())}
+
+
+def configure_base_url(name: str, base_url, **options) -> str:
+    """服务客户端的 `set_base_url` 的实现：`base_url` 为字符串时原样返回，为列表时注册负载均衡器并返回虚拟地址"""
+    if isinstance(base_url, str):
+        return base_url
+    return registry.register(name, base_url, **options)
+
+
+registry = BalancerRegistry()
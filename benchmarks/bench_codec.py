@@ -0,0 +1,38 @@
+"""
+比较标准库 json 与 orjson 解码/编码 entity 响应的速度。
+
+    python benchmarks/bench_codec.py
+"""
+import payloads
+from typing import List
+
+from harness import Result, measure, report
+
+from everyclass.rpc.codec import JsonCodec, OrjsonCodec, orjson
+
+
+def benchmarks() -> List[Result]:
+    codecs = [JsonCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    else:
+        print('orjson is not installed, only benchmarking stdlib json')
+
+    results = []
+    for payload_name, payload in [('student_timetable(40 cards)', payloads.student_timetable()),
+                                  ('card(300 students)', payloads.card()),
+                                  ('search(500 hits)', payloads.search())]:
+        raw = JsonCodec().dumps(payload)
+        for codec in codecs:
+            results.append(measure(f'loads {payload_name} [{codec.name}]', lambda c=codec: c.loads(raw)))
+        for codec in codecs:
+            results.append(measure(f'dumps {payload_name} [{codec.name}]', lambda c=codec: c.dumps(payload)))
+    return results
+
+
+def main():
+    report(benchmarks())
+
+
+if __name__ == '__main__':
+    main()
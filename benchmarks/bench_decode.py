@@ -0,0 +1,106 @@
+"""
+比较 `make()` 改用预先计算的 `Decoder` 前后的解码速度。
+
+“before” 是改动前的实现：逐个 `dct.pop` 改名，再由 `ensure_slots` 每次重新计算字段列表并线性查找。两种实现的结果会先比较，
+确保输出一致。
+
+    python benchmarks/bench_decode.py
+"""
+from dataclasses import fields
+from typing import Dict, List
+
+import payloads
+from harness import Result, measure, report
+
+from everyclass.rpc import entity
+from everyclass.rpc.entity import (CardItem, CardResult, CardResultStudentItem, CardResultTeacherItem,
+                                   StudentTimetableResult, TeacherItem, encoded_id, weeks_to_string)
+
+
+def _ensure_slots(cls, dct: Dict):
+    _names = [x.name for x in fields(cls)]
+    _del = []
+    for key in dct:
+        if key not in _names:
+            _del.append(key)
+    for key in _del:
+        del dct[key]
+        from everyclass.rpc import _logger
+        _logger.warn(
+            "Unexpected field `{}` is removed when converting dict to dataclass `{}`".format(key, cls.__name__))
+    return dct
+
+
+def _teacher_item(dct: Dict) -> TeacherItem:
+    dct['teacher_id'] = dct.pop("teacher_code")
+    dct['teacher_id_encoded'] = encoded_id('teacher', dct['teacher_id'])
+    return TeacherItem(**_ensure_slots(TeacherItem, dct))
+
+
+def _card_item(dct: Dict) -> CardItem:
+    dct["teachers"] = [_teacher_item(x) for x in dct.pop("teacher_list")]
+    dct['room_id'] = dct.pop('room_code')
+    dct['card_id'] = dct.pop('card_code')
+    dct['weeks'] = dct.pop('week_list')
+    dct['week_string'] = weeks_to_string(dct['weeks'])
+    dct['room_id_encoded'] = encoded_id('room', dct['room_id'])
+    dct['card_id_encoded'] = encoded_id('klass', dct['card_id'])
+    dct['course_id'] = dct.pop('course_code')
+    return CardItem(**_ensure_slots(CardItem, dct))
+
+
+def _student_timetable(dct: Dict) -> StudentTimetableResult:
+    del dct["status"]
+    dct["cards"] = [_card_item(x) for x in dct.pop("card_list")]
+    dct["semesters"] = dct.pop("semester_list")
+    dct["student_id"] = dct.pop("student_code")
+    dct["student_id_encoded"] = encoded_id("student", dct["student_id"])
+    dct["klass"] = dct.pop("class")
+    return StudentTimetableResult(**_ensure_slots(StudentTimetableResult, dct))
+
+
+def _card_teacher(dct: Dict) -> CardResultTeacherItem:
+    dct['teacher_id'] = dct.pop('teacher_code')
+    dct['teacher_id_encoded'] = encoded_id('teacher', dct['teacher_id'])
+    return CardResultTeacherItem(**_ensure_slots(CardResultTeacherItem, dct))
+
+
+def _card_student(dct: Dict) -> CardResultStudentItem:
+    dct["klass"] = dct.pop("class")
+    dct["student_id"] = dct.pop("student_code")
+    dct["student_id_encoded"] = encoded_id("student", dct["student_id"])
+    return CardResultStudentItem(**_ensure_slots(CardResultStudentItem, dct))
+
+
+def _card(dct: Dict) -> CardResult:
+    del dct["status"]
+    dct["teachers"] = [_card_teacher(x) for x in dct.pop("teacher_list")]
+    dct["students"] = [_card_student(x) for x in dct.pop("student_list")]
+    dct['card_id'] = dct.pop('card_code')
+    dct["card_id_encoded"] = encoded_id("klass", dct["card_id"])
+    dct['room_id'] = dct.pop('room_code')
+    dct['room_id_encoded'] = encoded_id("room", dct["room_id"])
+    dct['weeks'] = dct.pop("week_list")
+    dct['week_string'] = weeks_to_string(dct['weeks'])
+    dct['course_id'] = dct.pop('course_code')
+    return CardResult(**_ensure_slots(CardResult, dct))
+
+
+def benchmarks() -> List[Result]:
+    cases = [('StudentTimetableResult(40 cards)', _student_timetable, entity.StudentTimetableResult.make,
+              payloads.student_timetable),
+             ('CardResult(300 students)', _card, entity.CardResult.make, payloads.card)]
+    results = []
+    for name, before, after, factory in cases:
+        assert before(factory()) == after(factory()), f'{name}: decoded results differ'
+        results.append(measure(f'{name} [before]', before, setup=factory))
+        results.append(measure(f'{name} [after]', after, setup=factory))
+    return results
+
+
+def main():
+    report(benchmarks())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+entity 解码热点的基准：各结果类型的 `make()`、`ensure_slots` 和资源 ID 加密（有无缓存）。
+
+    python benchmarks/bench_entity.py
+"""
+import hashlib
+from typing import List
+
+import payloads
+from harness import Result, measure, report
+
+from everyclass import rpc
+from everyclass.rpc import ensure_slots, entity
+
+
+def _encrypt(resource_type: str, resource_id: str) -> str:
+    """模拟真实加密函数的开销（一次 HMAC 级别的哈希）"""
+    return hashlib.sha256(f'{resource_type}:{resource_id}'.encode()).hexdigest()[:24]
+
+
+def _search_first_screen(dct):
+    result = entity.LazySearchResult.make(dct)
+    return result.students[:20], result.teachers[:20], result.classrooms[:20]
+
+
+def benchmarks() -> List[Result]:
+    results = []
+    for name, make, factory in [('StudentTimetableResult.make(40 cards)', entity.StudentTimetableResult.make,
+                                 payloads.student_timetable),
+                                ('ClassroomTimetableResult.make(30 cards)', entity.ClassroomTimetableResult.make,
+                                 payloads.classroom_timetable),
+                                ('CardResult.make(300 students)', entity.CardResult.make, payloads.card),
+                                ('SearchResult.make(500 hits)', entity.SearchResult.make, payloads.search),
+                                ('LazySearchResult.make(500 hits)', entity.LazySearchResult.make, payloads.search),
+                                ('LazySearchResult.make(500 hits) + first 20', _search_first_screen,
+                                 payloads.search)]:
+        results.append(measure(name, make, setup=factory))
+
+    student = payloads.card()['student_list'][0]
+    results.append(measure('ensure_slots(CardResultStudentItem)',
+                           lambda dct: ensure_slots(entity.CardResultStudentItem, dct),
+                           setup=lambda: dict(student, student_id=student['student_code'], extra=None)))
+
+    student_ids = [x['student_code'] for x in payloads.card()['student_list']]
+    previous = rpc._resource_id_encrypt
+    rpc._resource_id_encrypt = _encrypt
+    try:
+        def encrypt_all():
+            for student_id in student_ids:
+                entity.encrypt('student', student_id)
+
+        entity.set_encrypt_cache_size(0)
+        results.append(measure('encrypt x300 (no cache)', encrypt_all))
+        entity.set_encrypt_cache_size(65536)
+        results.append(measure('encrypt x300 (cached)', encrypt_all))
+    finally:
+        rpc._resource_id_encrypt = previous
+    return results
+
+
+def main():
+    report(benchmarks())
+
+
+if __name__ == '__main__':
+    main()
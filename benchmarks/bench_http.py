@@ -0,0 +1,82 @@
+"""
+`HttpRpc.call` 相对直接使用 requests 的额外开销，以及 `Entity` 调用的端到端耗时。上游是本进程内启动的 HTTP 桩服务，
+返回预先编码好的响应，不依赖网络。
+
+    python benchmarks/bench_http.py
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import payloads
+import requests
+from harness import Result, measure, report
+
+from everyclass.rpc.codec import get_codec
+from everyclass.rpc.entity import Entity
+from everyclass.rpc.http import HttpRpc
+
+
+def _responses() -> Dict[str, bytes]:
+    codec = get_codec()
+    return {'/ping'                                               : codec.dumps({'status': 'OK'}),
+            f'/student/3901160407/timetable/{payloads.SEMESTER}': codec.dumps(payloads.student_timetable()),
+            f'/lesson/1234567890/timetable/{payloads.SEMESTER}' : codec.dumps(payloads.card())}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 保持长连接，与真实上游一致
+    disable_nagle_algorithm = True  # 否则头部和正文分两次发送时会被延迟确认拖慢约 40ms
+    responses: Dict[str, bytes] = {}
+
+    def do_GET(self):
+        body = self.responses.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    """在后台线程启动桩服务，返回的 server 的 `server_address` 为实际监听的地址"""
+    _StubHandler.responses = _responses()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmarks() -> List[Result]:
+    server = start_stub_server()
+    base_url = 'http://{}:{}'.format(*server.server_address)
+    previous_base_url = Entity.BASE_URL
+    Entity.BASE_URL = base_url
+    session = requests.Session()
+    try:
+        return [measure('requests.get /ping (baseline)', lambda: session.get(f'{base_url}/ping').json()),
+                measure('HttpRpc.call /ping', lambda: HttpRpc.call('GET', f'{base_url}/ping')),
+                measure('HttpRpc.call student timetable',
+                        lambda: HttpRpc.call('GET', f'{base_url}/student/3901160407/timetable/{payloads.SEMESTER}')),
+                measure('Entity.get_student_timetable',
+                        lambda: Entity.get_student_timetable('3901160407', payloads.SEMESTER)),
+                measure('Entity.get_card', lambda: Entity.get_card(payloads.SEMESTER, '1234567890'))]
+    finally:
+        Entity.BASE_URL = previous_base_url
+        session.close()
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    report(benchmarks())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+比较 entity 结果类型使用 `__slots__` 前后每个对象占用的内存，以及解码一个完整响应后的内存占用。
+
+    python benchmarks/bench_memory.py
+"""
+import gc
+import tracemalloc
+from dataclasses import fields, make_dataclass
+
+import payloads
+
+from everyclass.rpc import entity
+
+RESULT_TYPES = [entity.SearchResultStudentItem, entity.SearchResultTeacherItem, entity.SearchResultClassroomItem,
+                entity.TeacherItem, entity.CardItem, entity.CardResultTeacherItem, entity.CardResultStudentItem,
+                entity.StudentResult, entity.StudentTimetableResult, entity.TeacherResult,
+                entity.TeacherTimetableResult, entity.ClassroomTimetableResult, entity.CardResult]
+N = 10000
+
+
+def _without_slots(cls):
+    """与 `cls` 字段相同、但没有 `__slots__` 的普通 dataclass"""
+    return make_dataclass(cls.__name__, [(f.name, f.type) for f in fields(cls)])
+
+
+def _bytes_per_object(cls) -> float:
+    values = {f.name: f.name for f in fields(cls)}  # 所有实例共享同一组值，只统计对象本身的开销
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [cls(**values) for _ in range(N)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / N
+
+
+def _decoded_bytes(make, payload_factory) -> int:
+    payload = payload_factory()
+    gc.collect()
+    tracemalloc.start()
+    result = make(payload)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    print('{:<32} {:>12} {:>12} {:>8}'.format('type', 'dict(B/obj)', 'slots(B/obj)', 'saved'))
+    for cls in RESULT_TYPES:
+        plain = _bytes_per_object(_without_slots(cls))
+        slotted = _bytes_per_object(cls)
+        print('{:<32} {:>12.1f} {:>12.1f} {:>7.0%}'.format(cls.__name__, plain, slotted, 1 - slotted / plain))
+
+    print()
+    print('{:<32} {:>12}'.format('decoded response', 'bytes'))
+    for name, make, factory in [('StudentTimetableResult(40)', entity.StudentTimetableResult.make,
+                                 payloads.student_timetable),
+                                ('CardResult(300)', entity.CardResult.make, payloads.card),
+                                ('SearchResult(500)', entity.SearchResult.make, payloads.search)]:
+        print('{:<32} {:>12}'.format(name, _decoded_bytes(make, factory)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+空闲教室查询：本地索引（节次位图按位与）与逐个检查教室课表中 card 的对比，教室课表取自生成的数据。
+
+    python benchmarks/bench_room_index.py
+"""
+import random
+from typing import List
+
+import payloads
+from harness import Result, measure, report
+
+from everyclass.rpc.entity import ClassroomTimetableResult
+from everyclass.rpc.room_index import RoomIndex, occupancy_of
+
+SEMESTER = '2018-2019-1'
+
+
+def _timetables(rooms: int) -> List[ClassroomTimetableResult]:
+    """每个教室随机取生成课表中的一部分 card"""
+    cards = payloads.classroom_timetable()['card_list']
+    timetables = []
+    for i in range(rooms):
+        dct = dict(payloads.classroom_timetable(), room_code=f'{i:07d}')
+        dct['card_list'] = random.Random(i).sample(cards, len(cards) // 2)
+        timetables.append(ClassroomTimetableResult.make(dct))
+    return timetables
+
+
+def _scan(timetables: List[ClassroomTimetableResult], week: int, day: int, start: int, end: int) -> List[str]:
+    available = []
+    for timetable in timetables:
+        for card in timetable.cards:
+            lesson = card.lesson
+            if week in card.weeks and int(lesson[0]) == day and int(lesson[1:3]) <= end and int(lesson[3:5]) >= start:
+                break
+        else:
+            available.append(timetable.room_id)
+    return available
+
+
+def benchmarks() -> List[Result]:
+    timetables = _timetables(60)
+    index = RoomIndex(semester=SEMESTER)
+    index._campuses = {'校本部': {'第一教学楼': {timetable.room_id: occupancy_of(timetable.cards)
+                                         for timetable in timetables}}}
+    index.semester = SEMESTER
+    index.ready = True
+    assert index.available_rooms(8, '10506', '校本部', '第一教学楼') == _scan(timetables, 8, 1, 5, 6)
+
+    return [measure('available rooms, 60 rooms [scan cards]', lambda: _scan(timetables, 8, 1, 5, 6)),
+            measure('available rooms, 60 rooms [RoomIndex]',
+                    lambda: index.available_rooms(8, '10506', '校本部', '第一教学楼'))]
+
+
+if __name__ == '__main__':
+    report(benchmarks())
@@ -0,0 +1,58 @@
+"""
+weeks_to_string 与 WeekSet 的微基准，周次分布取自生成的课表数据（与真实学期中常见的周次组合一致）。
+
+    python benchmarks/bench_weeks.py
+"""
+import payloads
+from typing import List
+
+from harness import Result, measure, report
+
+from everyclass.rpc.entity import WeekSet, _weeks_to_string, weeks_to_string
+
+
+def benchmarks() -> List[Result]:
+    timetable = payloads.student_timetable()
+    week_lists = [card['week_list'] for card in timetable['card_list']]
+    week_lists += [card['week_list'] for card in payloads.classroom_timetable()['card_list']]
+    week_sets = [WeekSet.from_weeks(weeks) for weeks in week_lists]
+    print(f'{len(week_lists)} week lists, {len(set(map(tuple, week_lists)))} distinct')
+
+    def render_uncached():
+        for weeks in week_lists:
+            _weeks_to_string(weeks)
+
+    def render_cached():
+        for weeks in week_lists:
+            weeks_to_string(weeks)
+
+    def contains_list():
+        for weeks in week_lists:
+            8 in weeks
+
+    def contains_week_set():
+        for weeks in week_sets:
+            8 in weeks
+
+    def overlap_list():
+        for weeks in week_lists:
+            bool(set(weeks) & set(week_lists[0]))
+
+    def overlap_week_set():
+        for weeks in week_sets:
+            weeks.intersects(week_sets[0])
+
+    return [measure('weeks_to_string (uncached)', render_uncached),
+            measure('weeks_to_string (bitmask memoized)', render_cached),
+            measure('membership (list)', contains_list),
+            measure('membership (WeekSet)', contains_week_set),
+            measure('overlap (set of list)', overlap_list),
+            measure('overlap (WeekSet)', overlap_week_set)]
+
+
+def main():
+    report(benchmarks())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+比较 JSON（标准库 json 与 orjson）与 MessagePack 作为课表和 card 接口响应格式时的体积和解码速度（仅解码，以及解码后构造
+结果对象）。
+
+    python benchmarks/bench_wire.py
+"""
+import gzip
+from typing import List
+
+import payloads
+from harness import Result, measure, report
+
+from everyclass.rpc import entity
+from everyclass.rpc.codec import JsonCodec, MsgpackCodec, OrjsonCodec, msgpack, orjson
+
+
+def _cases():
+    return [('student_timetable(40 cards)', payloads.student_timetable(), entity.StudentTimetableResult.make),
+            ('classroom_timetable(30 cards)', payloads.classroom_timetable(), entity.ClassroomTimetableResult.make),
+            ('card(300 students)', payloads.card(), entity.CardResult.make)]
+
+
+def _codecs():
+    codecs = [JsonCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    if msgpack is not None:
+        codecs.append(MsgpackCodec())
+    return codecs
+
+
+def sizes() -> None:
+    """输出各格式的响应体积（字节），括号内为 gzip 之后的体积。json 与 orjson 的输出相同，只列出一个"""
+    codecs = [codec for codec in _codecs() if codec.name != 'orjson']
+    print('{:<32}'.format('payload') + ''.join('{:>24}'.format(codec.name) for codec in codecs))
+    for name, payload, _ in _cases():
+        cells = []
+        for codec in codecs:
+            raw = codec.dumps(payload)
+            cells.append('{:>24}'.format(f'{len(raw)} ({len(gzip.compress(raw))})'))
+        print('{:<32}'.format(name) + ''.join(cells))
+
+
+def benchmarks() -> List[Result]:
+    codecs = _codecs()
+    if msgpack is None:
+        print('msgpack is not installed, only benchmarking JSON')
+
+    results = []
+    for name, payload, make in _cases():
+        for codec in codecs:
+            raw = codec.dumps(payload)
+            results.append(measure(f'loads {name} [{codec.name}]', lambda c=codec, r=raw: c.loads(r)))
+            results.append(measure(f'loads+make {name} [{codec.name}]',
+                                   lambda c=codec, r=raw, m=make: m(c.loads(r))))
+    return results
+
+
+def main():
+    sizes()
+    print()
+    report(benchmarks())
+
+
+if __name__ == '__main__':
+    main()
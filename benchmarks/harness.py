@@ -0,0 +1,94 @@
+"""
+基准测试的计时工具。每个用例重复执行直到累计耗时超过 `min_time`，报告吞吐量、单次耗时分位数和单次执行的内存峰值。
+
+结果可以保存为 JSON（`save`），之后与保存的基线比较（`compare`）以发现性能回退。
+"""
+import gc
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+
+class Result(NamedTuple):
+    name: str
+    runs: int
+    ops_per_sec: float
+    p50_us: float
+    p95_us: float
+    p99_us: float
+    peak_kib: float
+
+
+def _percentile(sorted_samples: List[float], pct: float) -> float:
+    index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def _peak_bytes(fn: Callable[[], object], setup: Optional[Callable[[], object]]) -> int:
+    """单次执行 `fn` 期间新分配内存的峰值"""
+    if tracemalloc.is_tracing():
+        return 0
+    arg = setup() if setup else None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(arg) if setup else fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(name: str, fn: Callable[[], object], setup: Optional[Callable[[], object]] = None,
+            min_time: float = 0.5, warmup: int = 3) -> Result:
+    """测量 `fn(setup())` 的耗时（`setup` 为 None 时测量 `fn()`），`setup` 的耗时不计入结果"""
+    for _ in range(warmup):
+        fn(setup()) if setup else fn()
+    samples = []
+    total = 0.0
+    while total < min_time:
+        arg = setup() if setup else None
+        started = time.perf_counter()
+        fn(arg) if setup else fn()
+        elapsed = time.perf_counter() - started
+        samples.append(elapsed)
+        total += elapsed
+    samples.sort()
+    peak = _peak_bytes(fn, setup)
+    return Result(name=name,
+                  runs=len(samples),
+                  ops_per_sec=len(samples) / total,
+                  p50_us=_percentile(samples, 50) * 1e6,
+                  p95_us=_percentile(samples, 95) * 1e6,
+                  p99_us=_percentile(samples, 99) * 1e6,
+                  peak_kib=peak / 1024)
+
+
+def report(results: List[Result]) -> None:
+    print('{:<48} {:>8} {:>12} {:>10} {:>10} {:>10} {:>10}'.format('benchmark', 'runs', 'ops/s', 'p50(us)', 'p95(us)',
+                                                                   'p99(us)', 'peak(KiB)'))
+    for r in results:
+        print('{:<48} {:>8} {:>12.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            r.name, r.runs, r.ops_per_sec, r.p50_us, r.p95_us, r.p99_us, r.peak_kib))
+
+
+def save(results: List[Result], path: str) -> None:
+    """保存结果为 JSON，作为之后比较的基线"""
+    with open(path, 'w') as f:
+        json.dump({r.name: r._asdict() for r in results}, f, indent=2, ensure_ascii=False)
+
+
+def compare(results: List[Result], baseline_path: str, tolerance: float = 0.2) -> List[str]:
+    """与基线比较，返回吞吐量下降或内存峰值上升超过 `tolerance`（比例）的用例说明。基线中没有的用例会被忽略"""
+    with open(baseline_path) as f:
+        baseline: Dict[str, Dict] = json.load(f)
+    regressions = []
+    for r in results:
+        base = baseline.get(r.name)
+        if base is None:
+            continue
+        if r.ops_per_sec < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{r.name}: {r.ops_per_sec:.1f} ops/s, baseline {base['ops_per_sec']:.1f} ops/s")
+        if base['peak_kib'] and r.peak_kib > base['peak_kib'] * (1 + tolerance):
+            regressions.append(f"{r.name}: peak {r.peak_kib:.1f} KiB, baseline {base['peak_kib']:.1f} KiB")
+    return regressions
@@ -0,0 +1,147 @@
+"""
+按真实数据规模生成的 entity 响应（解码前的 dict），供基准测试使用。生成结果是确定的（固定随机种子）。
+
+- `student_timetable()`：40 个 card 的学生课表
+- `card()`：300 名学生的 card
+- `search()`：500 条结果的搜索
+"""
+import copy
+import random
+from typing import Dict, List
+
+SEMESTER = '2018-2019-1'
+SEMESTERS = ['2016-2017-1', '2016-2017-2', '2017-2018-1', '2017-2018-2', '2018-2019-1']
+
+# 常见的周次分布：全周、前/后半学期、单双周、零散周次
+WEEK_PATTERNS: List[List[int]] = [
+    list(range(1, 17)),
+    list(range(1, 9)),
+    list(range(9, 17)),
+    list(range(1, 18, 2)),
+    list(range(2, 17, 2)),
+    list(range(1, 13)),
+    [1, 2, 3, 5, 6, 7, 9, 10],
+    [4, 8, 12, 16],
+    list(range(3, 19)),
+    [1, 3, 5, 6, 7, 8, 10, 12],
+]
+
+
+def _rng(seed: int) -> random.Random:
+    return random.Random(seed)
+
+
+def _name(rng: random.Random) -> str:
+    return rng.choice('赵钱孙李周吴郑王冯陈') + ''.join(rng.choice('伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀英') for _ in range(2))
+
+
+def _teacher(rng: random.Random) -> Dict:
+    return {'teacher_code': '{:06d}'.format(rng.randrange(10 ** 6)),
+            'name'        : _name(rng),
+            'title'       : rng.choice(['教授', '副教授', '讲师', '']),
+            'unit'        : rng.choice(['计算机学院', '数学与统计学院', '外国语学院', '物理与电子学院'])}
+
+
+def _card(rng: random.Random) -> Dict:
+    day = rng.randrange(1, 8)
+    start = rng.choice([1, 3, 5, 7, 9])
+    return {'name'        : rng.choice(['高等数学', '大学英语', '数据结构', '线性代数', '大学物理', '概率论']) + rng.choice('ABCD'),
+            'card_code'   : '{:020d}'.format(rng.randrange(10 ** 20)),
+            'course_code' : '{:08d}'.format(rng.randrange(10 ** 8)),
+            'room'        : '{}-{}'.format(rng.choice(['A', 'B', 'C']), rng.randrange(101, 530)),
+            'room_code'   : '{:07d}'.format(rng.randrange(10 ** 7)),
+            'week_list'   : list(rng.choice(WEEK_PATTERNS)),
+            'lesson'      : '{}{:02d}{:02d}'.format(day, start, start + 1),
+            'teacher_list': [_teacher(rng) for _ in range(rng.choice([1, 1, 1, 2, 3]))]}
+
+
+def _student(rng: random.Random, code_key: str = 'student_code') -> Dict:
+    return {code_key : '39{:08d}'.format(rng.randrange(10 ** 8)),
+            'name'   : _name(rng),
+            'class'  : '计科{}{:02d}'.format(rng.choice(['16', '17', '18']), rng.randrange(1, 10)),
+            'deputy' : rng.choice(['计算机学院', '数学与统计学院', '外国语学院', '物理与电子学院'])}
+
+
+_cache: Dict[str, Dict] = {}
+
+
+def _cached(key: str, build) -> Dict:
+    # 每次返回深拷贝，因为 make() 会修改传入的 dict
+    if key not in _cache:
+        _cache[key] = build()
+    return copy.deepcopy(_cache[key])
+
+
+def student_timetable(cards: int = 40) -> Dict:
+    """学生课表（`/student/{id}/timetable/{semester}`）"""
+
+    def build():
+        rng = _rng(1)
+        dct = _student(rng)
+        dct.update({'status'       : 'success',
+                    'campus'       : '校本部',
+                    'semester'     : SEMESTER,
+                    'semester_list': list(SEMESTERS),
+                    'remark'       : '',
+                    'card_list'    : [_card(rng) for _ in range(cards)]})
+        return dct
+
+    return _cached(f'student_timetable/{cards}', build)
+
+
+def card(students: int = 300) -> Dict:
+    """card（`/lesson/{id}/timetable/{semester}`）"""
+
+    def build():
+        rng = _rng(2)
+        dct = _card(rng)
+        dct.update({'status'      : 'success',
+                    'semester'    : SEMESTER,
+                    'student_list': [_student(rng) for _ in range(students)]})
+        return dct
+
+    return _cached(f'card/{students}', build)
+
+
+def classroom_timetable(cards: int = 30) -> Dict:
+    """教室课表（`/room/{id}/timetable/{semester}`）"""
+
+    def build():
+        rng = _rng(3)
+        return {'status'       : 'success',
+                'room_code'    : '0000123',
+                'name'         : 'A-101',
+                'building'     : '第一教学楼',
+                'campus'       : '校本部',
+                'type'         : '多媒体教室',
+                'semester'     : SEMESTER,
+                'semester_list': list(SEMESTERS),
+                'card_list'    : [_card(rng) for _ in range(cards)]}
+
+    return _cached(f'classroom_timetable/{cards}', build)
+
+
+def search(hits: int = 500) -> Dict:
+    """搜索结果（`/search/query`），学生、老师、教室约为 8:1:1"""
+
+    def build():
+        rng = _rng(4)
+        data = []
+        for i in range(hits):
+            group = 'student' if i % 10 < 8 else ('teacher' if i % 10 == 8 else 'room')
+            if group == 'student':
+                item = _student(rng, code_key='code')
+            elif group == 'teacher':
+                item = _teacher(rng)
+                item['code'] = item.pop('teacher_code')
+            else:
+                item = {'code'    : '{:07d}'.format(rng.randrange(10 ** 7)),
+                        'name'    : 'A-{}'.format(rng.randrange(101, 530)),
+                        'campus'  : '校本部',
+                        'building': '第一教学楼'}
+            item['group'] = group
+            item['semester_list'] = rng.sample(SEMESTERS, rng.randrange(1, len(SEMESTERS) + 1))
+            data.append(item)
+        return {'status': 'OK', 'data': data}
+
+    return _cached(f'search/{hits}', build)
@@ -0,0 +1,47 @@
+"""
+运行全部基准测试，可选保存结果或与基线比较。与基线比较时有用例回退超过容忍度则以非零状态退出，可以放在 CI 中使用。
+
+    python benchmarks/run_all.py                              # 运行并输出结果
+    python benchmarks/run_all.py --save baseline.json         # 保存为基线
+    python benchmarks/run_all.py --compare baseline.json      # 与基线比较（默认容忍 20%）
+    python benchmarks/run_all.py --only entity,http           # 只运行部分脚本
+"""
+import argparse
+import importlib
+import sys
+
+from harness import compare, report, save
+
+SUITES = ['codec', 'decode', 'entity', 'weeks', 'wire', 'room_index', 'http']
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='everyclass.rpc benchmarks')
+    parser.add_argument('--only', help='comma separated suites, choices: ' + ','.join(SUITES))
+    parser.add_argument('--save', metavar='PATH', help='save results as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='compare with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression ratio (default 0.2)')
+    args = parser.parse_args()
+
+    suites = args.only.split(',') if args.only else SUITES
+    results = []
+    for suite in suites:
+        if suite not in SUITES:
+            parser.error(f'unknown suite {suite}')
+        results.extend(importlib.import_module(f'bench_{suite}').benchmarks())
+    report(results)
+
+    if args.save:
+        save(results, args.save)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print('\nRegressions:')
+            for line in regressions:
+                print('  ' + line)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
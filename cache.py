@@ -0,0 +1,115 @@
+"""
+进程内 TTL + LRU 缓存，用于缓存已解码的 RPC 结果。
+
+缓存同时受条目数和字节数限制（字节数为估算值），超出时按最近最少使用的顺序淘汰。键为元组，第一个元素作为命中率统计的分组名
+（如 `("student_timetable", "3901160407", "2018-2019-1")` 统计在 `student_timetable` 下）。
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+MISSING = object()
+
+
+def approx_size(obj: Any) -> int:
+    """粗略估算 JSON 解码结果（dict/list/str/数字）占用的字节数"""
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(approx_size(x) for x in obj)
+    return sys.getsizeof(obj)
+
+
+class _Stats:
+    __slots__ = ('hits', 'misses', 'evictions', 'expirations', 'invalidations')
+
+    def __init__(self):
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class TTLCache:
+    """带过期时间的 LRU 缓存
+
+    :param max_entries: 最多缓存的条目数
+    :param max_bytes: 最多缓存的字节数（估算值）
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()  # key -> (值, 过期时间, 字节数)
+        self._bytes = 0
+        self._stats: Dict[str, _Stats] = {}
+        self._lock = threading.Lock()
+
+    def _stats_of(self, key: Hashable) -> _Stats:
+        group = key[0] if isinstance(key, tuple) and key else ''
+        stats = self._stats.get(group)
+        if stats is None:
+            stats = self._stats[group] = _Stats()
+        return stats
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """读取缓存，不存在或已过期时返回 `default`"""
+        with self._lock:
+            stats = self._stats_of(key)
+            item = self._data.get(key)
+            if item is None:
+                stats.misses += 1
+                return default
+            if item[1] <= time.monotonic():
+                self._remove(key)
+                stats.expirations += 1
+                stats.misses += 1
+                return default
+            self._data.move_to_end(key)
+            stats.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float, size: int = 0) -> None:
+        """写入缓存
+
+        :param ttl: 过期时间（秒）
+        :param size: 值占用的字节数，用于字节数限制
+        """
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._stats_of(oldest).evictions += 1
+                self._remove(oldest)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool] = None) -> int:
+        """删除满足 `predicate(key)` 的条目，`predicate` 为 None 时清空缓存。返回删除的条目数"""
+        with self._lock:
+            keys = [key for key in self._data if predicate is None or predicate(key)]
+            for key in keys:
+                self._stats_of(key).invalidations += 1
+                self._remove(key)
+            return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """按分组统计的命中、未命中、淘汰、过期和失效次数"""
+        with self._lock:
+            return {group: stats.as_dict() for group, stats in self._stats.items()}
@@ -0,0 +1,193 @@
+"""
+按上游服务（可选按接口）熔断。
+
+熔断器有三种状态：
+
+- closed：正常放行，统计最近一段时间的错误率和慢调用比例，超过阈值后进入 open
+- open：直接拒绝调用（抛出 `RpcServerNotAvailable`），经过 `open_duration` 秒后进入 half-open
+- half-open：放行少量探测请求，全部成功则恢复 closed，任意一个失败则重新 open
+"""
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from everyclass.rpc.session import base_url_of
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """单个上游（或接口）的熔断器
+
+    :param name: 熔断器名称，一般为上游服务地址
+    :param error_rate_threshold: 错误率阈值，达到后熔断
+    :param slow_call_duration: 耗时超过该值（秒）的调用视为慢调用，为 None 时不统计
+    :param slow_call_rate_threshold: 慢调用比例阈值，达到后熔断
+    :param window: 统计窗口长度（秒）
+    :param min_calls: 窗口内调用次数达到该值后才判断是否熔断
+    :param open_duration: 熔断持续时间（秒），之后进入 half-open
+    :param half_open_probes: half-open 状态下放行的探测请求数量
+    """
+    BUCKETS = 10
+
+    def __init__(self, name: str, error_rate_threshold: float = 0.5, slow_call_duration: Optional[float] = None,
+                 slow_call_rate_threshold: float = 0.8, window: float = 10, min_calls: int = 20,
+                 open_duration: float = 5, half_open_probes: int = 3):
+        self.name = name
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window = window
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probes_succeeded = 0
+        # 每个桶为 [桶编号, 调用数, 错误数, 慢调用数]
+        self._buckets: List[List[int]] = [[-1, 0, 0, 0] for _ in range(self.BUCKETS)]
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_duration:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probes_succeeded = 0
+
+    def _bucket(self, now: float) -> List[int]:
+        index = int(now * self.BUCKETS / self.window)
+        bucket = self._buckets[index % self.BUCKETS]
+        if bucket[0] != index:
+            bucket[:] = [index, 0, 0, 0]
+        return bucket
+
+    def _totals(self, now: float):
+        oldest = int(now * self.BUCKETS / self.window) - self.BUCKETS + 1
+        calls = errors = slow = 0
+        for index, b_calls, b_errors, b_slow in self._buckets:
+            if index >= oldest:
+                calls += b_calls
+                errors += b_errors
+                slow += b_slow
+        return calls, errors, slow
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        for bucket in self._buckets:
+            bucket[:] = [-1, 0, 0, 0]
+
+    def allow(self) -> bool:
+        """是否放行本次调用。放行后必须调用 `record` 或 `release`"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes_in_flight + self._probes_succeeded < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def release(self) -> None:
+        """放行的调用没有得到结果（如被调用方取消），不计入统计"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def record(self, success: bool, duration: float) -> None:
+        """记录一次调用结果"""
+        slow = self.slow_call_duration is not None and duration >= self.slow_call_duration
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                if not success or slow:
+                    self._open()
+                else:
+                    self._probes_succeeded += 1
+                    if self._probes_succeeded >= self.half_open_probes:
+                        self._state = CLOSED
+                return
+            if self._state == OPEN:
+                return
+
+            now = time.monotonic()
+            bucket = self._bucket(now)
+            bucket[1] += 1
+            if not success:
+                bucket[2] += 1
+            if slow:
+                bucket[3] += 1
+            calls, errors, slow_calls = self._totals(now)
+            if calls >= self.min_calls and (errors / calls >= self.error_rate_threshold or
+                                            slow_calls / calls >= self.slow_call_rate_threshold):
+                self._open()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._maybe_half_open()
+            calls, errors, slow = self._totals(time.monotonic())
+            return {'state': self._state, 'calls': calls, 'errors': errors, 'slow_calls': slow}
+
+
+class CircuitBreakerRegistry:
+    """上游地址到熔断器的映射
+
+    :param enabled: 是否启用熔断
+    :param per_endpoint: 为 True 时按 `上游地址/一级路径`（如 `http://everyclass-entity/student`）分别熔断
+    :param breaker_options: 传给 `CircuitBreaker` 的参数
+    """
+
+    def __init__(self, enabled: bool = True, per_endpoint: bool = False, **breaker_options):
+        self.enabled = enabled
+        self.per_endpoint = per_endpoint
+        self.breaker_options = breaker_options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool = None, per_endpoint: bool = None, **breaker_options) -> None:
+        """修改配置，已有的熔断器会被丢弃"""
+        if enabled is not None:
+            self.enabled = enabled
+        if per_endpoint is not None:
+            self.per_endpoint = per_endpoint
+        self.breaker_options.update(breaker_options)
+        with self._lock:
+            self._breakers = {}
+
+    def key_of(self, url: str) -> str:
+        base_url = base_url_of(url)
+        if not self.per_endpoint:
+            return base_url
+        path = urlsplit(url).path if '://' in url else '/' + url.split('/', 1)[-1]
+        return base_url + '/' + path.lstrip('/').split('/', 1)[0]
+
+    def get(self, url: str) -> Optional[CircuitBreaker]:
+        """获得 URL 对应的熔断器，未启用熔断时返回 None"""
+        if not self.enabled:
+            return None
+        key = self.key_of(url)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = CircuitBreaker(key, **self.breaker_options)
+                    self._breakers[key] = breaker
+        return breaker
+
+    def stats(self) -> Dict[str, Dict]:
+        return {key: breaker.stats() for key, breaker in list(self._breakers.items())}
+
+
+registry = CircuitBreakerRegistry()
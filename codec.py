@@ -0,0 +1,112 @@
+"""
+RPC 请求和响应体的 JSON 编解码。
+
+默认（`auto`）在安装了 orjson 时使用 orjson，否则使用标准库 json。编解码直接作用于 bytes，避免中间的 str 转换。
+
+安装了 msgpack 时，调用方可以通过 `Accept` 请求头要求上游返回 MessagePack（`MSGPACK_ACCEPT`），响应按 `Content-Type`
+选择解码器（`codec_for`），上游不支持时照常返回 JSON。
+"""
+import dataclasses
+import json
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_CONTENT_TYPES = frozenset({'application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack'})
+MSGPACK_ACCEPT = 'application/msgpack, application/json;q=0.9'  # 优先 MessagePack，不支持时返回 JSON
+
+
+def _default(obj: Any) -> Any:
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
+class JsonCodec:
+    """标准库 json"""
+    name = 'json'
+    content_type = 'application/json'
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson，解码大响应时比标准库快数倍"""
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('orjson is not installed')
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MsgpackCodec:
+    """MessagePack，体积更小，解码不需要解析文本。只用于响应，请求体仍然使用 JSON"""
+    name = 'msgpack'
+    content_type = 'application/msgpack'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError('msgpack is not installed')
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def make_codec(name: str = 'auto') -> JsonCodec:
+    """根据名称创建编解码器：`auto`、`orjson` 或 `json`"""
+    if name == 'auto':
+        return OrjsonCodec() if orjson is not None else JsonCodec()
+    if name == 'orjson':
+        return OrjsonCodec()
+    if name == 'json':
+        return JsonCodec()
+    raise ValueError(f'Unknown JSON codec {name}')
+
+
+codec: JsonCodec = make_codec()
+
+
+def set_codec(new_codec: Union[str, JsonCodec]) -> None:
+    """替换全局编解码器，参数为名称或 `JsonCodec` 实例"""
+    global codec
+    codec = make_codec(new_codec) if isinstance(new_codec, str) else new_codec
+
+
+def get_codec() -> JsonCodec:
+    return codec
+
+
+_msgpack_codec = MsgpackCodec() if msgpack is not None else None
+
+
+def msgpack_available() -> bool:
+    return _msgpack_codec is not None
+
+
+def codec_for(content_type: Optional[str]) -> Union[JsonCodec, MsgpackCodec]:
+    """按响应的 `Content-Type` 选择解码器，不是 MessagePack 时使用全局 JSON 编解码器"""
+    if content_type and _msgpack_codec is not None and \
+            content_type.split(';', 1)[0].strip().lower() in MSGPACK_CONTENT_TYPES:
+        return _msgpack_codec
+    return codec
@@ -0,0 +1,200 @@
+"""
+RPC 请求和响应体的压缩。
+
+通过 `Accept-Encoding` 向上游声明可以接受的压缩格式，按偏好顺序排列。gzip 总是可用；安装了 `brotli`（或 `brotlicffi`）时
+支持 br，安装了 `zstandard` 时支持 zstd。响应体按块流式解压，解压耗时和实际传输的字节数计入调用指标，用于衡量压缩节省的流量
+与消耗的 CPU。
+
+请求体默认不压缩（上游需要支持带 `Content-Encoding` 的请求）。设置 `request_encoding` 后，超过 `request_threshold` 字节的
+请求体会被压缩。
+"""
+import time
+import zlib
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+DEFLATE = 'deflate'
+BROTLI = 'br'
+ZSTD = 'zstd'
+IDENTITY = 'identity'
+
+_UNCHANGED = object()
+
+
+class DecompressionError(ValueError):
+    """响应体无法按 `Content-Encoding` 解压"""
+
+
+class Encoding:
+    """一种压缩格式
+
+    :param name: `Content-Encoding` 中的名称
+    :param compress: `compress(data, level)`，`level` 为 None 时使用该格式的默认级别
+    :param decompressor: 返回流式解压对象的函数，解压对象有 `decompress(chunk)` 方法
+    """
+
+    def __init__(self, name: str, compress: Callable[[bytes, Optional[int]], bytes], decompressor: Callable):
+        self.name = name
+        self.compress = compress
+        self.decompressor = decompressor
+
+
+def _gzip_compress(data: bytes, level: Optional[int]) -> bytes:
+    compressor = zlib.compressobj(level if level is not None else 6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _deflate_compress(data: bytes, level: Optional[int]) -> bytes:
+    return zlib.compress(data, level if level is not None else 6)
+
+
+ENCODINGS: Dict[str, Encoding] = {
+    GZIP   : Encoding(GZIP, _gzip_compress, lambda: zlib.decompressobj(zlib.MAX_WBITS | 16)),
+    DEFLATE: Encoding(DEFLATE, _deflate_compress, lambda: zlib.decompressobj(zlib.MAX_WBITS)),
+}
+
+if brotli is not None:
+    class _BrotliDecompressor:
+        def __init__(self):
+            self._decompressor = brotli.Decompressor()
+
+        def decompress(self, data: bytes) -> bytes:
+            return self._decompressor.process(data)
+
+
+    def _brotli_compress(data: bytes, level: Optional[int]) -> bytes:
+        return brotli.compress(data, quality=level if level is not None else 4)
+
+
+    ENCODINGS[BROTLI] = Encoding(BROTLI, _brotli_compress, _BrotliDecompressor)
+
+if zstandard is not None:
+    def _zstd_compress(data: bytes, level: Optional[int]) -> bytes:
+        return zstandard.ZstdCompressor(level=level if level is not None else 3).compress(data)
+
+
+    ENCODINGS[ZSTD] = Encoding(ZSTD, _zstd_compress, lambda: zstandard.ZstdDecompressor().decompressobj())
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """当前环境支持的压缩格式"""
+    return tuple(ENCODINGS)
+
+
+class StreamDecoder:
+    """按块解压响应体，同时统计实际传输的字节数和解压耗时
+
+    :param content_encoding: 响应的 `Content-Encoding`，可以是逗号分隔的多个格式（按应用顺序）
+    """
+    __slots__ = ('_decompressors', '_chunks', 'wire_bytes', 'seconds')
+
+    def __init__(self, content_encoding: Optional[str]):
+        names = [name.strip().lower() for name in (content_encoding or '').split(',')]
+        self._decompressors = [ENCODINGS[name].decompressor() for name in reversed(names)
+                               if name and name != IDENTITY and name in ENCODINGS]
+        self._chunks = []
+        self.wire_bytes = 0
+        self.seconds = 0.0
+
+    def feed(self, chunk: bytes) -> None:
+        self.wire_bytes += len(chunk)
+        if not self._decompressors:
+            self._chunks.append(chunk)
+            return
+        started = time.monotonic()
+        try:
+            for decompressor in self._decompressors:
+                chunk = decompressor.decompress(chunk)
+        except Exception as e:  # zlib.error、brotli.error、zstandard.ZstdError 等
+            raise DecompressionError(repr(e)) from e
+        self._chunks.append(chunk)
+        self.seconds += time.monotonic() - started
+
+    def finish(self) -> bytes:
+        """返回解压后的完整响应体"""
+        if self._decompressors:
+            started = time.monotonic()
+            tail = b''
+            try:
+                for decompressor in self._decompressors:
+                    if tail:
+                        tail = decompressor.decompress(tail)
+                    flush = getattr(decompressor, 'flush', None)
+                    if flush is not None:
+                        tail += flush()
+            except Exception as e:
+                raise DecompressionError(repr(e)) from e
+            if tail:
+                self._chunks.append(tail)
+            self.seconds += time.monotonic() - started
+        return b''.join(self._chunks)
+
+
+def decode_stream(content_encoding: Optional[str], chunks: Iterable[bytes]) -> StreamDecoder:
+    """读取全部数据块，返回的 `StreamDecoder` 已经读完，调用 `finish()` 取得响应体"""
+    decoder = StreamDecoder(content_encoding)
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder
+
+
+class CompressionSettings:
+    """进程级压缩配置
+
+    :param accept: 按偏好顺序声明可以接受的响应压缩格式，不支持的格式会被忽略；为空时声明 `identity`
+    :param request_encoding: 请求体的压缩格式，为 None 时不压缩请求体
+    :param request_threshold: 请求体超过该字节数时才压缩
+    :param level: 压缩级别，为 None 时使用各格式的默认级别
+    """
+
+    def __init__(self, accept: Sequence[str] = (ZSTD, BROTLI, GZIP), request_encoding: Optional[str] = None,
+                 request_threshold: int = 16 * 1024, level: Optional[int] = None):
+        self.accept: Tuple[str, ...] = ()
+        self.accept_header = IDENTITY
+        self.request_encoding: Optional[str] = None
+        self.request_threshold = request_threshold
+        self.level = level
+        self.configure(accept=accept, request_encoding=request_encoding)
+
+    def configure(self, accept: Sequence[str] = None, request_encoding: Optional[str] = _UNCHANGED,
+                  request_threshold: int = None, level: Optional[int] = None) -> None:
+        """修改配置，`request_encoding` 传入 None 关闭请求体压缩"""
+        if accept is not None:
+            self.accept = tuple(name for name in accept if name in ENCODINGS)
+            self.accept_header = ', '.join(self.accept) or IDENTITY
+        if request_encoding is not _UNCHANGED:
+            if request_encoding is not None and request_encoding not in ENCODINGS:
+                raise ValueError(f'Compression {request_encoding} is not available, '
+                                 f'choices: {", ".join(available_encodings())}')
+            self.request_encoding = request_encoding
+        if request_threshold is not None:
+            self.request_threshold = request_threshold
+        if level is not None:
+            self.level = level
+
+    def compress_body(self, body: bytes) -> Tuple[bytes, Optional[str], float]:
+        """按配置压缩请求体，返回 (请求体, Content-Encoding 或 None, 压缩耗时)。压缩后没有变小时返回原请求体"""
+        if self.request_encoding is None or len(body) <= self.request_threshold:
+            return body, None, 0.0
+        started = time.monotonic()
+        compressed = ENCODINGS[self.request_encoding].compress(body, self.level)
+        seconds = time.monotonic() - started
+        if len(compressed) >= len(body):
+            return body, None, seconds
+        return compressed, self.request_encoding, seconds
+
+
+settings = CompressionSettings()
@@ -0,0 +1,197 @@
+"""
+基于 SQLite 的磁盘缓存，用于缓存不会再变化的往期学期数据（课表、card），在进程重启和部署之后仍然有效。
+
+同一台机器上的多个进程（如 gunicorn 的多个 worker）可以共用同一个文件：数据库使用 WAL 模式，读写互不阻塞，每个进程在第一次
+使用时（即 fork 之后）打开自己的连接。缓存的是上游返回的原始响应（压缩后的 JSON），命中后仍然经过 `make()` 构造结果对象，
+因此资源 ID 加密等配置的变化不会导致缓存内容过期。
+
+在 gevent 进程中（`threading` 已被打补丁），SQLite 调用在 gevent 的线程池中执行，等待其他进程释放写锁时不会阻塞事件循环。
+
+缓存总大小超过 `max_bytes` 时按最近访问时间淘汰。`version` 写入数据库，打开时与配置的版本不同（如上游接口的响应格式变化后
+修改版本号）会清空缓存。
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import gevent
+from gevent import monkey
+
+from everyclass.rpc.codec import JsonCodec
+
+FORMAT_VERSION = 1  # 缓存文件的格式版本，与用户指定的 version 一起组成版本戳
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS entries (
+    endpoint TEXT NOT NULL,
+    resource_id TEXT NOT NULL,
+    semester TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (endpoint, resource_id, semester)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+_KEY_FILTER = 'endpoint = ? AND resource_id = ? AND semester = ?'
+
+
+def _blocking(function: Callable, *args):
+    """执行会阻塞的 SQLite 调用：gevent 进程中放到线程池，否则直接在当前线程执行"""
+    if monkey.is_module_patched('threading'):
+        return gevent.get_hub().threadpool.apply(function, args)
+    return function(*args)
+
+
+class DiskCache:
+    """磁盘缓存
+
+    :param path: SQLite 文件路径，所在目录必须存在
+    :param max_bytes: 缓存内容的总字节数上限（压缩后）
+    :param version: 版本号，与数据库中记录的不同时清空缓存
+    :param touch_interval: 命中时最多每隔这么久（秒）更新一次访问时间，避免每次读取都写数据库
+    :param timeout: 等待其他进程释放写锁的时间（秒），超时后本次读写失败并退回到上游
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024, version: str = '1',
+                 touch_interval: float = 3600, timeout: float = 1):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = f'{FORMAT_VERSION}:{version}'
+        self.touch_interval = touch_interval
+        self.timeout = timeout
+        self._codec = JsonCodec()  # 与全局编解码器无关，保证文件内容在不同配置下都能读取
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._writes_since_check = 0
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'errors': 0}
+        self._lock = threading.Lock()  # 打补丁后为协程锁，持有期间 SQLite 调用在线程池中执行，同一时刻只有一个线程使用连接
+        with self._lock:
+            _blocking(self._connect)
+
+    def _connect(self) -> sqlite3.Connection:
+        """返回当前进程的连接，fork 之后重新打开"""
+        if self._connection is not None and self._pid == os.getpid():
+            return self._connection
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(_SCHEMA)
+        row = connection.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        if row is None or row[0] != self.version:
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                row = connection.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+                if row is None or row[0] != self.version:  # 其他进程可能已经完成了升级
+                    connection.execute('DELETE FROM entries')
+                    connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)",
+                                       (self.version,))
+        self._connection = connection
+        self._pid = os.getpid()
+        return connection
+
+    def _failed(self, action: str, error: Exception) -> None:
+        """磁盘缓存出错时只记录日志，调用退回到上游"""
+        from everyclass.rpc import _logger
+        self._stats['errors'] += 1
+        if _logger:
+            _logger.warning(f'Disk cache {action} failed: {repr(error)}')
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Any]:
+        """读取缓存的响应，不存在时返回 None
+
+        :param key: (接口名, 资源 ID, 学期)，与 `Entity` 的缓存键相同
+        """
+        try:
+            with self._lock:
+                data = _blocking(self._get, key)
+            return None if data is None else self._codec.loads(zlib.decompress(data))
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            self._failed('read', e)
+            return None
+
+    def _get(self, key: Tuple[str, str, str]) -> Optional[bytes]:
+        now = time.time()
+        connection = self._connect()
+        row = connection.execute(f'SELECT value, accessed FROM entries WHERE {_KEY_FILTER}', key).fetchone()
+        if row is None:
+            self._stats['misses'] += 1
+            return None
+        if now - row[1] > self.touch_interval:
+            connection.execute(f'UPDATE entries SET accessed = ? WHERE {_KEY_FILTER}', (now, *key))
+        self._stats['hits'] += 1
+        return row[0]
+
+    def set(self, key: Tuple[str, str, str], value: Any) -> None:
+        """写入响应，超出大小上限时淘汰最久未访问的条目。无法编码的响应（如 MessagePack 响应中的 bytes）不写入"""
+        try:
+            data = zlib.compress(self._codec.dumps(value), 1)
+            if len(data) > self.max_bytes:
+                return
+            with self._lock:
+                _blocking(self._set, key, data)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self._failed('write', e)
+
+    def _set(self, key: Tuple[str, str, str], data: bytes) -> None:
+        connection = self._connect()
+        connection.execute('INSERT OR REPLACE INTO entries (endpoint, resource_id, semester, value, size, accessed) '
+                           'VALUES (?, ?, ?, ?, ?, ?)', (*key, data, len(data), time.time()))
+        self._stats['writes'] += 1
+        self._writes_since_check += 1
+        if self._writes_since_check >= 100 or len(data) * 100 > self.max_bytes:
+            self._writes_since_check = 0
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        """总大小超出上限时按访问时间淘汰，直到降到上限的 90%"""
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - self.max_bytes * 0.9
+        freed = evicted = 0
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            for rowid, size in connection.execute('SELECT rowid, size FROM entries ORDER BY accessed').fetchall():
+                if freed >= target:
+                    break
+                connection.execute('DELETE FROM entries WHERE rowid = ?', (rowid,))
+                freed += size
+                evicted += 1
+        self._stats['evictions'] += evicted
+
+    def invalidate(self, endpoint: str = None, resource_id: str = None, semester: str = None) -> int:
+        """删除匹配的条目，返回删除的条目数。不指定任何参数时清空缓存"""
+        conditions = {'endpoint': endpoint, 'resource_id': resource_id, 'semester': semester}
+        conditions = {column: value for column, value in conditions.items() if value is not None}
+        where = ' AND '.join(f'{column} = ?' for column in conditions) or '1'
+        try:
+            with self._lock:
+                return _blocking(lambda: self._connect().execute(f'DELETE FROM entries WHERE {where}',
+                                                                 tuple(conditions.values())).rowcount)
+        except sqlite3.Error as e:
+            self._failed('invalidate', e)
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        """本进程的命中、未命中、写入、淘汰和出错次数，以及缓存文件中的条目数和总字节数"""
+        with self._lock:
+            result = dict(self._stats)
+            try:
+                entries, size = _blocking(lambda: self._connect().execute(
+                    'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone())
+            except sqlite3.Error:
+                entries = size = 0
+        result.update(entries=entries, bytes=size)
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                _blocking(self._connection.close)
+            self._connection = None
@@ -1,19 +1,169 @@
-from dataclasses import dataclass, field
-from typing import Dict, List, Tuple, Union
-
-from everyclass.rpc import RpcException, ensure_slots
+import contextvars
+import time
+from collections import OrderedDict, abc
+from dataclasses import dataclass, field, fields
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import gevent
+from gevent.pool import Pool
+
+from everyclass import rpc as _rpc
+from everyclass.rpc import RpcException, RpcResourceNotFound, add_slots, decodable, interceptors, metrics
+from everyclass.rpc.balancer import configure_base_url
+from everyclass.rpc.cache import MISSING, TTLCache, approx_size
+from everyclass.rpc.disk_cache import DiskCache
+from everyclass.rpc.hedge import HedgePolicy
 from everyclass.rpc.http import HttpRpc
+from everyclass.rpc.singleflight import SingleFlight
+
+
+class _EncryptCache:
+    """资源 ID 加密结果的 LRU 缓存，加密函数变化时自动清空"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.function = None
+        self._data: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+    def check_function(self, function) -> None:
+        if function is not self.function:
+            self.function = function
+            self._data = OrderedDict()
+
+    def get(self, key: Tuple[str, str]) -> Optional[str]:
+        value = self._data.get(key)
+        if value is not None:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:  # 被其他线程淘汰
+                pass
+        return value
+
+    def set(self, key: Tuple[str, str], value: str) -> None:
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            try:
+                self._data.popitem(last=False)
+            except KeyError:
+                break
+
+    def clear(self) -> None:
+        self._data = OrderedDict()
+
+
+_encrypt_cache = _EncryptCache(maxsize=65536)
+
+
+def set_encrypt_cache_size(maxsize: int) -> None:
+    """设置资源 ID 加密结果缓存的条目数，为 0 时不缓存"""
+    _encrypt_cache.maxsize = maxsize
+    _encrypt_cache.clear()
 
 
 def encrypt(resource_type: str, resource_id: str):
     """资源加密函数的代理，当rpc模块初始化不指定加密函数时，返回待加密的原值"""
-    from everyclass.rpc import _resource_id_encrypt
-    if _resource_id_encrypt:
-        return _resource_id_encrypt(resource_type, resource_id)
-    else:
+    function = _rpc._resource_id_encrypt
+    if not function:
         return resource_id
+    if not _encrypt_cache.maxsize:
+        return function(resource_type, resource_id)
+    _encrypt_cache.check_function(function)
+    key = (resource_type, resource_id)
+    value = _encrypt_cache.get(key)
+    if value is None:
+        value = function(resource_type, resource_id)
+        _encrypt_cache.set(key, value)
+    return value
+
+
+def encrypt_many(resource_type: str, resource_ids: List[str]) -> List[str]:
+    """批量加密资源 ID。初始化时指定了批量加密函数时一次性加密所有未缓存的 ID，结果同时写入缓存"""
+    function = _rpc._resource_id_encrypt
+    batch_function = _rpc._resource_id_batch_encrypt
+    if not function or not batch_function or not _encrypt_cache.maxsize:
+        return [encrypt(resource_type, resource_id) for resource_id in resource_ids]
+    _encrypt_cache.check_function(function)
+    missing = list(dict.fromkeys(resource_id for resource_id in resource_ids
+                                 if _encrypt_cache.get((resource_type, resource_id)) is None))
+    if missing:
+        for resource_id, value in zip(missing, batch_function(resource_type, missing)):
+            _encrypt_cache.set((resource_type, resource_id), value)
+    return [encrypt(resource_type, resource_id) for resource_id in resource_ids]
+
+
+def _batch_encrypt_enabled() -> bool:
+    return bool(_rpc._resource_id_batch_encrypt and _rpc._resource_id_encrypt and
+                not _rpc._lazy_resource_id_encoding and _encrypt_cache.maxsize)
+
+
+def _prefetch_encrypt(resource_type: str, resource_ids: List[str]) -> None:
+    """解码一批对象前预先批量加密它们的 ID，之后逐个 `encrypt` 时直接命中缓存"""
+    if len(resource_ids) > 1:
+        encrypt_many(resource_type, resource_ids)
+
+
+def _prefetch_card_ids(card_list: List[Dict]) -> None:
+    """预先批量加密 card 列表中的教室、card 和老师 ID"""
+    if not _batch_encrypt_enabled():
+        return
+    _prefetch_encrypt('room', [card['room_code'] for card in card_list])
+    _prefetch_encrypt('klass', [card['card_code'] for card in card_list])
+    _prefetch_encrypt('teacher', [teacher['teacher_code'] for card in card_list for teacher in card['teacher_list']])
+
+
+class _Deferred:
+    """延迟计算的加密 ID，第一次访问对应字段时才加密"""
+    __slots__ = ('resource_type', 'resource_id')
+
+    def __init__(self, resource_type: str, resource_id: str):
+        self.resource_type = resource_type
+        self.resource_id = resource_id
 
 
+def encoded_id(resource_type: str, resource_id: str):
+    """`*_id_encoded` 字段的值：开启延迟加密时返回占位对象，否则立即加密"""
+    if _rpc._lazy_resource_id_encoding and _rpc._resource_id_encrypt:
+        return _Deferred(resource_type, resource_id)
+    return encrypt(resource_type, resource_id)
+
+
+class _EncodedIdField:
+    """包装 slot 描述符，读取时把 `_Deferred` 替换为加密结果"""
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.slot.__get__(instance, owner)
+        if isinstance(value, _Deferred):
+            value = encrypt(value.resource_type, value.resource_id)
+            self.slot.__set__(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+
+def _make_all(make: Callable[[Dict], Any]) -> Callable[[List[Dict]], List[Any]]:
+    """逐个转换 dict 列表的转换函数，用作 `decodable` 的 converters"""
+    return lambda items: [make(x) for x in items]
+
+
+def lazy_encoded_ids(cls):
+    """让带 `__slots__` 的 dataclass 的 `*_id_encoded` 字段支持延迟加密，需要放在 `@add_slots` 之上"""
+    for f in fields(cls):
+        if f.name.endswith('_id_encoded'):
+            setattr(cls, f.name, _EncodedIdField(cls.__dict__[f.name]))
+    return cls
+
+
+@decodable(renames={'code': 'student_id', 'semester_list': 'semesters', 'class': 'klass'},
+           converters={'semesters': sorted}, ignore=('group',))
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class SearchResultStudentItem:
     student_id: str
@@ -27,14 +177,13 @@ class SearchResultStudentItem:
 
     @classmethod
     def make(cls, dct: Dict) -> "SearchResultStudentItem":
-        dct['semesters'] = sorted(dct.pop("semester_list"))
-        dct['student_id'] = dct.pop("code")  # rename
-        dct['student_id_encoded'] = encrypt('student', dct['student_id'])
-        dct['klass'] = dct.pop("class")
-        del dct["group"]
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct, student_id_encoded=encoded_id('student', dct['code']))
 
 
+@decodable(renames={'code': 'teacher_id', 'semester_list': 'semesters'},
+           converters={'semesters': sorted}, ignore=('group',))
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class SearchResultTeacherItem:
     teacher_id: str
@@ -48,13 +197,13 @@ class SearchResultTeacherItem:
 
     @classmethod
     def make(cls, dct: Dict) -> "SearchResultTeacherItem":
-        dct['semesters'] = sorted(dct.pop("semester_list"))
-        dct['teacher_id'] = dct.pop("code")  # rename
-        dct['teacher_id_encoded'] = encrypt('teacher', dct['teacher_id'])
-        del dct["group"]
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct, teacher_id_encoded=encoded_id('teacher', dct['code']))
 
 
+@decodable(renames={'code': 'room_id', 'semester_list': 'semesters'},
+           converters={'semesters': sorted}, ignore=('group',))
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class SearchResultClassroomItem:
     room_id: str
@@ -68,40 +217,155 @@ class SearchResultClassroomItem:
 
     @classmethod
     def make(cls, dct: Dict) -> "SearchResultClassroomItem":
-        dct['semesters'] = sorted(dct.pop("semester_list"))
-        dct['room_id'] = dct.pop("code")  # rename
-        dct['room_id_encoded'] = encrypt('room', dct['room_id'])
-        del dct["group"]
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct, room_id_encoded=encoded_id('room', dct['code']))
+
 
+class LazyItems(abc.Sequence):
+    """按需解码的结果序列：保存原始的 dict，第一次访问某个元素时才调用 `make` 构造结果对象
 
+    :param make: 构造结果对象的函数
+    :param raw: 原始 dict 列表
+    :param resource_type: 资源类型，开启批量加密时在解码前批量加密将要访问的 ID
+    """
+    __slots__ = ('_make', '_raw', '_items', '_resource_type')
+
+    def __init__(self, make: Callable[[Dict], Any], raw: List[Dict], resource_type: str = None):
+        self._make = make
+        self._raw: List[Optional[Dict]] = raw
+        self._items: List[Any] = [MISSING] * len(raw)
+        self._resource_type = resource_type
+
+    def _materialize(self, indexes: range) -> None:
+        pending = [i for i in indexes if self._items[i] is MISSING]
+        if not pending:
+            return
+        if self._resource_type and _batch_encrypt_enabled():
+            _prefetch_encrypt(self._resource_type, [self._raw[i]['code'] for i in pending])
+        for i in pending:
+            self._items[i] = self._make(self._raw[i])
+            self._raw[i] = None  # 已解码，释放原始 dict
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indexes = range(*index.indices(len(self._items)))
+            self._materialize(indexes)
+            return [self._items[i] for i in indexes]
+        if index < 0:
+            index += len(self._items)
+        if not 0 <= index < len(self._items):
+            raise IndexError('LazyItems index out of range')
+        self._materialize(range(index, index + 1))
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(len(self._items)):
+            yield self[i]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (LazyItems, list)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        decoded = sum(1 for item in self._items if item is not MISSING)
+        return f'LazyItems(len={len(self._items)}, decoded={decoded})'
+
+    def extend(self, other: "LazyItems") -> None:
+        """追加另一个序列（不会触发解码）"""
+        if isinstance(other, LazyItems) and other._make is self._make:
+            self._raw.extend(other._raw)
+            self._items.extend(other._items)
+        else:
+            for item in other:
+                self._raw.append(None)
+                self._items.append(item)
+
+    def materialize(self) -> List[Any]:
+        """解码全部元素并以 list 返回"""
+        self._materialize(range(len(self._items)))
+        return list(self._items)
+
+
+def _partition_search(dct: Dict, limit: Optional[int]) -> Tuple[Dict[str, List[Dict]], bool]:
+    """一次遍历将搜索结果按 group 分组，返回 (分组, 是否因为 limit 丢弃了部分结果)"""
+    groups: Dict[str, List[Dict]] = {'student': [], 'teacher': [], 'room': []}
+    truncated = False
+    for x in dct["data"]:
+        bucket = groups.get(x.get('group'))
+        if bucket is None:
+            continue
+        if limit is not None and len(bucket) >= limit:
+            truncated = True
+            continue
+        bucket.append(x)
+    return groups, truncated
+
+
+@decodable(ignore=('status', 'data'))
+@add_slots
 @dataclass
 class SearchResult:
     students: List[SearchResultStudentItem]
     teachers: List[SearchResultTeacherItem]
     classrooms: List[SearchResultClassroomItem]
+    truncated: bool = False  # 是否因为 limit 丢弃了部分结果
 
     @classmethod
-    def make(cls, dct: Dict) -> "SearchResult":
-        del dct["status"]
-        dct["students"] = [SearchResultStudentItem.make(x) for x in dct['data'] if
-                           'group' in x and x['group'] == 'student']
-        dct["teachers"] = [SearchResultTeacherItem.make(x) for x in dct['data'] if
-                           'group' in x and x['group'] == 'teacher']
-        dct["classrooms"] = [SearchResultClassroomItem.make(x) for x in dct['data'] if
-                             'group' in x and x['group'] == 'room']
-        dct.pop("data")
-
-        return cls(**ensure_slots(cls, dct))
+    def make(cls, dct: Dict, limit: int = None) -> "SearchResult":
+        """
+        :param dct: 搜索接口的响应
+        :param limit: 每类结果最多保留（解码）的条数，为 None 时不限制
+        """
+        groups, truncated = _partition_search(dct, limit)
+        return cls._decode(dct,
+                           students=LazyItems(SearchResultStudentItem.make, groups['student'], 'student').materialize(),
+                           teachers=LazyItems(SearchResultTeacherItem.make, groups['teacher'], 'teacher').materialize(),
+                           classrooms=LazyItems(SearchResultClassroomItem.make, groups['room'], 'room').materialize(),
+                           truncated=truncated)
 
     def append(self, to_append: Dict):
-        """对于多页搜索结果，将第一页之后的结果追加到搜索结果对象"""
+        """对于多页搜索结果，将第一页之后的结果追加到搜索结果对象（逐页处理大量结果时请使用 `Entity.search_iter`）"""
         new_result = self.__class__.make(to_append)
         self.students.extend(new_result.students)
         self.teachers.extend(new_result.teachers)
         self.classrooms.extend(new_result.classrooms)
 
 
+@decodable(ignore=('status', 'data'))
+@add_slots
+@dataclass
+class LazySearchResult:
+    """`Entity.search_lazy` 的结果：各类结果是按需解码的 `LazyItems`，只有被访问到的条目才会构造结果对象。
+    条目格式错误时在访问该条目时才抛出异常；需要普通列表（如序列化）时调用 `materialize()`
+    """
+    students: LazyItems
+    teachers: LazyItems
+    classrooms: LazyItems
+    truncated: bool = False  # 是否因为 limit 丢弃了部分结果
+
+    @classmethod
+    def make(cls, dct: Dict, limit: int = None) -> "LazySearchResult":
+        groups, truncated = _partition_search(dct, limit)
+        return cls._decode(dct,
+                           students=LazyItems(SearchResultStudentItem.make, groups['student'], 'student'),
+                           teachers=LazyItems(SearchResultTeacherItem.make, groups['teacher'], 'teacher'),
+                           classrooms=LazyItems(SearchResultClassroomItem.make, groups['room'], 'room'),
+                           truncated=truncated)
+
+    def materialize(self) -> SearchResult:
+        """解码全部条目，返回 `SearchResult`"""
+        return SearchResult(students=self.students.materialize(),
+                            teachers=self.teachers.materialize(),
+                            classrooms=self.classrooms.materialize(),
+                            truncated=self.truncated)
+
+
+@decodable(renames={'teacher_code': 'teacher_id'})
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class TeacherItem:
     teacher_id: str
@@ -112,11 +376,14 @@ class TeacherItem:
 
     @classmethod
     def make(cls, dct: Dict) -> "TeacherItem":
-        dct['teacher_id'] = dct.pop("teacher_code")
-        dct['teacher_id_encoded'] = encrypt('teacher', dct['teacher_id'])
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct, teacher_id_encoded=encoded_id('teacher', dct['teacher_code']))
 
 
+@decodable(renames={'teacher_list': 'teachers', 'room_code': 'room_id', 'card_code': 'card_id',
+                    'week_list': 'weeks', 'course_code': 'course_id'},
+           converters={'teachers': _make_all(TeacherItem.make)})
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class CardItem:
     name: str
@@ -133,17 +400,22 @@ class CardItem:
 
     @classmethod
     def make(cls, dct: Dict) -> "CardItem":
-        dct["teachers"] = [TeacherItem.make(x) for x in dct.pop("teacher_list")]
-        dct['room_id'] = dct.pop('room_code')
-        dct['card_id'] = dct.pop('card_code')
-        dct['weeks'] = dct.pop('week_list')
-        dct['week_string'] = weeks_to_string(dct['weeks'])
-        dct['room_id_encoded'] = encrypt('room', dct['room_id'])
-        dct['card_id_encoded'] = encrypt('klass', dct['card_id'])
-        dct['course_id'] = dct.pop('course_code')
-        return cls(**ensure_slots(cls, dct))
-
-
+        return cls._decode(dct,
+                           week_string=weeks_to_string(dct['week_list']),
+                           room_id_encoded=encoded_id('room', dct['room_code']),
+                           card_id_encoded=encoded_id('klass', dct['card_code']))
+
+    @property
+    def week_set(self) -> "WeekSet":
+        """周次集合"""
+        return WeekSet.from_weeks(self.weeks)
+
+
+@decodable(renames={'semester_list': 'semesters', 'room_code': 'room_id', 'type': 'classroom_type',
+                    'card_list': 'cards'},
+           converters={'semesters': sorted, 'cards': _make_all(CardItem.make)}, ignore=('status',))
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class ClassroomTimetableResult:
     room_id: str
@@ -158,16 +430,13 @@ class ClassroomTimetableResult:
 
     @classmethod
     def make(cls, dct: Dict) -> "ClassroomTimetableResult":
-        del dct["status"]
-        dct['semesters'] = sorted(dct.pop('semester_list'))
-        dct['room_id'] = dct.pop("room_code")
-        dct['classroom_type'] = dct.pop("type")
-        dct['cards'] = [CardItem.make(x) for x in dct.pop('card_list')]
-
-        dct['room_id_encoded'] = encrypt('room', dct['room_id'])
-        return cls(**ensure_slots(cls, dct))
+        _prefetch_card_ids(dct['card_list'])
+        return cls._decode(dct, room_id_encoded=encoded_id('room', dct['room_code']))
 
 
+@decodable(renames={'teacher_code': 'teacher_id'})
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class CardResultTeacherItem:
     name: str
@@ -178,11 +447,12 @@ class CardResultTeacherItem:
 
     @classmethod
     def make(cls, dct: Dict) -> "CardResultTeacherItem":
-        dct['teacher_id'] = dct.pop('teacher_code')
-        dct['teacher_id_encoded'] = encrypt('teacher', dct['teacher_id'])
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct, teacher_id_encoded=encoded_id('teacher', dct['teacher_code']))
 
 
+@decodable(renames={'class': 'klass', 'student_code': 'student_id'})
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class CardResultStudentItem:
     name: str
@@ -193,12 +463,13 @@ class CardResultStudentItem:
 
     @classmethod
     def make(cls, dct: Dict) -> "CardResultStudentItem":
-        dct["klass"] = dct.pop("class")
-        dct["student_id"] = dct.pop("student_code")
-        dct["student_id_encoded"] = encrypt("student", dct["student_id"])
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct, student_id_encoded=encoded_id("student", dct["student_code"]))
 
 
+@decodable(renames={'student_code': 'student_id', 'class': 'klass', 'semester_list': 'semesters'},
+           ignore=('status',))
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class StudentResult:
     name: str
@@ -211,14 +482,14 @@ class StudentResult:
 
     @classmethod
     def make(cls, dct: Dict) -> "StudentResult":
-        del dct["status"]
-        dct["student_id"] = dct.pop("student_code")
-        dct["student_id_encoded"] = encrypt("student", dct["student_id"])
-        dct["klass"] = dct.pop("class")
-        dct["semesters"] = dct.pop('semester_list')
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct, student_id_encoded=encoded_id("student", dct["student_code"]))
 
 
+@decodable(renames={'card_list': 'cards', 'semester_list': 'semesters', 'student_code': 'student_id',
+                    'class': 'klass'},
+           converters={'cards': _make_all(CardItem.make)}, ignore=('status',))
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class StudentTimetableResult:
     name: str  # 姓名
@@ -234,15 +505,14 @@ class StudentTimetableResult:
 
     @classmethod
     def make(cls, dct: Dict) -> "StudentTimetableResult":
-        del dct["status"]
-        dct["cards"] = [CardItem.make(x) for x in dct.pop("card_list")]
-        dct["semesters"] = dct.pop("semester_list")
-        dct["student_id"] = dct.pop("student_code")
-        dct["student_id_encoded"] = encrypt("student", dct["student_id"])
-        dct["klass"] = dct.pop("class")
-        return cls(**ensure_slots(cls, dct))
+        _prefetch_card_ids(dct["card_list"])
+        return cls._decode(dct, student_id_encoded=encoded_id("student", dct["student_code"]))
 
 
+@decodable(renames={'semester_list': 'semesters', 'teacher_code': 'teacher_id'},
+           converters={'semesters': sorted}, ignore=('status',))
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class TeacherResult:
     name: str  # 姓名
@@ -255,13 +525,13 @@ class TeacherResult:
 
     @classmethod
     def make(cls, dct: Dict) -> "TeacherResult":
-        del dct["status"]
-        dct['semesters'] = sorted(dct.pop('semester_list'))
-        dct['teacher_id'] = dct.pop('teacher_code')
-        dct["teacher_id_encoded"] = encrypt("teacher", dct["teacher_id"])
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct, teacher_id_encoded=encoded_id("teacher", dct["teacher_code"]))
 
 
+@decodable(renames={'card_list': 'cards', 'semester_list': 'semesters', 'teacher_code': 'teacher_id'},
+           converters={'cards': _make_all(CardItem.make), 'semesters': sorted}, ignore=('status',))
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class TeacherTimetableResult:
     name: str  # 姓名
@@ -277,14 +547,17 @@ class TeacherTimetableResult:
 
     @classmethod
     def make(cls, dct: Dict) -> "TeacherTimetableResult":
-        del dct["status"]
-        dct["cards"] = [CardItem.make(x) for x in dct.pop("card_list")]
-        dct['semesters'] = sorted(dct.pop('semester_list'))
-        dct['teacher_id'] = dct.pop('teacher_code')
-        dct["teacher_id_encoded"] = encrypt("teacher", dct["teacher_id"])
-        return cls(**ensure_slots(cls, dct))
+        _prefetch_card_ids(dct["card_list"])
+        return cls._decode(dct, teacher_id_encoded=encoded_id("teacher", dct["teacher_code"]))
 
 
+@decodable(renames={'teacher_list': 'teachers', 'student_list': 'students', 'card_code': 'card_id',
+                    'room_code': 'room_id', 'week_list': 'weeks', 'course_code': 'course_id'},
+           converters={'teachers': _make_all(CardResultTeacherItem.make),
+                       'students': _make_all(CardResultStudentItem.make)},
+           ignore=('status',))
+@lazy_encoded_ids
+@add_slots
 @dataclass
 class CardResult:
     name: str  # 课程名
@@ -304,17 +577,17 @@ class CardResult:
 
     @classmethod
     def make(cls, dct: Dict) -> "CardResult":
-        del dct["status"]
-        dct["teachers"] = [CardResultTeacherItem.make(x) for x in dct.pop("teacher_list")]
-        dct["students"] = [CardResultStudentItem.make(x) for x in dct.pop("student_list")]
-        dct['card_id'] = dct.pop('card_code')
-        dct["card_id_encoded"] = encrypt("klass", dct["card_id"])
-        dct['room_id'] = dct.pop('room_code')
-        dct['room_id_encoded'] = encrypt("room", dct["room_id"])
-        dct['weeks'] = dct.pop("week_list")
-        dct['week_string'] = weeks_to_string(dct['weeks'])
-        dct['course_id'] = dct.pop('course_code')
-        return cls(**ensure_slots(cls, dct))
+        if _batch_encrypt_enabled():
+            _prefetch_encrypt("student", [x["student_code"] for x in dct["student_list"]])
+        return cls._decode(dct,
+                           card_id_encoded=encoded_id("klass", dct["card_code"]),
+                           room_id_encoded=encoded_id("room", dct["room_code"]),
+                           week_string=weeks_to_string(dct["week_list"]))
+
+    @property
+    def week_set(self) -> "WeekSet":
+        """周次集合"""
+        return WeekSet.from_weeks(self.weeks)
 
 
 def teacher_list_to_name_str(teachers: List[CardResultTeacherItem]) -> str:
@@ -327,36 +600,445 @@ def teacher_list_to_tid_str(teachers: List[CardResultTeacherItem]) -> str:
     return ";".join(sorted([t.teacher_id for t in teachers]))
 
 
+@dataclass
+class BatchResult:
+    """批量查询结果。`results` 与传入的 ID 顺序一致，查询失败的位置为 None，失败原因记录在 `errors` 中"""
+    ids: List[str]
+    results: List[Any]
+    errors: Dict[str, Exception] = field(default_factory=dict)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def __getitem__(self, index: int) -> Any:
+        return self.results[index]
+
+    @property
+    def success(self) -> bool:
+        return not self.errors
+
+
 class Entity:
     BASE_URL = 'everyclass-entity'
     REQUEST_TOKEN = None
+    SERVICE = 'entity'  # 指标中的服务名
+
+    # 结果缓存（默认关闭，通过 enable_cache 开启）
+    CACHE: Optional[TTLCache] = None
+    CACHE_TTL: Dict[str, float] = {
+        'student'            : 600,
+        'teacher'            : 600,
+        'student_timetable'  : 600,
+        'teacher_timetable'  : 600,
+        'classroom_timetable': 600,
+        'card'               : 600,
+        'rooms'              : 3600,
+    }
+    PAST_SEMESTER_TTL = 86400  # 往期学期的数据不会再变化，使用更长的缓存时间
+    CURRENT_SEMESTER: Optional[str] = None  # 当前学期，早于当前学期的视为往期学期
+
+    SINGLE_FLIGHT = True  # 合并参数相同的并发调用
+
+    BATCH_CONCURRENCY = 10  # 批量查询时的最大并发数
+    BATCH_SIZE = 100  # 服务端批量接口单次请求的 ID 数量
+    BATCH_API = False  # 是否使用服务端批量接口
+    BATCH_API_RETRY_AFTER = 600  # 批量接口返回 404 后，在这段时间（秒）内改用并发单个查询
+    _batch_api_retry_at = 0.0
+    _flights = SingleFlight()
+
+    HEDGE: Optional[HedgePolicy] = None  # 对冲策略（默认关闭，通过 set_hedging 开启）
+    HEDGE_ENDPOINTS = frozenset({'student_timetable', 'card'})  # 对冲的接口名
+
+    MSGPACK = False  # 是否向上游请求 MessagePack 格式的响应（需要安装 msgpack）
+    MSGPACK_ENDPOINTS = frozenset({'student_timetable', 'teacher_timetable', 'classroom_timetable', 'card'})
+
+    # 往期学期数据的磁盘缓存（默认关闭，通过 enable_disk_cache 开启）
+    DISK_CACHE: Optional[DiskCache] = None
+    DISK_CACHE_ENDPOINTS = frozenset({'student_timetable', 'teacher_timetable', 'classroom_timetable', 'card'})
+
+    ROOM_INDEX = None  # get_available_room_ids 使用的空闲教室索引（`everyclass.rpc.room_index.RoomIndex`）
 
     @classmethod
-    def set_base_url(cls, base_url: str) -> None:
-        cls.BASE_URL = base_url
+    def set_base_url(cls, base_url: Union[str, Sequence[str]], **balancer_options) -> None:
+        """设置服务地址。传入地址列表时在客户端对这些副本做负载均衡，`balancer_options` 见
+        `everyclass.rpc.balancer.LoadBalancer`，如 `strategy="least_outstanding"`
+        """
+        cls.BASE_URL = configure_base_url(cls.SERVICE, base_url, **balancer_options)
 
     @classmethod
     def set_request_token(cls, token: str) -> None:
         cls.REQUEST_TOKEN = token
 
     @classmethod
-    def search(cls, keyword: str) -> SearchResult:
+    def enable_cache(cls, max_entries: int = 10000, max_bytes: int = 256 * 1024 * 1024,
+                     ttl: Dict[str, float] = None, past_semester_ttl: float = None,
+                     current_semester: str = None) -> None:
+        """开启结果缓存。缓存返回的是共享的结果对象，调用方不应修改
+
+        :param max_entries: 最多缓存的条目数
+        :param max_bytes: 最多缓存的字节数（估算值）
+        :param ttl: 各接口的缓存时间（秒），键为 `CACHE_TTL` 中的接口名，设置为 0 表示不缓存该接口
+        :param past_semester_ttl: 往期学期数据的缓存时间（秒）
+        :param current_semester: 当前学期，如 2018-2019-1
+        """
+        cls.CACHE = TTLCache(max_entries=max_entries, max_bytes=max_bytes)
+        if ttl:
+            cls.CACHE_TTL = {**cls.CACHE_TTL, **ttl}
+        if past_semester_ttl is not None:
+            cls.PAST_SEMESTER_TTL = past_semester_ttl
+        if current_semester:
+            cls.CURRENT_SEMESTER = current_semester
+
+    @classmethod
+    def disable_cache(cls) -> None:
+        cls.CACHE = None
+
+    @classmethod
+    def set_current_semester(cls, semester: str) -> None:
+        cls.CURRENT_SEMESTER = semester
+
+    @classmethod
+    def invalidate_cache(cls, endpoint: str = None, resource_id: Union[str, Iterable[str]] = None,
+                         semester: str = None) -> int:
+        """使缓存失效，返回失效的条目数。不指定任何参数时清空缓存
+
+        :param endpoint: 接口名，如 student_timetable
+        :param resource_id: 学号、教工号、教室 ID 或 card ID，可以传入多个 ID（只扫描一次缓存）
+        :param semester: 学期
+        """
+        if cls.CACHE is None:
+            return 0
+        resource_ids = None
+        if resource_id is not None:
+            resource_ids = {resource_id} if isinstance(resource_id, str) else set(resource_id)
+
+        def match(key: Tuple) -> bool:
+            if endpoint is not None and key[0] != endpoint:
+                return False
+            if resource_ids is not None and (len(key) < 2 or key[1] not in resource_ids):
+                return False
+            if semester is not None and (len(key) < 3 or key[2] != semester):
+                return False
+            return True
+
+        return cls.CACHE.invalidate(match)
+
+    @classmethod
+    def enable_disk_cache(cls, path: str, max_bytes: int = 512 * 1024 * 1024, version: str = '1',
+                          endpoints: Iterable[str] = None, current_semester: str = None) -> None:
+        """开启往期学期数据的磁盘缓存。只有早于 `CURRENT_SEMESTER` 的学期会写入磁盘，多个进程可以共用同一个文件
+
+        :param path: SQLite 文件路径
+        :param max_bytes: 缓存文件中数据的字节数上限
+        :param version: 版本号，上游响应格式变化时修改，与文件中记录的不同时清空缓存
+        :param endpoints: 使用磁盘缓存的接口名，默认为各类课表和 card
+        :param current_semester: 当前学期，如 2018-2019-1
+        """
+        if cls.DISK_CACHE is not None:
+            cls.DISK_CACHE.close()
+        cls.DISK_CACHE = DiskCache(path, max_bytes=max_bytes, version=version)
+        if endpoints is not None:
+            cls.DISK_CACHE_ENDPOINTS = frozenset(endpoints)
+        if current_semester:
+            cls.CURRENT_SEMESTER = current_semester
+
+    @classmethod
+    def disable_disk_cache(cls) -> None:
+        if cls.DISK_CACHE is not None:
+            cls.DISK_CACHE.close()
+        cls.DISK_CACHE = None
+
+    @classmethod
+    def invalidate_disk_cache(cls, endpoint: str = None, resource_id: str = None, semester: str = None) -> int:
+        """删除磁盘缓存中的条目，参数同 `invalidate_cache`"""
+        if cls.DISK_CACHE is None:
+            return 0
+        return cls.DISK_CACHE.invalidate(endpoint, resource_id, semester)
+
+    @classmethod
+    def disk_cache_stats(cls) -> Dict[str, int]:
+        """磁盘缓存的命中统计和文件中的条目数、字节数"""
+        return cls.DISK_CACHE.stats() if cls.DISK_CACHE is not None else {}
+
+    @classmethod
+    def _disk_key(cls, cache_key: Optional[Tuple], semester: Optional[str]) -> Optional[Tuple[str, str, str]]:
+        """返回磁盘缓存的键，不使用磁盘缓存时返回 None"""
+        if cls.DISK_CACHE is None or not cache_key or cache_key[0] not in cls.DISK_CACHE_ENDPOINTS:
+            return None
+        if not semester or not cls.CURRENT_SEMESTER or semester >= cls.CURRENT_SEMESTER:
+            return None
+        return cache_key[0], str(cache_key[1]), semester
+
+    @classmethod
+    def set_room_index(cls, index) -> None:
+        """设置 `get_available_room_ids` 使用的空闲教室索引。传入 None 时关闭"""
+        cls.ROOM_INDEX = index
+
+    @classmethod
+    def get_available_room_ids(cls, week: int, session: str, campus: str, building: str) -> Optional[List[str]]:
+        """由本地空闲教室索引获得指定地点指定时间的空闲教室 ID 列表（与 `get_rooms()` 中的 ID 相同），不发出请求。
+        未设置索引或索引无法回答（未就绪、楼栋或节次无法识别、有教室的课表未能查询）时返回 None，调用方应退回到
+        `get_available_rooms`
+
+        :param week: 周次
+        :param session: 节次，与 card 的 `lesson` 格式相同，如 `10506`
+        :param campus: 校区
+        :param building: 楼栋
+        """
+        if cls.ROOM_INDEX is None:
+            return None
+        return cls.ROOM_INDEX.available_rooms(week, session, campus, building)
+
+    @classmethod
+    def set_single_flight(cls, enabled: bool) -> None:
+        """开启或关闭并发调用合并"""
+        cls.SINGLE_FLIGHT = enabled
+
+    @classmethod
+    def set_hedging(cls, policy: Optional[HedgePolicy], endpoints: Iterable[str] = None) -> None:
+        """开启或关闭（`policy` 为 None）对冲请求
+
+        :param policy: 对冲策略，如 `HedgePolicy(percentile=95, budget_ratio=0.05)`
+        :param endpoints: 对冲的接口名（与 `CACHE_TTL` 中的接口名相同），默认为学生课表和 card
+        """
+        cls.HEDGE = policy
+        if endpoints is not None:
+            cls.HEDGE_ENDPOINTS = frozenset(endpoints)
+
+    @classmethod
+    def set_msgpack(cls, enabled: bool, endpoints: Iterable[str] = None) -> None:
+        """开启或关闭课表和 card 接口的 MessagePack 协商，上游不支持时仍然返回 JSON
+
+        :param endpoints: 使用 MessagePack 的接口名，默认为各类课表和 card
+        """
+        cls.MSGPACK = enabled
+        if endpoints is not None:
+            cls.MSGPACK_ENDPOINTS = frozenset(endpoints)
+
+    @classmethod
+    def _prefer_msgpack(cls, cache_key: Optional[Tuple]) -> bool:
+        return cls.MSGPACK and bool(cache_key) and cache_key[0] in cls.MSGPACK_ENDPOINTS
+
+    @classmethod
+    def hedge_stats(cls) -> Dict[str, Dict]:
+        """各接口的对冲统计"""
+        return cls.HEDGE.stats() if cls.HEDGE is not None else {}
+
+    @classmethod
+    def cache_stats(cls) -> Dict[str, Dict[str, int]]:
+        """各接口的缓存命中统计"""
+        return cls.CACHE.stats() if cls.CACHE is not None else {}
+
+    @classmethod
+    def _ttl_of(cls, endpoint: str, semester: Optional[str]) -> float:
+        ttl = cls.CACHE_TTL.get(endpoint, 0)
+        if ttl and semester and cls.CURRENT_SEMESTER and semester < cls.CURRENT_SEMESTER:
+            return max(ttl, cls.PAST_SEMESTER_TTL)
+        return ttl
+
+    @classmethod
+    def _cache_lookup(cls, cache_key: Optional[Tuple], semester: Optional[str]) -> Tuple[float, Any]:
+        """返回缓存时间和缓存的结果（未命中时为 MISSING）。缓存时间为 0 表示不缓存"""
+        ttl = cls._ttl_of(cache_key[0], semester) if cls.CACHE is not None and cache_key else 0
+        if not ttl:
+            return 0, MISSING
+        return ttl, cls.CACHE.get(cache_key)
+
+    @classmethod
+    def _decode(cls, resp: Dict, decode: Callable[[Dict], Any], ok_status: str, error_message: str,
+                cache_key: Optional[Tuple], ttl: float, url: str = None) -> Any:
+        """检查响应状态，解码并写入缓存。指定 `url` 时记录结果对象的构造耗时（指标和拦截器）"""
+        if resp["status"] != ok_status:
+            raise RpcException(error_message)
+        size = approx_size(resp) if ttl else 0
+        started = time.monotonic()
+        result = decode(resp)
+        if url is not None and (metrics.registry.enabled or interceptors.chain):
+            seconds = time.monotonic() - started
+            endpoint = metrics.endpoint_template(url)
+            metrics.registry.record_construct(cls.SERVICE, endpoint, seconds)
+            if interceptors.chain:
+                interceptors.chain.after_construct(cls.SERVICE, endpoint, seconds)
+        if ttl:
+            cls.CACHE.set(cache_key, result, ttl, size)
+        return result
+
+    @classmethod
+    def _decode_batch(cls, resp: Dict, decode: Callable[[Dict], Any], cache_key: Callable[[str], Tuple],
+                      semester: Optional[str], found: Dict[str, Any], errors: Dict[str, Exception]) -> None:
+        """解码服务端批量接口的响应，结果写入 `found` 和缓存。单个条目解码失败时记入 `errors`，不影响其他条目"""
+        if resp["status"] != "success":
+            raise RpcException('API Server returns non-success status')
+        for item_id, item in resp["data"].items():
+            try:
+                item.setdefault("status", "success")
+                ttl = cls._ttl_of(cache_key(item_id)[0], semester) if cls.CACHE is not None else 0
+                found[item_id] = cls._decode(item, decode, "success", 'API Server returns non-success status',
+                                             cache_key(item_id), ttl)
+            except RpcException as e:
+                errors[item_id] = e
+            except (KeyError, TypeError, ValueError, AttributeError) as e:  # 条目格式错误
+                error = RpcException(f'Malformed item {item_id}: {e!r}')
+                error.__cause__ = e
+                errors[item_id] = error
+
+    @classmethod
+    def _take_cached(cls, ids: List[str], cache_key: Callable[[str], Tuple], semester: Optional[str],
+                     found: Dict[str, Any]) -> List[str]:
+        """把已在进程内缓存中的结果写入 `found`，返回仍需查询的 ID"""
+        if cls.CACHE is None:
+            return ids
+        missing = []
+        for item_id in ids:
+            _, cached = cls._cache_lookup(cache_key(item_id), semester)
+            if cached is MISSING:
+                missing.append(item_id)
+            else:
+                found[item_id] = cached
+        return missing
+
+    @classmethod
+    def _batch_api_enabled(cls) -> bool:
+        return cls.BATCH_API and time.monotonic() >= cls._batch_api_retry_at
+
+    @classmethod
+    def _batch_api_not_found(cls) -> None:
+        """批量接口返回 404（没有该接口或路由暂时异常）时，在 `BATCH_API_RETRY_AFTER` 秒内改用并发单个查询"""
+        cls._batch_api_retry_at = time.monotonic() + cls.BATCH_API_RETRY_AFTER
+        if _rpc._logger:
+            _rpc._logger.warning(f'Entity batch API returns 404, falling back to single queries '
+                                 f'for {cls.BATCH_API_RETRY_AFTER}s')
+
+    @classmethod
+    def _call(cls, url: str, decode: Callable[[Dict], Any], ok_status: str = "success", auth: bool = True,
+              cache_key: Tuple = None, semester: str = None,
+              error_message: str = 'API Server returns non-success status', flight_key: Tuple = None):
+        """调用 entity 接口并解码结果
+
+        :param url: 接口地址
+        :param decode: 将响应转换为结果对象的函数
+        :param ok_status: 表示成功的 `status` 字段值
+        :param auth: 是否附带 `X-Auth-Token` 请求头
+        :param cache_key: 缓存键，第一个元素为接口名，为 None 时不缓存
+        :param semester: 结果所属学期，用于判断往期学期
+        :param error_message: `status` 不为 `ok_status` 时抛出异常的信息
+        :param flight_key: 合并并发调用时使用的键，默认为请求的 URL
+        """
+        ttl, cached = cls._cache_lookup(cache_key, semester)
+        if cached is not MISSING:
+            return cached
+
+        if cls.HEDGE is not None and cache_key and cache_key[0] in cls.HEDGE_ENDPOINTS:
+            call = partial(HttpRpc.hedged_call, hedge_policy=cls.HEDGE)
+        else:
+            call = HttpRpc.call
+
+        disk_key = cls._disk_key(cache_key, semester)
+
+        def fetch():
+            resp = cls.DISK_CACHE.get(disk_key) if disk_key else None
+            if resp is not None:
+                return cls._decode(resp, decode, ok_status, error_message, cache_key, ttl, url)
+            resp = call(method="GET",
+                        url=url,
+                        retry=True,
+                        headers={'X-Auth-Token': cls.REQUEST_TOKEN} if auth else None,
+                        service=cls.SERVICE,
+                        prefer_msgpack=cls._prefer_msgpack(cache_key))
+            result = cls._decode(resp, decode, ok_status, error_message, cache_key, ttl, url)
+            if disk_key:  # 构造成功后才写入，无法构造的响应不会在重启后被反复读出
+                cls.DISK_CACHE.set(disk_key, resp)
+            return result
+
+        if not cls.SINGLE_FLIGHT:
+            return fetch()
+        return cls._flights.do(flight_key or ("GET", url), fetch)
+
+    @classmethod
+    def search(cls, keyword: str, limit: int = None) -> SearchResult:
         """搜索
 
         :param keyword: 需要搜索的关键词
+        :param limit: 每类结果（学生、老师、教室）最多保留的条数，为 None 时不限制
         :return: 搜索结果列表
         """
         keyword = keyword.replace("/", "")
+        url = f'{cls.BASE_URL}/search/query?key={keyword}'
 
-        resp = HttpRpc.call(method="GET",
-                            url=f'{cls.BASE_URL}/search/query?key={keyword}',
-                            retry=True,
-                            headers={'X-Auth-Token': cls.REQUEST_TOKEN})
-        if resp["status"] != "OK":
-            raise RpcException('API Server returns non-success status')
-        search_result = SearchResult.make(resp)
+        return cls._call(url=url,
+                         decode=lambda resp: SearchResult.make(resp, limit),
+                         ok_status="OK",
+                         flight_key=("GET", url, limit))
+
+    @classmethod
+    def search_lazy(cls, keyword: str, limit: int = None) -> LazySearchResult:
+        """搜索，各类结果在访问时才解码，适合只展示前几条结果的页面。参数同 `search`"""
+        keyword = keyword.replace("/", "")
+        url = f'{cls.BASE_URL}/search/query?key={keyword}'
+
+        return cls._call(url=url,
+                         decode=lambda resp: LazySearchResult.make(resp, limit),
+                         ok_status="OK",
+                         flight_key=("GET", url, limit, "lazy"))
 
-        return search_result
+    SEARCH_ITEM_MAKERS = {'student': SearchResultStudentItem.make,
+                          'teacher': SearchResultTeacherItem.make,
+                          'room'   : SearchResultClassroomItem.make}
+
+    @classmethod
+    def _search_page(cls, keyword: str, page_index: int, page_size: int) -> List[Dict]:
+        """获得一页未解码的搜索结果"""
+        return cls._call(url=f'{cls.BASE_URL}/search/query?key={keyword}&page_index={page_index}&page_size={page_size}',
+                         decode=lambda resp: resp["data"],
+                         ok_status="OK")
+
+    @classmethod
+    def _search_page_repeated(cls, raw_items: List[Dict], previous: Optional[List[Dict]]) -> bool:
+        """是否为空页，或首尾条目与上一页相同（上游忽略分页参数时会重复返回同一页）"""
+        if not raw_items:
+            return True
+        return previous is not None and raw_items[0] == previous[0] and raw_items[-1] == previous[-1]
+
+    @classmethod
+    def _decode_search_items(cls, raw_items: List[Dict]) -> Iterator[Any]:
+        for raw in raw_items:
+            make = cls.SEARCH_ITEM_MAKERS.get(raw.get('group'))
+            if make is not None:
+                yield make(raw)
+
+    @classmethod
+    def search_iter(cls, keyword: str, page_size: int = 100, max_pages: int = 100) -> Iterator[
+            Union[SearchResultStudentItem, SearchResultTeacherItem, SearchResultClassroomItem]]:
+        """逐页搜索，按服务端返回的顺序逐个产生解码后的结果。消费当前页时在后台预取下一页，调用方可以随时停止迭代。
+        遇到空页、与上一页相同的页（上游忽略分页参数）或达到 `max_pages` 时停止
+
+        :param keyword: 需要搜索的关键词
+        :param page_size: 每页条数
+        :param max_pages: 最多获取的页数
+        """
+        keyword = keyword.replace("/", "")
+        page_index = 1
+        previous = None
+        # 预取在调用方 contextvars 的副本中执行，沿用 `deadline_scope`、`trace_scope` 等设置
+        next_page = gevent.spawn(contextvars.copy_context().run, cls._search_page, keyword, page_index, page_size)
+        try:
+            while next_page is not None:
+                raw_items = next_page.get()
+                next_page = None
+                if cls._search_page_repeated(raw_items, previous):
+                    break
+                previous = raw_items
+                if len(raw_items) >= page_size and page_index < max_pages:
+                    page_index += 1
+                    next_page = gevent.spawn(contextvars.copy_context().run, cls._search_page, keyword, page_index,
+                                             page_size)
+                yield from cls._decode_search_items(raw_items)
+        finally:
+            if next_page is not None:
+                next_page.kill(block=False)  # 提前结束迭代时取消预取
 
     @classmethod
     def get_student(cls, student_id: str):
@@ -366,14 +1048,9 @@ class Entity:
         :param student_id: 学号
         :return:
         """
-        resp = HttpRpc.call(method="GET",
-                            url=f'{cls.BASE_URL}/student/{student_id}',
-                            retry=True,
-                            headers={'X-Auth-Token': cls.REQUEST_TOKEN})
-        if resp["status"] != "success":
-            raise RpcException('API Server returns non-success status')
-        search_result = StudentResult.make(resp)
-        return search_result
+        return cls._call(url=f'{cls.BASE_URL}/student/{student_id}',
+                         decode=StudentResult.make,
+                         cache_key=('student', student_id))
 
     @classmethod
     def get_student_timetable(cls, student_id: str, semester: str):
@@ -384,14 +1061,10 @@ class Entity:
         :param semester: 学期，如 2018-2019-1
         :return:
         """
-        resp = HttpRpc.call(method="GET",
-                            url=f'{cls.BASE_URL}/student/{student_id}/timetable/{semester}',
-                            retry=True,
-                            headers={'X-Auth-Token': cls.REQUEST_TOKEN})
-        if resp["status"] != "success":
-            raise RpcException('API Server returns non-success status')
-        search_result = StudentTimetableResult.make(resp)
-        return search_result
+        return cls._call(url=f'{cls.BASE_URL}/student/{student_id}/timetable/{semester}',
+                         decode=StudentTimetableResult.make,
+                         cache_key=('student_timetable', student_id, semester),
+                         semester=semester)
 
     @classmethod
     def get_teacher(cls, teacher_id: str):
@@ -401,14 +1074,9 @@ class Entity:
         :param teacher_id: 学号
         :return:
         """
-        resp = HttpRpc.call(method="GET",
-                            url=f'{cls.BASE_URL}/teacher/{teacher_id}',
-                            retry=True,
-                            headers={'X-Auth-Token': cls.REQUEST_TOKEN})
-        if resp["status"] != "success":
-            raise RpcException('API Server returns non-success status')
-        search_result = TeacherResult.make(resp)
-        return search_result
+        return cls._call(url=f'{cls.BASE_URL}/teacher/{teacher_id}',
+                         decode=TeacherResult.make,
+                         cache_key=('teacher', teacher_id))
 
     @classmethod
     def get_teacher_timetable(cls, teacher_id: str, semester: str):
@@ -419,14 +1087,10 @@ class Entity:
         :param semester: 学期，如 2018-2019-1
         :return:
         """
-        resp = HttpRpc.call(method="GET",
-                            url=f'{cls.BASE_URL}/teacher/{teacher_id}/timetable/{semester}',
-                            retry=True,
-                            headers={'X-Auth-Token': cls.REQUEST_TOKEN})
-        if resp["status"] != "success":
-            raise RpcException('API Server returns non-success status')
-        search_result = TeacherTimetableResult.make(resp)
-        return search_result
+        return cls._call(url=f'{cls.BASE_URL}/teacher/{teacher_id}/timetable/{semester}',
+                         decode=TeacherTimetableResult.make,
+                         cache_key=('teacher_timetable', teacher_id, semester),
+                         semester=semester)
 
     @classmethod
     def get_classroom_timetable(cls, semester: str, room_id: str):
@@ -436,14 +1100,10 @@ class Entity:
         :param room_id: 教室ID
         :return:
         """
-        resp = HttpRpc.call(method="GET",
-                            url=f'{cls.BASE_URL}/room/{room_id}/timetable/{semester}',
-                            retry=True,
-                            headers={'X-Auth-Token': cls.REQUEST_TOKEN})
-        if resp["status"] != "success":
-            raise RpcException('API Server returns non-success status')
-        search_result = ClassroomTimetableResult.make(resp)
-        return search_result
+        return cls._call(url=f'{cls.BASE_URL}/room/{room_id}/timetable/{semester}',
+                         decode=ClassroomTimetableResult.make,
+                         cache_key=('classroom_timetable', room_id, semester),
+                         semester=semester)
 
     @classmethod
     def get_card(cls, semester: str, card_id: str) -> CardResult:
@@ -453,33 +1113,204 @@ class Entity:
         :param card_id: card ID
         :return:
         """
-        resp = HttpRpc.call(method="GET",
-                            url=f'{cls.BASE_URL}/lesson/{card_id}/timetable/{semester}',
-                            retry=True)
-        if resp["status"] != "success":
-            raise RpcException('API Server returns non-success status')
-        search_result = CardResult.make(resp)
-        return search_result
+        return cls._call(url=f'{cls.BASE_URL}/lesson/{card_id}/timetable/{semester}',
+                         decode=CardResult.make,
+                         auth=False,
+                         cache_key=('card', card_id, semester),
+                         semester=semester)
 
     @classmethod
     def get_rooms(cls) -> Dict[str, Dict[str, List[str]]]:
         """获得所有校区和楼栋的教室ID"""
-        resp = HttpRpc.call(method="GET",
-                            url=f'{cls.BASE_URL}/room/',
-                            retry=True)
-        if resp["status"] != "OK":
-            raise RpcException('Entity returns non-success status')
-        return resp["room_group"]
+        return cls._call(url=f'{cls.BASE_URL}/room/',
+                         decode=lambda resp: resp["room_group"],
+                         ok_status="OK",
+                         auth=False,
+                         cache_key=('rooms',),
+                         error_message='Entity returns non-success status')
 
     @classmethod
     def get_available_rooms(cls, week: int, session: str, campus: str, building: str):
-        """获得指定地点指定时间的可用教室"""
-        resp = HttpRpc.call(method="GET",
-                            url=f'{cls.BASE_URL}/room/available?week={week}&session={session}&campus={campus}&building={building}',
-                            retry=True)
-        if resp["status"] != "OK":
-            raise RpcException('Entity returns non-success status')
-        return resp["available_room"]
+        """获得指定地点指定时间的可用教室，原样返回上游响应中的 `available_room`
+
+        该方法不使用空闲教室索引，总是请求上游：上游返回的格式与索引回答的教室 ID 列表不一定相同，由索引回答会使返回类型
+        取决于索引是否就绪。只需要教室 ID 的调用方（如按 `get_rooms()` 中的 ID 展示空闲教室的页面）应改为先调用
+        `get_available_room_ids`，其返回 None 时再调用本方法。
+        """
+        return cls._call(url=f'{cls.BASE_URL}/room/available?week={week}&session={session}&campus={campus}&building={building}',
+                         decode=lambda resp: resp["available_room"],
+                         ok_status="OK",
+                         auth=False,
+                         error_message='Entity returns non-success status')
+
+    @classmethod
+    def set_batch_api(cls, enabled: bool) -> None:
+        """是否优先使用 entity 服务的批量查询接口（服务端返回 404 时在 `BATCH_API_RETRY_AFTER` 秒内回退到并发单个查询）"""
+        cls.BATCH_API = enabled
+        cls._batch_api_retry_at = 0.0
+
+    @classmethod
+    def _multi_get(cls, ids: List[str], single: Callable[[str], Any], batch_url: str, batch_field: str,
+                   decode: Callable[[Dict], Any], cache_key: Callable[[str], Tuple],
+                   semester: str = None) -> BatchResult:
+        """批量查询：优先使用服务端批量接口，否则在有界的协程池中并发调用单个查询接口
+
+        :param ids: 待查询的 ID 列表
+        :param single: 单个查询函数
+        :param batch_url: 服务端批量接口地址
+        :param batch_field: 批量接口请求体中 ID 列表的字段名
+        :param decode: 将批量接口返回的单个条目转换为结果对象的函数
+        :param cache_key: 由 ID 得到缓存键的函数
+        :param semester: 结果所属学期
+        """
+        found: Dict[str, Any] = {}
+        errors: Dict[str, Exception] = {}
+        pending = list(dict.fromkeys(ids))
+
+        if cls._batch_api_enabled():
+            pending = cls._take_cached(pending, cache_key, semester, found)
+            try:
+                for start in range(0, len(pending), cls.BATCH_SIZE):
+                    chunk = pending[start:start + cls.BATCH_SIZE]
+                    resp = HttpRpc.call(method="POST",
+                                        url=batch_url,
+                                        data={batch_field: chunk},
+                                        idempotent=True,
+                                        headers={'X-Auth-Token': cls.REQUEST_TOKEN},
+                                        service=cls.SERVICE,
+                                        prefer_msgpack=cls._prefer_msgpack(cache_key(chunk[0])))
+                    cls._decode_batch(resp, decode, cache_key, semester, found, errors)
+                for item_id in pending:
+                    if item_id not in found and item_id not in errors:
+                        errors[item_id] = RpcResourceNotFound(404, f'{item_id} not found')
+                pending = []
+            except RpcResourceNotFound:
+                cls._batch_api_not_found()
+            except RpcException:
+                pass  # 批量接口失败时退回单个查询
+
+        pending = [item_id for item_id in pending if item_id not in found]
+        if pending:
+            pool = Pool(cls.BATCH_CONCURRENCY)
+            # 每个查询在调用方 contextvars 的副本中执行，沿用 `deadline_scope`、`trace_scope` 等设置
+            greenlets = {item_id: pool.spawn(contextvars.copy_context().run, single, item_id) for item_id in pending}
+            pool.join()
+            for item_id, greenlet in greenlets.items():
+                if greenlet.successful():
+                    found[item_id] = greenlet.value
+                    errors.pop(item_id, None)  # 批量接口返回 404 之前的批次中记录的错误
+                else:
+                    errors[item_id] = greenlet.exception
+
+        return BatchResult(ids=list(ids),
+                           results=[found.get(item_id) for item_id in ids],
+                           errors=errors)
+
+    @classmethod
+    def get_students(cls, student_ids: List[str]) -> BatchResult:
+        """批量获得学生信息"""
+        return cls._multi_get(student_ids,
+                              single=cls.get_student,
+                              batch_url=f'{cls.BASE_URL}/student/batch',
+                              batch_field='student_ids',
+                              decode=StudentResult.make,
+                              cache_key=lambda student_id: ('student', student_id))
+
+    @classmethod
+    def get_teachers(cls, teacher_ids: List[str]) -> BatchResult:
+        """批量获得教师信息"""
+        return cls._multi_get(teacher_ids,
+                              single=cls.get_teacher,
+                              batch_url=f'{cls.BASE_URL}/teacher/batch',
+                              batch_field='teacher_ids',
+                              decode=TeacherResult.make,
+                              cache_key=lambda teacher_id: ('teacher', teacher_id))
+
+    @classmethod
+    def get_cards(cls, semester: str, card_ids: List[str]) -> BatchResult:
+        """批量获得某学期的 card"""
+        return cls._multi_get(card_ids,
+                              single=lambda card_id: cls.get_card(semester, card_id),
+                              batch_url=f'{cls.BASE_URL}/lesson/batch/timetable/{semester}',
+                              batch_field='card_ids',
+                              decode=CardResult.make,
+                              cache_key=lambda card_id: ('card', card_id, semester),
+                              semester=semester)
+
+    @classmethod
+    def get_classroom_timetables(cls, semester: str, room_ids: List[str]) -> BatchResult:
+        """批量获得某学期的教室课表"""
+        return cls._multi_get(room_ids,
+                              single=lambda room_id: cls.get_classroom_timetable(semester, room_id),
+                              batch_url=f'{cls.BASE_URL}/room/batch/timetable/{semester}',
+                              batch_field='room_ids',
+                              decode=ClassroomTimetableResult.make,
+                              cache_key=lambda room_id: ('classroom_timetable', room_id, semester),
+                              semester=semester)
+
+
+class WeekSet:
+    """周次集合，以整数位图表示（第 n 周对应第 n 位），支持快速的成员判断、交集和并集运算"""
+    __slots__ = ('mask',)
+
+    def __init__(self, mask: int = 0):
+        self.mask = mask
+
+    @classmethod
+    def from_weeks(cls, weeks: Iterable[int]) -> "WeekSet":
+        mask = 0
+        for week in weeks:
+            mask |= 1 << week
+        return cls(mask)
+
+    def __contains__(self, week: int) -> bool:
+        return week >= 0 and self.mask >> week & 1 == 1
+
+    def __and__(self, other: "WeekSet") -> "WeekSet":
+        return WeekSet(self.mask & other.mask)
+
+    def __or__(self, other: "WeekSet") -> "WeekSet":
+        return WeekSet(self.mask | other.mask)
+
+    def intersects(self, other: "WeekSet") -> bool:
+        return self.mask & other.mask != 0
+
+    def __iter__(self) -> Iterator[int]:
+        mask = self.mask
+        week = 0
+        while mask:
+            if mask & 1:
+                yield week
+            mask >>= 1
+            week += 1
+
+    def __len__(self) -> int:
+        return bin(self.mask).count('1')
+
+    def __bool__(self) -> bool:
+        return self.mask != 0
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, WeekSet) and self.mask == other.mask
+
+    def __hash__(self) -> int:
+        return hash(self.mask)
+
+    def __repr__(self) -> str:
+        return f'WeekSet({list(self)})'
+
+    def to_list(self) -> List[int]:
+        return list(self)
+
+    def to_string(self) -> str:
+        """字符串表示，与 `weeks_to_string(self.to_list())` 相同"""
+        return _mask_to_string(self.mask)
+
+
+@lru_cache(maxsize=4096)
+def _mask_to_string(mask: int) -> str:
+    # 一个学期内不同的周次组合很少，按位图缓存转换结果
+    return _weeks_to_string(list(WeekSet(mask)))
 
 
 def weeks_to_string(original_weeks: List[int]) -> str:
@@ -489,6 +1320,17 @@ def weeks_to_string(original_weeks: List[int]) -> str:
     :param original_weeks: int 类型的 list，每一个数字代表一个周次
     :return: 周次的字符串表示
     """
+    mask = 0
+    previous = 0
+    for week in original_weeks:
+        if week <= previous:
+            return _weeks_to_string(original_weeks)  # 不是严格递增的正整数序列，无法用位图表示，直接转换
+        mask |= 1 << week
+        previous = week
+    return _mask_to_string(mask)
+
+
+def _weeks_to_string(original_weeks: List[int]) -> str:
 
     def odd(num: int) -> bool:
         return num % 2 == 1
@@ -0,0 +1,146 @@
+"""
+对冲请求（hedged request），降低幂等 GET 调用的尾延迟。
+
+请求发出后如果在延迟阈值内没有返回，再向上游发出一个相同的请求，两者中先成功返回的作为结果。
+延迟阈值取该接口最近调用耗时的某个分位数（默认 p95），因此只有最慢的一小部分调用会触发对冲；对冲次数另外受预算限制，
+额外增加的请求数不超过总请求数的一定比例。
+
+两者中较慢的一方总是被取消，释放它占用的连接和协程。分位数只由先发出的请求的耗时计算：如果记录调用方实际等待的时间
+（两者中较快的一方），每次对冲后分位数都会偏低，阈值随之下降，触发更多对冲。对冲请求胜出时，先发出的请求在取消时已经等待的
+时间是其耗时的下限（截尾样本），这个值不小于当时的延迟阈值，作为该次调用的耗时记录，分位数不会因为对冲而下降。
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+import gevent
+
+from everyclass.rpc.retry import RetryBudget
+
+T = TypeVar('T')
+
+
+class _LatencyWindow:
+    """最近若干次调用的耗时，分位数每隔一段时间重新计算一次"""
+    __slots__ = ('samples', 'percentile', 'recompute_every', '_since_recompute', '_value')
+
+    def __init__(self, size: int, percentile: float, recompute_every: int = 16):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.percentile = percentile
+        self.recompute_every = recompute_every
+        self._since_recompute = 0
+        self._value: Optional[float] = None
+
+    def observe(self, latency: float) -> None:
+        self.samples.append(latency)
+        self._since_recompute += 1
+        if self._value is None or self._since_recompute >= self.recompute_every:
+            ordered = sorted(self.samples)
+            self._value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+            self._since_recompute = 0
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._value
+
+
+class HedgePolicy:
+    """对冲策略
+
+    :param percentile: 以该接口最近调用耗时的这个分位数作为发出对冲请求前的等待时间
+    :param min_delay: 等待时间下限（秒）
+    :param max_delay: 等待时间上限（秒），样本不足时也使用该值
+    :param min_samples: 样本数达到该值后才使用分位数
+    :param window: 每个接口保留的耗时样本数
+    :param budget_ratio: 对冲请求数占请求数的比例上限
+    :param max_burst: 允许连续发出的对冲请求数
+    """
+
+    def __init__(self, percentile: float = 95, min_delay: float = 0.01, max_delay: float = 1.0,
+                 min_samples: int = 20, window: int = 500, budget_ratio: float = 0.05, max_burst: float = 10):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = RetryBudget(ratio=budget_ratio, min_per_second=0, max_tokens=max_burst)
+        self._windows: Dict[str, _LatencyWindow] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _window_of(self, key: str) -> _LatencyWindow:
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _LatencyWindow(self.window, self.percentile)
+        return window
+
+    def _count(self, key: str, name: str) -> None:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {'calls': 0, 'hedged': 0, 'hedge_won': 0, 'budget_exhausted': 0}
+        stats[name] += 1
+
+    def delay(self, key: str) -> float:
+        """接口 `key` 发出对冲请求前的等待时间（秒）"""
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or len(window.samples) < self.min_samples or window.value is None:
+                return self.max_delay
+            return min(self.max_delay, max(self.min_delay, window.value))
+
+    def observe(self, key: str, latency: float) -> None:
+        """记录一次成功调用（不含对冲请求）的耗时"""
+        with self._lock:
+            self._window_of(key).observe(latency)
+
+    def stats(self) -> Dict[str, Dict]:
+        """各接口的调用数、对冲次数、对冲请求胜出次数、因预算不足未对冲的次数，以及当前的等待时间"""
+        with self._lock:
+            keys = list(self._stats)
+        return {key: dict(self._stats[key], delay=self.delay(key)) for key in keys}
+
+    def run(self, key: str, fn: Callable[[], T]) -> T:
+        """执行 `fn()`，超过等待时间没有返回时在新的协程中再执行一次 `fn()`，返回先成功的结果
+
+        先成功的一方胜出，另一方被取消。对冲的调用胜出时，以取消时先发出的调用已经等待的时间作为该次调用的耗时记录。
+        两者都失败时抛出先发出的调用的异常。`fn` 必须是幂等的。
+        """
+        self.budget.deposit()
+        with self._lock:
+            self._count(key, 'calls')
+        started = time.monotonic()
+        primary = _spawn(fn)
+        greenlets = [primary]
+        try:
+            primary.join(timeout=self.delay(key))
+            if not primary.ready():
+                hedging = self.budget.withdraw()
+                with self._lock:
+                    self._count(key, 'hedged' if hedging else 'budget_exhausted')
+                if hedging:
+                    greenlets.append(_spawn(fn))
+            pending = list(greenlets)
+            while pending:
+                done = gevent.wait(pending, count=1)[0]
+                pending.remove(done)
+                if done.successful():
+                    if done is primary:
+                        self.observe(key, time.monotonic() - started)
+                    else:
+                        with self._lock:
+                            self._count(key, 'hedge_won')
+                        if not primary.ready():  # 先发出的调用即将被取消，记录它已经等待的时间（截尾样本）
+                            self.observe(key, time.monotonic() - started)
+                    return done.value
+            return primary.get()  # 都失败了
+        finally:
+            for greenlet in greenlets:
+                if not greenlet.ready():
+                    greenlet.kill(block=False)  # 取消较慢的一方
+
+
+def _spawn(fn: Callable[[], T]) -> gevent.Greenlet:
+    """在新的协程中执行 `fn`，沿用当前的 contextvars（如 `deadline_scope`、`trace_scope`）"""
+    return gevent.spawn(contextvars.copy_context().run, fn)
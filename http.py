@@ -1,60 +1,416 @@
-from typing import Dict
+import contextlib
+import contextvars
+import time
+from typing import Dict, NamedTuple, Optional, Tuple, Union
 
 import gevent
 import requests
+import urllib3.exceptions
 
-from everyclass.rpc import RpcBadRequest, RpcClientException, RpcResourceNotFound, RpcServerException, RpcTimeout
+from everyclass.rpc import RpcBadRequest, RpcClientException, RpcResourceNotFound, RpcServerException, \
+    RpcServerNotAvailable, RpcTimeout
+from everyclass.rpc.balancer import registry as balancers
+from everyclass.rpc.circuit_breaker import registry as circuit_breakers
+from everyclass.rpc import compression, interceptors, metrics
+from everyclass.rpc.codec import MSGPACK_ACCEPT, codec_for, get_codec, msgpack_available
+from everyclass.rpc.hedge import HedgePolicy
+from everyclass.rpc.interceptors import RpcRequest, RpcResponse
+from everyclass.rpc.retry import RetryBudget, RetryPolicy
+from everyclass.rpc.session import registry as session_registry
+
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'  # remaining budget of the request in milliseconds
+CHUNK_SIZE = 64 * 1024  # response bodies are read and decompressed in chunks of this size
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar('everyclass_rpc_deadline', default=None)
+
+
+def raise_for_status(status_code: int, text: str) -> None:
+    """raise exception if HTTP status code is 4xx or 5xx"""
+    if status_code == 503:
+        raise RpcServerNotAvailable(status_code, text)
+    if status_code >= 500:
+        raise RpcServerException(status_code, text)
+    if 400 <= status_code < 500:
+        if status_code == 404:
+            raise RpcResourceNotFound(status_code, text)
+        if status_code == 400:
+            raise RpcBadRequest(status_code, text)
+        raise RpcClientException(status_code, text)
+
+
+class Timeout(NamedTuple):
+    """connect and read timeout of a single HTTP attempt, in seconds"""
+    connect: float
+    read: float
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds: float):
+    """limit every RPC made inside the block to finish within `seconds` from now
+
+    Scopes can be nested, the earliest deadline wins. Usage:
+
+    ```
+    with deadline_scope(2):
+        Entity.get_student(student_id)
+        Entity.get_student_timetable(student_id, semester)  # shares the remaining budget
+    ```
+    """
+    deadline_at = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None and outer < deadline_at:
+        deadline_at = outer
+    token = _deadline.set(deadline_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class _CallState:
+    """request preparation and per-attempt bookkeeping (deadline, circuit breaker, load balancer, retries,
+    interceptors and metrics) of one call, shared by `HttpRpc.call` and `AsyncHttpRpc.call`. The clients only send
+    the attempts, sleep between them and detect cancellation in their own way"""
+
+    def __init__(self, method: str, url: str, params, retry: Optional[bool], data, headers: Dict,
+                 timeout: Union[None, float, Tuple[float, float]], deadline: Optional[float],
+                 idempotent: Optional[bool], retry_policy: Optional[RetryPolicy], service: Optional[str],
+                 endpoint: Optional[str], prefer_msgpack: bool):
+        if method not in ('GET', 'POST'):
+            raise NotImplementedError("Unsupported HTTP method {}".format(method))
+        self.method = method
+        self.url = url
+        self.retry = retry
+        self.balancer = balancers.get(url)
+        self.breaker = circuit_breakers.get(url)
+        self.attempt_timeout = HttpRpc._timeout_of(url, timeout)
+        self.deadline_at = time.monotonic() + (deadline if deadline is not None else HttpRpc.DEFAULT_DEADLINE)
+        scope_deadline = _deadline.get()
+        if scope_deadline is not None and scope_deadline < self.deadline_at:
+            self.deadline_at = scope_deadline
+        self.service = service or metrics.service_of(url)
+        self.endpoint = endpoint or metrics.endpoint_template(url)
+        self.request = None
+        if interceptors.chain:
+            self.request = RpcRequest(method, url, self.service, self.endpoint, headers, params, data)
+            interceptors.chain.before_request(self.request)
+            headers, params, data = self.request.headers, self.request.params, self.request.data
+        self.params = params
+        self.headers = headers
+        self.idempotent = idempotent if idempotent is not None else method == 'GET'
+        json_codec = get_codec()
+        self.body = None
+        self.request_bytes_saved = 0
+        self.compression_seconds = 0.0
+        if data is not None:
+            self.body = json_codec.dumps(data)
+            headers['Content-Type'] = json_codec.content_type
+            compressed, content_encoding, self.compression_seconds = compression.settings.compress_body(self.body)
+            if content_encoding is not None:
+                self.request_bytes_saved = len(self.body) - len(compressed)
+                self.body = compressed
+                headers['Content-Encoding'] = content_encoding
+        headers.setdefault('Accept-Encoding', compression.settings.accept_header)
+        if prefer_msgpack and msgpack_available():
+            headers.setdefault('Accept', MSGPACK_ACCEPT)
+        self.policy = retry_policy or HttpRpc.retry_policy
+        self.policy.on_request()
+
+        self.call_started = time.monotonic()
+        self.status = metrics.STATUS_ERROR
+        self.response_bytes = 0
+        self.wire_bytes = 0
+        self.decode_seconds = 0.0
+        self.network_seconds = 0.0
+        self.attempt = 0
+        self.replica = None
+        self.started = 0.0
+
+    def next_attempt(self) -> Tuple[str, float]:
+        """start the next attempt and return its URL and remaining budget. raises when the deadline has passed or
+        the circuit breaker is open"""
+        from everyclass.rpc import _logger
+        remaining = self.deadline_at - time.monotonic()
+        if remaining <= 0:
+            self.status = metrics.STATUS_TIMEOUT
+            raise RpcTimeout('Timeout when calling {}. Tried {} time(s).'.format(self.url, self.attempt))
+        self.attempt += 1
+        self.headers[DEADLINE_HEADER] = str(int(remaining * 1000))
+        if self.breaker is not None and not self.breaker.allow():
+            self.status = metrics.STATUS_REJECTED
+            raise RpcServerNotAvailable('Circuit breaker {} is open, call to {} rejected'.format(self.breaker.name,
+                                                                                               self.url))
+        self.replica = None
+        target_url = self.url
+        if self.balancer is not None:
+            try:
+                self.replica = self.balancer.pick()  # every attempt may go to a different replica
+            except RpcServerNotAvailable:
+                if self.breaker is not None:
+                    self.breaker.release()  # no request was sent, give back what `allow` granted
+                raise
+            target_url = self.balancer.resolve(self.url, self.replica)
+        if _logger:
+            _logger.debug('Call {} {}'.format(self.method, target_url))
+        self.started = time.monotonic()
+        return target_url, remaining
+
+    def attempt_failed(self, error: Exception, timed_out: bool, target_url: str) -> None:
+        """the attempt got no response. raises `RpcTimeout` or `RpcServerNotAvailable` unless it will be retried
+
+        :param error: the transport error, or an `RpcTimeout` caused by it when the deadline was hit
+        """
+        elapsed = time.monotonic() - self.started
+        self.network_seconds += elapsed
+        if self.replica is not None:
+            self.balancer.release(self.replica, False)
+        if self.breaker is not None:
+            self.breaker.record(False, elapsed)
+        self.status = metrics.STATUS_TIMEOUT if timed_out else metrics.STATUS_ERROR
+        cause = error.__cause__ if isinstance(error, RpcTimeout) else error
+        if self.retry is False or not self.policy.should_retry(self.attempt, self.idempotent, error=cause):
+            if isinstance(error, RpcTimeout):
+                raise error
+            if timed_out:
+                raise RpcTimeout('Timeout when calling {}. Tried {} time(s).'.format(self.url, self.attempt)) \
+                    from error
+            raise RpcServerNotAvailable('Failed to connect {}: {}'.format(target_url, repr(error))) from error
+
+    def attempt_aborted(self) -> None:
+        """the attempt was interrupted by something other than a transport error, e.g. cancellation. its outcome
+        is unknown, so neither the breaker nor the replica count it"""
+        if self.breaker is not None:
+            self.breaker.release()
+        if self.replica is not None:
+            self.balancer.release(self.replica, None)
+
+    def attempt_answered(self, status_code: int, body: compression.StreamDecoder) -> bool:
+        """the attempt got a response. returns whether it is final, otherwise the call is retried"""
+        self.network_seconds += time.monotonic() - self.started - body.seconds
+        if self.replica is not None:
+            self.balancer.release(self.replica, status_code < 500)
+        self.status = str(status_code)
+        if self.breaker is not None:
+            self.breaker.record(status_code < 500, time.monotonic() - self.started)
+        return status_code < 400 or self.retry is False or \
+            not self.policy.should_retry(self.attempt, self.idempotent, status_code=status_code)
+
+    def finish(self, status_code: int, content_type: Optional[str], body: compression.StreamDecoder) -> Dict:
+        """decode the final response, raising for 4xx and 5xx status codes"""
+        from everyclass.rpc import _logger
+        content = body.finish()
+        self.compression_seconds += body.seconds
+        if status_code >= 400:
+            raise_for_status(status_code, content.decode('utf-8', 'replace'))
+        self.response_bytes = len(content)
+        self.wire_bytes = body.wire_bytes
+        decode_started = time.monotonic()
+        response_json = codec_for(content_type).loads(content)
+        self.decode_seconds = time.monotonic() - decode_started
+        if _logger:
+            _logger.debug(f'Got RPC result: {response_json}', extra={"rpc_result": response_json})
+        if self.request is not None:
+            interceptors.chain.after_response(self.request, RpcResponse(status_code, response_json, self.attempt,
+                                                                        self.response_bytes, self.network_seconds,
+                                                                        self.decode_seconds))
+        return response_json
+
+    def backoff(self) -> float:
+        """seconds to wait before the next attempt, never past the deadline"""
+        return min(self.policy.backoff(self.attempt), max(self.deadline_at - time.monotonic(), 0))
+
+    def cancelled(self) -> None:
+        self.status = metrics.STATUS_CANCELLED
+
+    def failed(self, error: Exception) -> None:
+        if self.request is not None:
+            interceptors.chain.on_error(self.request, error)
+
+    def record(self) -> None:
+        metrics.registry.record_call(metrics.CallRecord(service=self.service,
+                                                        endpoint=self.endpoint,
+                                                        method=self.method,
+                                                        status=self.status,
+                                                        latency=time.monotonic() - self.call_started,
+                                                        retries=max(self.attempt - 1, 0),
+                                                        response_bytes=self.response_bytes,
+                                                        decode_seconds=self.decode_seconds,
+                                                        wire_bytes=self.wire_bytes,
+                                                        request_bytes_saved=self.request_bytes_saved,
+                                                        compression_seconds=self.compression_seconds))
 
 
 class HttpRpc:
+    DEFAULT_TIMEOUT = Timeout(connect=1.0, read=5.0)
+    DEFAULT_DEADLINE = 10.0  # overall budget of one call, retries included
+
+    _endpoint_timeouts: Dict[str, Timeout] = {}
+
+    retry_policy: RetryPolicy = RetryPolicy(budget=RetryBudget())
+    hedge_policy: Optional[HedgePolicy] = None
+
     @classmethod
-    def _status_code_raise(cls, response: requests.Response) -> None:
-        """
-        raise exception if HTTP status code is 4xx or 5xx
+    def set_retry_policy(cls, policy: RetryPolicy) -> None:
+        """replace the process-wide retry policy"""
+        cls.retry_policy = policy
 
-        :param response: a `Response` object
-        """
-        status_code = response.status_code
-        if status_code >= 500:
-            raise RpcServerException(status_code, response.text)
-        if 400 <= status_code < 500:
-            if status_code == 404:
-                raise RpcResourceNotFound(status_code, response.text)
-            if status_code == 400:
-                raise RpcBadRequest(status_code, response.text)
-            raise RpcClientException(status_code, response.text)
-
-    @classmethod
-    def call(cls, method: str, url: str, params=None, retry: bool = False, data=None, headers=None) -> Dict:
+    @classmethod
+    def set_hedge_policy(cls, policy: Optional[HedgePolicy]) -> None:
+        """set the default policy of `hedged_call`. None disables hedging"""
+        cls.hedge_policy = policy
+
+    @classmethod
+    def set_default_timeout(cls, connect: float = None, read: float = None, deadline: float = None) -> None:
+        """change the default timeouts used when neither the call nor the endpoint specifies one"""
+        cls.DEFAULT_TIMEOUT = Timeout(connect=connect if connect is not None else cls.DEFAULT_TIMEOUT.connect,
+                                      read=read if read is not None else cls.DEFAULT_TIMEOUT.read)
+        if deadline is not None:
+            cls.DEFAULT_DEADLINE = deadline
+
+    @classmethod
+    def set_endpoint_timeout(cls, url_prefix: str, connect: float, read: float) -> None:
+        """set timeouts for every URL starting with `url_prefix`. the longest matching prefix wins."""
+        cls._endpoint_timeouts[url_prefix] = Timeout(connect=connect, read=read)
+
+    @classmethod
+    def _timeout_of(cls, url: str, timeout: Union[None, float, Tuple[float, float]]) -> Timeout:
+        if timeout is not None:
+            if isinstance(timeout, tuple):
+                return Timeout(*timeout)
+            return Timeout(connect=timeout, read=timeout)
+        matched = None
+        for prefix in cls._endpoint_timeouts:
+            if url.startswith(prefix) and (matched is None or len(prefix) > len(matched)):
+                matched = prefix
+        return cls._endpoint_timeouts[matched] if matched is not None else cls.DEFAULT_TIMEOUT
+
+    @classmethod
+    def pool_stats(cls) -> Dict:
+        """connection pool statistics of every upstream, see `SessionRegistry.stats`"""
+        return session_registry.stats()
+
+    @classmethod
+    def circuit_breaker_stats(cls) -> Dict:
+        """state and recent counters of every circuit breaker"""
+        return circuit_breakers.stats()
+
+    @classmethod
+    def balancer_stats(cls) -> Dict:
+        """per-replica state of every client-side load balancer, see `everyclass.rpc.balancer`"""
+        return balancers.stats()
+
+    @classmethod
+    def metrics_stats(cls) -> Dict:
+        """per-endpoint call metrics, see `MetricsRegistry.stats`"""
+        return metrics.registry.stats()
+
+    @classmethod
+    def _send(cls, session: requests.Session, method: str, url: str, remaining: float, attempt_timeout: Timeout,
+              **kwargs) -> Tuple[requests.Response, compression.StreamDecoder]:
+        """send one attempt and read the whole body, bounded by both the per-attempt timeout and the remaining budget.
+        the body is decompressed chunk by chunk as it arrives"""
+        budget = gevent.Timeout(remaining)
+        budget.start()
+        try:
+            response = session.request(method, url,
+                                       timeout=(min(attempt_timeout.connect, remaining),
+                                                min(attempt_timeout.read, remaining)),
+                                       stream=True,
+                                       **kwargs)
+            try:
+                body = compression.decode_stream(response.headers.get('Content-Encoding'),
+                                                 response.raw.stream(CHUNK_SIZE, decode_content=False))
+            except BaseException:
+                response.close()
+                raise
+            return response, body
+        except urllib3.exceptions.ReadTimeoutError as e:  # errors raised while reading the body
+            raise requests.exceptions.ReadTimeout(e) from e
+        except urllib3.exceptions.ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e) from e
+        except compression.DecompressionError as e:
+            raise requests.exceptions.ContentDecodingError(e) from e
+        except gevent.Timeout as e:
+            if e is not budget:
+                raise  # timeout set by the caller, not ours
+            raise RpcTimeout('Deadline exceeded when calling {}'.format(url)) from e
+        finally:
+            budget.close()
+
+    @classmethod
+    def call(cls, method: str, url: str, params=None, retry: Optional[bool] = None, data=None, headers=None,
+             timeout: Union[None, float, Tuple[float, float]] = None, deadline: Optional[float] = None,
+             idempotent: Optional[bool] = None, retry_policy: Optional[RetryPolicy] = None,
+             service: Optional[str] = None, endpoint: Optional[str] = None,
+             prefer_msgpack: bool = False) -> Dict:
         """call HTTP API. if server returns 4xx or 500 status code, raise exceptions.
 
         :param method: HTTP method. Support GET or POST at the moment.
         :param url: URL of the HTTP endpoint
         :param params: parameters when calling RPC
-        :param retry: if set to True, will automatically retry
+        :param retry: set to False to disable retrying. by default idempotent calls are retried on retryable errors,
+                      and non-idempotent ones only when the request never reached the server
         :param data: json data along with the request
         :param headers: custom headers
+        :param timeout: connect and read timeout of each attempt, a number or a (connect, read) tuple. defaults to
+                        the endpoint timeout or `DEFAULT_TIMEOUT`
+        :param deadline: overall budget in seconds covering all attempts. defaults to `DEFAULT_DEADLINE`, and is
+                         shortened by any enclosing `deadline_scope`
+        :param idempotent: whether the call is safe to repeat. defaults to True for GET and False otherwise
+        :param retry_policy: overrides `HttpRpc.retry_policy` for this call
+        :param service: service name used as the metrics label, defaults to the upstream host
+        :param endpoint: endpoint template used as the metrics label, defaults to `metrics.endpoint_template(url)`
+        :param prefer_msgpack: ask the upstream for MessagePack when msgpack is installed. the response is decoded
+                               according to its Content-Type, so upstreams that only speak JSON still work
         """
-        from everyclass.rpc import _logger
-        api_session = requests.sessions.session()
-        trial_total = 5 if retry else 1
-        trial = 0
-        while trial < trial_total:
-            try:
-                if _logger:
-                    _logger.debug('Call {} {}'.format(method, url))
-                if method == 'GET':
-                    api_response = api_session.get(url, params=params, json=data, headers=headers)
-                elif method == 'POST':
-                    api_response = api_session.post(url, params=params, json=data, headers=headers)
+        state = _CallState(method, url, params, retry, data, dict(headers) if headers else {}, timeout, deadline,
+                           idempotent, retry_policy, service, endpoint, prefer_msgpack)
+        try:
+            while True:
+                target_url, remaining = state.next_attempt()
+                try:
+                    api_response, response_body = cls._send(session_registry.get(target_url), method, target_url,
+                                                            remaining, state.attempt_timeout, params=state.params,
+                                                            data=state.body, headers=state.headers)
+                except (RpcTimeout, requests.exceptions.RequestException) as e:
+                    state.attempt_failed(e, isinstance(e, (RpcTimeout, requests.exceptions.Timeout)), target_url)
+                except BaseException:
+                    state.attempt_aborted()
+                    raise
                 else:
-                    raise NotImplementedError("Unsupported HTTP method {}".format(method))
-            except gevent.timeout.Timeout:
-                trial += 1
-                continue
-            cls._status_code_raise(api_response)
-            response_json = api_response.json()
-            if _logger:
-                _logger.debug(f'Got RPC result: {response_json}', extra={"rpc_result": response_json})
-            return response_json
-        raise RpcTimeout('Timeout when calling {}. Tried {} time(s).'.format(url, trial_total))
+                    if state.attempt_answered(api_response.status_code, response_body):
+                        return state.finish(api_response.status_code, api_response.headers.get('Content-Type'),
+                                            response_body)
+                gevent.sleep(state.backoff())
+        except gevent.GreenletExit:
+            state.cancelled()
+            raise
+        except Exception as e:
+            state.failed(e)
+            raise
+        finally:
+            state.record()
+
+    @classmethod
+    def hedged_call(cls, method: str, url: str, hedge_policy: Optional[HedgePolicy] = None, **kwargs) -> Dict:
+        """`call` with hedging: if no response arrives within the policy's delay, send the same request again and
+        return whichever succeeds first, cancelling the other. Only idempotent GETs are hedged, others fall back to
+        `call`.
+
+        :param hedge_policy: overrides `HttpRpc.hedge_policy` for this call
+        :param kwargs: other parameters of `call`
+        """
+        policy = hedge_policy or cls.hedge_policy
+        if policy is None or method != 'GET' or kwargs.get('idempotent') is False:
+            return cls.call(method, url, **kwargs)
+        key = '{} {}'.format(kwargs.get('service') or metrics.service_of(url),
+                             kwargs.get('endpoint') or metrics.endpoint_template(url))
+
+        def attempt():
+            return cls.call(method, url, **kwargs), interceptors._responded.get()
+
+        # attempts run in copies of the context, bring the winner's request back for `after_construct`
+        result, request = policy.run(key, attempt)
+        if request is not None:
+            interceptors._responded.set(request)
+        return result
@@ -1,18 +1,21 @@
 # flake8: noqa
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Dict, List, Sequence, Union
 
-from everyclass.rpc import ensure_slots
+from everyclass.rpc import decodable
+from everyclass.rpc.balancer import configure_base_url
 from everyclass.rpc.http import HttpRpc
 
 BASE_URL = 'everyclass-identity'
 
 
-def set_base_url(base_url: str) -> None:
+def set_base_url(base_url: Union[str, Sequence[str]], **balancer_options) -> None:
+    """设置服务地址，参数同 `Entity.set_base_url`"""
     global BASE_URL
-    BASE_URL = base_url
+    BASE_URL = configure_base_url('identity', base_url, **balancer_options)
 
 
+@decodable()
 @dataclass
 class GeneralResponse:
     success: bool
@@ -21,9 +24,10 @@ class GeneralResponse:
 
     @classmethod
     def make(cls, dct: Dict) -> "GeneralResponse":
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct)
 
 
+@decodable()
 @dataclass
 class EmailSetPasswordResponse:
     success: bool
@@ -33,9 +37,10 @@ class EmailSetPasswordResponse:
 
     @classmethod
     def make(cls, dct: Dict) -> "EmailSetPasswordResponse":
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct)
 
 
+@decodable()
 @dataclass
 class RegisterByPasswordResponse:
     success: bool
@@ -45,9 +50,10 @@ class RegisterByPasswordResponse:
 
     @classmethod
     def make(cls, dct: Dict) -> "RegisterByPasswordResponse":
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct)
 
 
+@decodable()
 @dataclass
 class PasswordStrengthResponse:
     success: bool
@@ -56,9 +62,10 @@ class PasswordStrengthResponse:
 
     @classmethod
     def make(cls, dct: Dict) -> "PasswordStrengthResponse":
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct)
 
 
+@decodable()
 @dataclass
 class Visitor:
     name: str
@@ -68,9 +75,10 @@ class Visitor:
 
     @classmethod
     def make(cls, dct: Dict) -> "Visitor":
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct)
 
 
+@decodable()
 @dataclass
 class VisitorsResponse:
     success: bool
@@ -79,13 +87,19 @@ class VisitorsResponse:
 
     @classmethod
     def make(cls, dct: Dict) -> "VisitorsResponse":
-        dct['visitors'] = [Visitor.make(x) for x in dct['visitors']]
-        return cls(**ensure_slots(cls, dct))
+        return cls._decode(dct, visitors=[Visitor.make(x) for x in dct['visitors']])
+
+
+class _IdentityService:
+    @classmethod
+    def _call(cls, decode, **kwargs):
+        """调用 identity 接口并用 `decode` 转换响应"""
+        return decode(HttpRpc.call(service='identity', **kwargs))
 
 
 # err_code 除了以下每个注释里写的之外还包括 408，500，400
 
-class Login:
+class Login(_IdentityService):
     @classmethod
     def login(cls, student_id: str, password: str, captcha_ticket: str, captcha_rand: str, remote_addr: str):
         """登录
@@ -101,18 +115,18 @@ class Login:
             ValueError("Empty Student ID")
         if not password:
             raise ValueError("Empty password")
-        resp = HttpRpc.call(method='GET',
-                            url=f'{BASE_URL}/login',
-                            data={'student_id'    : student_id,
-                                  'password'      : password,
-                                  'captcha_ticket': captcha_ticket,
-                                  'captcha_rand'  : captcha_rand,
-                                  'remote_addr'   : remote_addr},
-                            retry=True)
-        return GeneralResponse.make(resp)
-
-
-class Register:
+        return cls._call(GeneralResponse.make,
+                         method='GET',
+                         url=f'{BASE_URL}/login',
+                         data={'student_id'    : student_id,
+                               'password'      : password,
+                               'captcha_ticket': captcha_ticket,
+                               'captcha_rand'  : captcha_rand,
+                               'remote_addr'   : remote_addr},
+                         retry=True)
+
+
+class Register(_IdentityService):
     @classmethod
     def register(cls, student_id: str):
         """检查学号是否已注册
@@ -123,11 +137,11 @@ class Register:
         if not student_id:
             raise ValueError("Empty student ID")
 
-        resp = HttpRpc.call(method='GET',
-                            url=f'{BASE_URL}/register',
-                            data={'student_id': student_id},
-                            retry=True)
-        return GeneralResponse.make(resp)
+        return cls._call(GeneralResponse.make,
+                         method='GET',
+                         url=f'{BASE_URL}/register',
+                         data={'student_id': student_id},
+                         retry=True)
 
     @classmethod
     def register_by_email(cls, student_id: str):
@@ -140,11 +154,11 @@ class Register:
         if not student_id:
             raise ValueError("Empty student ID")
 
-        resp = HttpRpc.call(method='POST',
-                            url=f'{BASE_URL}/register/byEmail',
-                            data={'student_id': student_id},
-                            retry=True)
-        return GeneralResponse.make(resp)
+        return cls._call(GeneralResponse.make,
+                         method='POST',
+                         url=f'{BASE_URL}/register/byEmail',
+                         data={'student_id': student_id},
+                         retry=True)
 
     @classmethod
     def verify_email_token(cls, token: str):
@@ -156,11 +170,11 @@ class Register:
         if not token:
             raise ValueError("Empty token")
 
-        resp = HttpRpc.call(method='GET',
-                            url=f'{BASE_URL}/register/emailVerification',
-                            data={'token': token},
-                            retry=True)
-        return GeneralResponse.make(resp)
+        return cls._call(GeneralResponse.make,
+                         method='GET',
+                         url=f'{BASE_URL}/register/emailVerification',
+                         data={'token': token},
+                         retry=True)
 
     @classmethod
     def email_set_password(cls, token: str, password: str):
@@ -176,12 +190,12 @@ class Register:
         if not password:
             raise ValueError("Empty password")
 
-        resp = HttpRpc.call(method='POST',
-                            url=f'{BASE_URL}/register/emailVerification',
-                            data={'token'   : token,
-                                  'password': password},
-                            retry=True)
-        return EmailSetPasswordResponse.make(resp)
+        return cls._call(EmailSetPasswordResponse.make,
+                         method='POST',
+                         url=f'{BASE_URL}/register/emailVerification',
+                         data={'token'   : token,
+                               'password': password},
+                         retry=True)
 
     @classmethod
     def register_by_password(cls, student_id: str, password: str, jw_password: str, captcha_ticket: str,
@@ -201,16 +215,16 @@ class Register:
         if not jw_password:
             raise ValueError("Empty JW password")
 
-        resp = HttpRpc.call(method='POST',
-                            url=f'{BASE_URL}/register/byPassword',
-                            data={'student_id'    : student_id,
-                                  'password'      : password,
-                                  'jw_password'   : jw_password,
-                                  'captcha_ticket': captcha_ticket,
-                                  'captcha_rand'  : captcha_rand,
-                                  'remote_addr'   : remote_addr},
-                            retry=True)
-        return RegisterByPasswordResponse.make(resp)
+        return cls._call(RegisterByPasswordResponse.make,
+                         method='POST',
+                         url=f'{BASE_URL}/register/byPassword',
+                         data={'student_id'    : student_id,
+                               'password'      : password,
+                               'jw_password'   : jw_password,
+                               'captcha_ticket': captcha_ticket,
+                               'captcha_rand'  : captcha_rand,
+                               'remote_addr'   : remote_addr},
+                         retry=True)
 
     @classmethod
     def check_password_strength(cls, password: str):
@@ -218,11 +232,11 @@ class Register:
         if not password:
             raise ValueError("Empty password")
 
-        resp = HttpRpc.call(method='GET',
-                            url=f'{BASE_URL}/register/passwordStrengthCheck',
-                            data={'password': password},
-                            retry=True)
-        return PasswordStrengthResponse.make(resp)
+        return cls._call(PasswordStrengthResponse.make,
+                         method='GET',
+                         url=f'{BASE_URL}/register/passwordStrengthCheck',
+                         data={'password': password},
+                         retry=True)
 
     @classmethod
     def password_verification_status(cls, request_id: str):
@@ -238,14 +252,14 @@ class Register:
         if not request_id:
             raise ValueError("Empty request ID")
 
-        resp = HttpRpc.call(method='GET',
-                            url=f'{BASE_URL}/register/byPassword/statusRefresh',
-                            data={'request_id': request_id},
-                            retry=True)
-        return GeneralResponse.make(resp)
+        return cls._call(GeneralResponse.make,
+                         method='GET',
+                         url=f'{BASE_URL}/register/byPassword/statusRefresh',
+                         data={'request_id': request_id},
+                         retry=True)
 
 
-class UserCentre:
+class UserCentre(_IdentityService):
     @classmethod
     def set_privacy_level(cls, student_id: str, privacy_level: int):
         """设置隐私级别
@@ -258,12 +272,13 @@ class UserCentre:
         if privacy_level is None:  # avoid 0
             raise ValueError("Empty privacy level")
 
-        resp = HttpRpc.call(method='POST',
-                            url=f'{BASE_URL}/setPreference',
-                            data={'privacy_level': privacy_level},
-                            headers={'STUDENT_ID': student_id},
-                            retry=True)
-        return GeneralResponse.make(resp)
+        return cls._call(GeneralResponse.make,
+                         method='POST',
+                         url=f'{BASE_URL}/setPreference',
+                         data={'privacy_level': privacy_level},
+                         headers={'STUDENT_ID': student_id},
+                         retry=True,
+                         idempotent=True)
 
     @classmethod
     def reset_calendar_token(cls, student_id: str):
@@ -272,11 +287,11 @@ class UserCentre:
         if not student_id:
             raise ValueError("Empty student ID")
 
-        resp = HttpRpc.call(method='POST',
-                            url=f'{BASE_URL}/resetCalendarToken',
-                            headers={'STUDENT_ID': student_id},
-                            retry=True)
-        return GeneralResponse.make(resp)
+        return cls._call(GeneralResponse.make,
+                         method='POST',
+                         url=f'{BASE_URL}/resetCalendarToken',
+                         headers={'STUDENT_ID': student_id},
+                         retry=True)
 
     @classmethod
     def get_visitors(cls, student_id: str):
@@ -285,8 +300,8 @@ class UserCentre:
         if not student_id:
             raise ValueError("Empty student ID")
 
-        resp = HttpRpc.call(method='GET',
-                            url=f'{BASE_URL}/visitors',
-                            headers={'STUDENT_ID': student_id},
-                            retry=True)
-        return VisitorsResponse.make(resp)
+        return cls._call(VisitorsResponse.make,
+                         method='GET',
+                         url=f'{BASE_URL}/visitors',
+                         headers={'STUDENT_ID': student_id},
+                         retry=True)
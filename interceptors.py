@@ -0,0 +1,298 @@
+"""
+RPC 调用拦截器。
+
+拦截器在每次调用（包含所有重试）的开始、成功和失败时被依次调用，用于实现请求头注入、日志、链路追踪、性能剖析等横切逻辑。
+通过 `everyclass.rpc.init(interceptors=[...])` 配置，按列表顺序调用 `before_request`，按相反顺序调用 `after_response` 和
+`on_error`。
+
+```
+class Tagging(Interceptor):
+    def before_request(self, request):
+        request.headers["X-Caller"] = "everyclass-server"
+```
+"""
+import contextlib
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+
+class RpcRequest:
+    """一次调用的请求信息。`before_request` 可以修改 `headers`、`params` 和 `data`，`context` 用于在各阶段之间传递状态"""
+    __slots__ = ('method', 'url', 'service', 'endpoint', 'headers', 'params', 'data', 'context')
+
+    def __init__(self, method: str, url: str, service: str, endpoint: str, headers: Dict[str, str], params=None,
+                 data=None):
+        self.method = method
+        self.url = url
+        self.service = service
+        self.endpoint = endpoint
+        self.headers = headers
+        self.params = params
+        self.data = data
+        self.context: Dict[str, Any] = {}
+
+
+class RpcResponse:
+    """一次成功调用的结果和耗时"""
+    __slots__ = ('status_code', 'result', 'attempts', 'response_bytes', 'network_seconds', 'decode_seconds')
+
+    def __init__(self, status_code: int, result: Any, attempts: int, response_bytes: int, network_seconds: float,
+                 decode_seconds: float):
+        self.status_code = status_code
+        self.result = result
+        self.attempts = attempts
+        self.response_bytes = response_bytes
+        self.network_seconds = network_seconds  # 所有尝试中等待网络的时间
+        self.decode_seconds = decode_seconds  # JSON 解码耗时
+
+
+# 当前上下文中最近一次成功调用的请求，`after_construct` 由此找到结果对象对应的调用
+_responded: contextvars.ContextVar = contextvars.ContextVar('everyclass_rpc_responded', default=None)
+
+
+def responded_request(service: str, endpoint: str) -> Optional[RpcRequest]:
+    """在 `after_construct` 中返回该结果对象所对应调用的 `RpcRequest`（当前上下文中最近一次成功的同一接口调用），
+    可以读取 `before_request` 写入 `context` 的状态。无法确定时（如结果来自磁盘缓存）返回 None"""
+    request = _responded.get()
+    if request is None or request.service != service or request.endpoint != endpoint:
+        return None
+    return request
+
+
+class Interceptor:
+    """拦截器基类，按需覆盖以下方法"""
+
+    def before_request(self, request: RpcRequest) -> None:
+        """发出请求前调用，抛出异常会中止调用"""
+        pass
+
+    def after_response(self, request: RpcRequest, response: RpcResponse) -> None:
+        """调用成功后调用"""
+        pass
+
+    def on_error(self, request: RpcRequest, error: Exception) -> None:
+        """调用最终失败（重试之后）时调用，之后异常会继续抛给调用方"""
+        pass
+
+    def after_construct(self, service: str, endpoint: str, seconds: float) -> None:
+        """由响应构造结果对象（dataclass）之后调用，对应调用的请求可以通过 `responded_request` 获得"""
+        pass
+
+
+class InterceptorChain:
+    """按顺序组合多个拦截器"""
+
+    def __init__(self, interceptors: Sequence[Interceptor] = ()):
+        self.interceptors: List[Interceptor] = list(interceptors)
+
+    def __bool__(self) -> bool:
+        return bool(self.interceptors)
+
+    def set(self, interceptors: Sequence[Interceptor]) -> None:
+        self.interceptors = list(interceptors)
+
+    def add(self, interceptor: Interceptor) -> None:
+        self.interceptors.append(interceptor)
+
+    def before_request(self, request: RpcRequest) -> None:
+        _responded.set(None)
+        for interceptor in self.interceptors:
+            interceptor.before_request(request)
+
+    def after_response(self, request: RpcRequest, response: RpcResponse) -> None:
+        _responded.set(request)
+        for interceptor in reversed(self.interceptors):
+            interceptor.after_response(request, response)
+
+    def on_error(self, request: RpcRequest, error: Exception) -> None:
+        for interceptor in reversed(self.interceptors):
+            interceptor.on_error(request, error)
+
+    def after_construct(self, service: str, endpoint: str, seconds: float) -> None:
+        try:
+            for interceptor in reversed(self.interceptors):
+                interceptor.after_construct(service, endpoint, seconds)
+        finally:
+            _responded.set(None)
+
+
+class HeaderInterceptor(Interceptor):
+    """为请求添加固定的请求头
+
+    :param headers: 请求头，值也可以是无参函数，在每次调用时求值
+    :param services: 只对这些服务名生效，为 None 时对所有调用生效
+    """
+
+    def __init__(self, headers: Dict[str, Any], services: Sequence[str] = None):
+        self.headers = headers
+        self.services = set(services) if services is not None else None
+
+    def before_request(self, request: RpcRequest) -> None:
+        if self.services is not None and request.service not in self.services:
+            return
+        for name, value in self.headers.items():
+            value = value() if callable(value) else value
+            if value is not None:
+                request.headers.setdefault(name, value)
+
+
+class Span:
+    """一次 RPC 调用对应的 span"""
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'started_at', 'duration', 'status', 'error')
+
+    def __init__(self, trace_id: str, span_id: str, parent_id: Optional[str], name: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.status: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f'Span({self.name}, trace={self.trace_id}, span={self.span_id}, {self.duration * 1000:.1f}ms)'
+
+
+_trace_context: contextvars.ContextVar = contextvars.ContextVar('everyclass_rpc_trace', default=None)
+
+
+@contextlib.contextmanager
+def trace_scope(trace_id: str = None, parent_id: str = None):
+    """在代码块内的 RPC 调用使用同一个 trace ID（通常为上游请求传入的 ID），span 的父节点为 `parent_id`
+
+    ```
+    with trace_scope(*TracingInterceptor.parse(request.headers.get("traceparent"))):
+        Entity.get_student(student_id)
+    ```
+    """
+    token = _trace_context.set((trace_id or _new_id(16), parent_id))
+    try:
+        yield
+    finally:
+        _trace_context.reset(token)
+
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+class TracingInterceptor(Interceptor):
+    """链路追踪：以 W3C Trace Context（`traceparent` 请求头）向上游传递 trace ID，并为每次调用记录一个 span
+
+    不在 `trace_scope` 中的调用各自使用新的 trace ID。
+
+    :param recorder: 接收结束的 `Span` 的函数，如上报到追踪系统。为 None 时只保存在 `recent_spans` 中
+    :param keep: `recent_spans` 保留的 span 数量
+    """
+    HEADER = 'traceparent'
+
+    def __init__(self, recorder: Callable[[Span], None] = None, keep: int = 1000):
+        self.recorder = recorder
+        self.recent_spans: Deque[Span] = deque(maxlen=keep)
+
+    @staticmethod
+    def parse(traceparent: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """解析 `traceparent` 请求头，返回 (trace_id, parent_id)，格式不正确时返回 (None, None)"""
+        parts = (traceparent or '').split('-')
+        if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+            return parts[1], parts[2]
+        return None, None
+
+    def before_request(self, request: RpcRequest) -> None:
+        trace_id, parent_id = _trace_context.get() or (_new_id(16), None)
+        span = Span(trace_id, _new_id(8), parent_id, f'{request.method} {request.service}{request.endpoint}')
+        request.context['span'] = span
+        request.context['span_started'] = time.monotonic()
+        request.headers[self.HEADER] = f'00-{trace_id}-{span.span_id}-01'
+
+    def _finish(self, request: RpcRequest, status: Optional[int], error: Optional[Exception]) -> None:
+        span: Optional[Span] = request.context.get('span')
+        if span is None:
+            return
+        span.duration = time.monotonic() - request.context['span_started']
+        span.status = status
+        span.error = repr(error) if error is not None else None
+        self.recent_spans.append(span)
+        if self.recorder is not None:
+            self.recorder(span)
+
+    def after_response(self, request: RpcRequest, response: RpcResponse) -> None:
+        self._finish(request, response.status_code, None)
+
+    def on_error(self, request: RpcRequest, error: Exception) -> None:
+        status = error.args[0] if error.args and isinstance(error.args[0], int) else None  # RpcException 的状态码
+        self._finish(request, status, error)
+
+
+class SamplingProfiler(Interceptor):
+    """按比例采样调用，把耗时归因到网络等待、JSON 解码和结果对象构造三个阶段
+
+    是否采样在 `before_request` 中按调用决定，三个阶段的耗时都只来自被采样的调用。
+
+    :param sample_rate: 采样比例（0~1）
+    """
+
+    def __init__(self, sample_rate: float = 0.01):
+        self.sample_rate = sample_rate
+        self._profiles: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def _add(self, key: str, **seconds: float) -> None:
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is None:
+                profile = self._profiles[key] = {'calls': 0, 'network': 0.0, 'decode': 0.0, 'constructs': 0,
+                                                 'construct': 0.0}
+            for name, value in seconds.items():
+                profile[name] += value
+
+    def before_request(self, request: RpcRequest) -> None:
+        if self._sampled():
+            request.context['profile'] = True
+
+    def after_response(self, request: RpcRequest, response: RpcResponse) -> None:
+        if request.context.get('profile'):
+            self._add(f'{request.service} {request.endpoint}', calls=1, network=response.network_seconds,
+                      decode=response.decode_seconds)
+
+    def after_construct(self, service: str, endpoint: str, seconds: float) -> None:
+        request = responded_request(service, endpoint)
+        if request is not None and request.context.get('profile'):
+            self._add(f'{service} {endpoint}', constructs=1, construct=seconds)
+
+    def profile(self) -> Dict[str, Dict[str, float]]:
+        """各接口采样调用的平均耗时（秒）和各阶段所占比例"""
+        result = {}
+        with self._lock:
+            for key, profile in self._profiles.items():
+                network = profile['network'] / profile['calls'] if profile['calls'] else 0.0
+                decode = profile['decode'] / profile['calls'] if profile['calls'] else 0.0
+                construct = profile['construct'] / profile['constructs'] if profile['constructs'] else 0.0
+                total = network + decode + construct
+                result[key] = {'samples'        : profile['calls'],
+                               'network'        : network,
+                               'decode'         : decode,
+                               'construct'      : construct,
+                               'network_share'  : network / total if total else 0.0,
+                               'decode_share'   : decode / total if total else 0.0,
+                               'construct_share': construct / total if total else 0.0}
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._profiles = {}
+
+
+chain = InterceptorChain()
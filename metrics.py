@@ -0,0 +1,328 @@
+"""
+RPC 调用指标。
+
+每次调用按服务名（entity、auth、identity、captcha）和接口模板（如 `/student/{id}/timetable/{semester}`，而不是原始 URL）
+统计耗时直方图、状态码、重试次数、超时次数、响应字节数、JSON 解码耗时和结果对象构造耗时，以及压缩节省的字节数和压缩、解压
+耗时。
+
+指标先在进程内聚合（`registry.stats()`，或 `registry.render_prometheus()` 输出 Prometheus 文本格式），同时把每次调用的
+记录交给注册的 sink（如 `StatsdSink`）。记录一次调用只有几次字典查找和加法，可以在生产环境常开。
+"""
+import bisect
+import re
+import socket
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from everyclass.rpc.session import base_url_of
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # 耗时直方图的桶上界（秒）
+
+STATUS_TIMEOUT = 'timeout'  # 超时（包括总时限耗尽）
+STATUS_ERROR = 'error'  # 连接失败等没有得到响应的错误
+STATUS_REJECTED = 'rejected'  # 被熔断器拒绝
+STATUS_CANCELLED = 'cancelled'  # 被调用方取消（如对冲请求中较慢的一方）
+
+_SEMESTER = re.compile(r'^\d{4}-\d{4}-\d$')
+_DIGIT = re.compile(r'\d')
+
+
+def endpoint_template(url: str) -> str:
+    """由 URL 得到接口模板：去掉服务地址和查询参数，学期替换为 `{semester}`，含数字的路径段替换为 `{id}`"""
+    if '://' in url:
+        path = urlsplit(url).path
+    else:
+        path = '/' + url.split('?', 1)[0].split('/', 1)[-1] if '/' in url else '/'
+    segments = []
+    for segment in path.split('/'):
+        if _SEMESTER.match(segment):
+            segment = '{semester}'
+        elif _DIGIT.search(segment):
+            segment = '{id}'
+        segments.append(segment)
+    return '/'.join(segments) or '/'
+
+
+def service_of(url: str) -> str:
+    """未指定服务名时使用上游的主机名"""
+    base_url = base_url_of(url)
+    return base_url.split('://', 1)[-1]
+
+
+class CallRecord(NamedTuple):
+    """一次调用（包含所有重试）的记录"""
+    service: str
+    endpoint: str
+    method: str
+    status: str  # HTTP 状态码，或 STATUS_TIMEOUT、STATUS_ERROR、STATUS_REJECTED、STATUS_CANCELLED
+    latency: float  # 秒
+    retries: int
+    response_bytes: int  # 解压后的响应体字节数
+    decode_seconds: float  # JSON 解码耗时
+    wire_bytes: int = 0  # 响应体实际传输的字节数（压缩时小于 response_bytes）
+    request_bytes_saved: int = 0  # 压缩请求体节省的字节数
+    compression_seconds: float = 0.0  # 压缩请求体和解压响应体的耗时
+
+
+class MetricsSink:
+    """指标的输出目标，按需覆盖以下方法"""
+
+    def record_call(self, record: CallRecord) -> None:
+        """一次调用（含重试）结束"""
+        pass
+
+    def record_construct(self, service: str, endpoint: str, seconds: float) -> None:
+        """结果对象（dataclass）的构造耗时"""
+        pass
+
+
+class StatsdSink(MetricsSink):
+    """以 statsd 协议通过 UDP 发送指标，发送失败时静默丢弃
+
+    :param host: statsd 地址
+    :param port: statsd 端口
+    :param prefix: 指标名前缀
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8125, prefix: str = 'everyclass.rpc'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def _name(self, service: str, endpoint: str) -> str:
+        endpoint = re.sub(r'[^A-Za-z0-9_]+', '_', endpoint).strip('_') or 'root'
+        return f'{self.prefix}.{service}.{endpoint}'
+
+    def _send(self, lines: List[str]) -> None:
+        try:
+            self._socket.sendto('\n'.join(lines).encode(), self.address)
+        except OSError:
+            pass
+
+    def record_call(self, record: CallRecord) -> None:
+        name = self._name(record.service, record.endpoint)
+        lines = [f'{name}.latency:{record.latency * 1000:.3f}|ms',
+                 f'{name}.status.{record.status}:1|c']
+        if record.retries:
+            lines.append(f'{name}.retries:{record.retries}|c')
+        if record.response_bytes:
+            lines.append(f'{name}.response_bytes:{record.response_bytes}|h')
+            lines.append(f'{name}.decode:{record.decode_seconds * 1000:.3f}|ms')
+        saved = record.response_bytes - record.wire_bytes + record.request_bytes_saved
+        if saved:
+            lines.append(f'{name}.bytes_saved:{saved}|c')
+            lines.append(f'{name}.compression:{record.compression_seconds * 1000:.3f}|ms')
+        self._send(lines)
+
+    def record_construct(self, service: str, endpoint: str, seconds: float) -> None:
+        self._send([f'{self._name(service, endpoint)}.construct:{seconds * 1000:.3f}|ms'])
+
+
+class Histogram:
+    """累积直方图，桶的含义与 Prometheus 相同"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(桶上界, 小于等于该值的次数) 列表，最后一项的上界为 inf"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """由桶估算的分位数（取所在桶的上界），没有数据时返回 None"""
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return None
+
+
+class EndpointMetrics:
+    """单个接口的聚合指标"""
+    __slots__ = ('latency', 'statuses', 'retries', 'response_bytes', 'decode_seconds', 'construct_seconds',
+                 'constructs', 'wire_bytes', 'bytes_saved', 'compression_seconds')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.latency = Histogram(buckets)
+        self.statuses: Dict[str, int] = {}
+        self.retries = 0
+        self.response_bytes = 0
+        self.decode_seconds = 0.0
+        self.construct_seconds = 0.0
+        self.constructs = 0
+        self.wire_bytes = 0
+        self.bytes_saved = 0  # 请求体和响应体压缩共节省的字节数
+        self.compression_seconds = 0.0
+
+    def as_dict(self) -> Dict:
+        calls = self.latency.count
+        return {'calls'              : calls,
+                'statuses'           : dict(self.statuses),
+                'timeouts'           : self.statuses.get(STATUS_TIMEOUT, 0),
+                'retries'            : self.retries,
+                'latency_sum'        : self.latency.sum,
+                'latency_p50'        : self.latency.percentile(50),
+                'latency_p99'        : self.latency.percentile(99),
+                'response_bytes'     : self.response_bytes,
+                'decode_seconds'     : self.decode_seconds,
+                'construct_seconds'  : self.construct_seconds,
+                'constructs'         : self.constructs,
+                'wire_bytes'         : self.wire_bytes,
+                'bytes_saved'        : self.bytes_saved,
+                'compression_seconds': self.compression_seconds}
+
+
+class MetricsRegistry:
+    """按 (服务名, 接口模板) 聚合的指标
+
+    :param enabled: 是否记录指标
+    :param buckets: 耗时直方图的桶上界（秒）
+    :param sinks: 额外的指标输出目标
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 sinks: Sequence[MetricsSink] = ()):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.sinks: List[MetricsSink] = list(sinks)
+        self._endpoints: Dict[Tuple[str, str], EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool = None, buckets: Sequence[float] = None,
+                  sinks: Sequence[MetricsSink] = None) -> None:
+        """修改配置。修改直方图的桶会清空已有的指标"""
+        if enabled is not None:
+            self.enabled = enabled
+        if sinks is not None:
+            self.sinks = list(sinks)
+        if buckets is not None:
+            self.buckets = tuple(buckets)
+            self.reset()
+
+    def add_sink(self, sink: MetricsSink) -> None:
+        self.sinks.append(sink)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints = {}
+
+    def _metrics_of(self, service: str, endpoint: str) -> EndpointMetrics:
+        metrics = self._endpoints.get((service, endpoint))
+        if metrics is None:
+            metrics = self._endpoints[(service, endpoint)] = EndpointMetrics(self.buckets)
+        return metrics
+
+    def record_call(self, record: CallRecord) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            metrics = self._metrics_of(record.service, record.endpoint)
+            metrics.latency.observe(record.latency)
+            metrics.statuses[record.status] = metrics.statuses.get(record.status, 0) + 1
+            metrics.retries += record.retries
+            metrics.response_bytes += record.response_bytes
+            metrics.decode_seconds += record.decode_seconds
+            metrics.wire_bytes += record.wire_bytes
+            metrics.bytes_saved += record.response_bytes - record.wire_bytes + record.request_bytes_saved
+            metrics.compression_seconds += record.compression_seconds
+        for sink in self.sinks:
+            sink.record_call(record)
+
+    def record_construct(self, service: str, endpoint: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            metrics = self._metrics_of(service, endpoint)
+            metrics.construct_seconds += seconds
+            metrics.constructs += 1
+        for sink in self.sinks:
+            sink.record_construct(service, endpoint, seconds)
+
+    def stats(self) -> Dict[str, Dict]:
+        """各接口的指标，键为 `服务名 接口模板`"""
+        with self._lock:
+            return {f'{service} {endpoint}': metrics.as_dict()
+                    for (service, endpoint), metrics in self._endpoints.items()}
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式（0.0.4）的指标，每个指标族的 TYPE、HELP 和全部样本连续输出"""
+        with self._lock:
+            items = [(f'service="{_escape(service)}",endpoint="{_escape(endpoint)}"', metrics)
+                     for (service, endpoint), metrics in sorted(self._endpoints.items())]
+            lines = []
+            for name, kind, help_text, samples in _PROMETHEUS_FAMILIES:
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'# HELP {name} {help_text}')
+                for labels, metrics in items:
+                    lines.extend(samples(name, labels, metrics))
+        return '\n'.join(lines) + '\n'
+
+
+def _latency_samples(name: str, labels: str, metrics: EndpointMetrics) -> List[str]:
+    lines = []
+    for bound, total in metrics.latency.cumulative():
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {total}')
+    lines.append(f'{name}_sum{{{labels}}} {metrics.latency.sum}')
+    lines.append(f'{name}_count{{{labels}}} {metrics.latency.count}')
+    return lines
+
+
+def _calls_samples(name: str, labels: str, metrics: EndpointMetrics) -> List[str]:
+    return [f'{name}{{{labels},status="{status}"}} {count}' for status, count in sorted(metrics.statuses.items())]
+
+
+def _counter(attribute: str) -> Callable[[str, str, EndpointMetrics], List[str]]:
+    return lambda name, labels, metrics: [f'{name}{{{labels}}} {getattr(metrics, attribute)}']
+
+
+# (指标名, 类型, 说明, 生成样本的函数)
+_PROMETHEUS_FAMILIES = [
+    ('everyclass_rpc_latency_seconds', 'histogram', 'RPC call latency in seconds.', _latency_samples),
+    ('everyclass_rpc_calls_total', 'counter', 'RPC calls by final status.', _calls_samples),
+    ('everyclass_rpc_retries_total', 'counter', 'RPC retry attempts.', _counter('retries')),
+    ('everyclass_rpc_response_bytes_total', 'counter', 'Decompressed response body bytes.',
+     _counter('response_bytes')),
+    ('everyclass_rpc_decode_seconds_total', 'counter', 'Seconds spent decoding response bodies.',
+     _counter('decode_seconds')),
+    ('everyclass_rpc_construct_seconds_total', 'counter', 'Seconds spent constructing result objects.',
+     _counter('construct_seconds')),
+    ('everyclass_rpc_wire_bytes_total', 'counter', 'Response body bytes received on the wire.',
+     _counter('wire_bytes')),
+    ('everyclass_rpc_compression_saved_bytes_total', 'counter', 'Request and response body bytes saved by compression.',
+     _counter('bytes_saved')),
+    ('everyclass_rpc_compression_seconds_total', 'counter', 'Seconds spent compressing and decompressing bodies.',
+     _counter('compression_seconds')),
+]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_view():
+    """Flask 视图函数，以 Prometheus 文本格式输出指标：`app.add_url_rule('/metrics', view_func=prometheus_view)`"""
+    from flask import current_app
+    return current_app.response_class(registry.render_prometheus(),
+                                      content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,246 @@
+"""
+缓存预热：预先查询一个学期的教室课表、card 和指定的学生、老师课表，填充 `Entity` 的结果缓存（往期学期同时写入磁盘缓存），
+避免部署后最初一段时间的请求都要访问上游。
+
+可以在 `init(prefetch={...})` 时在后台运行，也可以通过 `python -m everyclass.rpc prefetch ...` 作为命令行程序运行（见
+`everyclass.rpc.__main__`，进程退出后只有磁盘缓存中的往期学期数据会保留，适合在部署前填充共享的磁盘缓存文件）。
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import gevent
+from gevent.pool import Pool
+
+from everyclass import rpc as _rpc
+from everyclass.rpc.entity import Entity
+
+# 接口名 -> 查询函数 f(entity, semester, resource_id)
+FETCHERS: Dict[str, Callable] = {
+    'classroom_timetable': lambda entity, semester, room_id: entity.get_classroom_timetable(semester, room_id),
+    'card'               : lambda entity, semester, card_id: entity.get_card(semester, card_id),
+    'student_timetable'  : lambda entity, semester, student_id: entity.get_student_timetable(student_id, semester),
+    'teacher_timetable'  : lambda entity, semester, teacher_id: entity.get_teacher_timetable(teacher_id, semester),
+}
+
+
+class RateLimiter:
+    """限制每秒发起的查询数，各协程依次预约下一个时间片
+
+    :param rate: 每秒最多的查询数，为 None 或 0 时不限制
+    """
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0.0
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        wait = self._next - now
+        self._next = max(self._next, now) + self.interval
+        if wait > 0:
+            gevent.sleep(wait)
+
+
+class PrefetchProgress:
+    """预热进度"""
+
+    def __init__(self):
+        self.total = 0  # 已知的查询数（开启 cards_from_rooms 时会在教室课表查询完成后增加）
+        self.done = 0  # 已完成的查询数，包括失败的
+        self.failed = 0
+        self.errors: Dict[Tuple[str, str], Exception] = {}  # 最近失败的查询，最多保留 100 个
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self) -> float:
+        """每秒完成的查询数"""
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f'prefetched {self.done}/{self.total} ({self.failed} failed) '
+                f'in {self.elapsed:.1f}s, {self.rate:.1f}/s')
+
+
+class PrefetchJob:
+    """缓存预热任务
+
+    :param semester: 预热的学期，默认为 `Entity.CURRENT_SEMESTER`
+    :param rooms: 是否通过 `Entity.get_rooms()` 预热所有教室的课表
+    :param room_ids: 额外预热的教室 ID
+    :param card_ids: 预热的 card ID（如热门课程）
+    :param student_ids: 预热课表的学号
+    :param teacher_ids: 预热课表的教工号
+    :param cards_from_rooms: 是否预热教室课表中出现的所有 card
+    :param concurrency: 最大并发查询数
+    :param rate: 每秒最多发起的查询数，为 None 时不限制
+    :param progress_interval: 报告进度的间隔（秒）
+    :param on_progress: 报告进度的函数 `f(progress)`，默认写入日志
+    :param delay: 开始预热前等待的时间（秒），用于在后台运行时避开进程启动阶段
+    :param entity: 使用的 `Entity` 类
+    """
+
+    def __init__(self, semester: str = None, rooms: bool = True, room_ids: Iterable[str] = (),
+                 card_ids: Iterable[str] = (), student_ids: Iterable[str] = (), teacher_ids: Iterable[str] = (),
+                 cards_from_rooms: bool = False, concurrency: int = 5, rate: Optional[float] = 20,
+                 progress_interval: float = 10, on_progress: Callable[[PrefetchProgress], None] = None,
+                 delay: float = 0, entity=Entity):
+        self.semester = semester
+        self.rooms = rooms
+        self.room_ids = list(room_ids)
+        self.card_ids = list(card_ids)
+        self.student_ids = list(student_ids)
+        self.teacher_ids = list(teacher_ids)
+        self.cards_from_rooms = cards_from_rooms
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.progress_interval = progress_interval
+        self.on_progress = on_progress or _log_progress
+        self.delay = delay
+        self.entity = entity
+        self.progress = PrefetchProgress()
+        self._greenlet: Optional[gevent.Greenlet] = None
+        self._last_report = 0.0
+
+    def _room_ids(self) -> List[str]:
+        room_ids = list(self.room_ids)
+        if self.rooms:
+            for buildings in self.entity.get_rooms().values():
+                for building_rooms in buildings.values():
+                    room_ids.extend(building_rooms)
+        return room_ids
+
+    def _report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self._last_report >= self.progress_interval:
+            self._last_report = now
+            self.on_progress(self.progress)
+
+    def _fetch(self, semester: str, endpoint: str, resource_id: str):
+        self.limiter.acquire()
+        try:
+            return FETCHERS[endpoint](self.entity, semester, resource_id)
+        except Exception as e:
+            self.progress.failed += 1
+            if len(self.progress.errors) >= 100:
+                self.progress.errors.pop(next(iter(self.progress.errors)))
+            self.progress.errors[(endpoint, resource_id)] = e
+            return None
+        finally:
+            self.progress.done += 1
+            self._report()
+
+    def _run_tasks(self, semester: str, tasks: List[Tuple[str, str]]) -> List:
+        self.progress.total += len(tasks)
+        pool = Pool(self.concurrency)
+        return pool.map(lambda task: self._fetch(semester, *task), tasks)
+
+    def run(self) -> PrefetchProgress:
+        """运行预热，返回最终进度。单个查询失败不会中断预热"""
+        semester = self.semester or self.entity.CURRENT_SEMESTER
+        if not semester:
+            raise ValueError('Semester is required for prefetching, set it or Entity.CURRENT_SEMESTER')
+        if self.entity.CACHE is None and self.entity.DISK_CACHE is None and _rpc._logger:
+            _rpc._logger.warning('Prefetching without Entity cache enabled, results will not be kept')
+        if self.delay:
+            gevent.sleep(self.delay)
+
+        self.progress = PrefetchProgress()
+        tasks = [('classroom_timetable', room_id) for room_id in dict.fromkeys(self._room_ids())]
+        tasks += [('student_timetable', student_id) for student_id in dict.fromkeys(self.student_ids)]
+        tasks += [('teacher_timetable', teacher_id) for teacher_id in dict.fromkeys(self.teacher_ids)]
+        results = self._run_tasks(semester, tasks)
+
+        card_ids = list(self.card_ids)
+        if self.cards_from_rooms:
+            for (endpoint, _), result in zip(tasks, results):
+                if endpoint == 'classroom_timetable' and result is not None:
+                    card_ids.extend(card.card_id for card in result.cards)
+        self._run_tasks(semester, [('card', card_id) for card_id in dict.fromkeys(card_ids)])
+
+        self.progress.finished = time.monotonic()
+        self._report(force=True)
+        return self.progress
+
+    def start(self) -> gevent.Greenlet:
+        """在后台协程中运行预热"""
+        self._greenlet = gevent.spawn(self._run_in_background)
+        return self._greenlet
+
+    def _run_in_background(self) -> None:
+        try:
+            self.run()
+        except Exception as e:  # 获取教室列表失败等，不影响进程
+            if _rpc._logger:
+                _rpc._logger.warning(f'Prefetch failed: {repr(e)}')
+
+    def stop(self) -> None:
+        """停止后台预热"""
+        if self._greenlet is not None:
+            self._greenlet.kill(block=False)
+            self._greenlet = None
+
+
+def _log_progress(progress: PrefetchProgress) -> None:
+    if _rpc._logger:
+        _rpc._logger.info(str(progress))
+
+
+def _read_ids(path: Optional[str]) -> List[str]:
+    """读取每行一个 ID 的文件"""
+    if not path:
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口，由 `python -m everyclass.rpc prefetch` 在打 gevent 补丁之后调用"""
+    parser = argparse.ArgumentParser(prog='python -m everyclass.rpc prefetch',
+                                     description='Prefetch everyclass entity timetables into the client cache')
+    parser.add_argument('--base-url', action='append', required=True, help='entity service URL, repeat for replicas')
+    parser.add_argument('--token', help='X-Auth-Token for entity requests')
+    parser.add_argument('--semester', required=True, help='semester to prefetch, e.g. 2018-2019-1')
+    parser.add_argument('--current-semester', help='current semester, earlier semesters are written to disk cache')
+    parser.add_argument('--disk-cache', metavar='PATH', help='SQLite disk cache file')
+    parser.add_argument('--disk-cache-version', default='1', help='disk cache version (default 1)')
+    parser.add_argument('--no-rooms', action='store_true', help='do not enumerate rooms through get_rooms()')
+    parser.add_argument('--room-ids', metavar='FILE', help='file with one room ID per line')
+    parser.add_argument('--card-ids', metavar='FILE', help='file with one card ID per line')
+    parser.add_argument('--student-ids', metavar='FILE', help='file with one student ID per line')
+    parser.add_argument('--teacher-ids', metavar='FILE', help='file with one teacher ID per line')
+    parser.add_argument('--cards-from-rooms', action='store_true', help='prefetch every card in room timetables')
+    parser.add_argument('--concurrency', type=int, default=5, help='concurrent requests (default 5)')
+    parser.add_argument('--rate', type=float, default=20, help='requests per second, 0 for unlimited (default 20)')
+    args = parser.parse_args(argv)
+
+    Entity.set_base_url(args.base_url if len(args.base_url) > 1 else args.base_url[0])
+    if args.token:
+        Entity.set_request_token(args.token)
+    if args.current_semester:
+        Entity.set_current_semester(args.current_semester)
+    if args.disk_cache:
+        Entity.enable_disk_cache(args.disk_cache, version=args.disk_cache_version)
+
+    job = PrefetchJob(semester=args.semester,
+                      rooms=not args.no_rooms,
+                      room_ids=_read_ids(args.room_ids),
+                      card_ids=_read_ids(args.card_ids),
+                      student_ids=_read_ids(args.student_ids),
+                      teacher_ids=_read_ids(args.teacher_ids),
+                      cards_from_rooms=args.cards_from_rooms,
+                      concurrency=args.concurrency,
+                      rate=args.rate,
+                      on_progress=lambda progress: print(progress, file=sys.stderr))
+    progress = job.run()
+    for (endpoint, resource_id), error in progress.errors.items():
+        print(f'{endpoint} {resource_id}: {error!r}', file=sys.stderr)
+    return 1 if progress.failed else 0
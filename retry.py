@@ -0,0 +1,136 @@
+"""
+RPC 重试策略。
+
+- 指数退避加随机抖动（full jitter），避免上游故障恢复时所有调用方同时重试
+- 只对可重试的状态码和异常重试
+- 进程级重试预算：重试次数不超过请求数的一定比例，防止上游雪崩时重试放大流量
+- 非幂等请求（默认为 GET 以外的请求）只在请求确定没有发出（连接失败）时重试
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import FrozenSet, Optional, Tuple, Type
+
+import gevent
+import requests
+from urllib3.exceptions import NewConnectionError
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp 仅在使用 everyclass.rpc.aio 时需要
+    aiohttp = None
+
+
+class RetryBudget:
+    """重试预算（令牌桶）
+
+    每个请求存入 `ratio` 个令牌，每次重试取出一个令牌；另外每秒固定补充 `min_per_second` 个令牌，
+    保证低流量时也能重试。
+
+    :param ratio: 重试次数占请求数的比例上限
+    :param min_per_second: 每秒保底的重试次数
+    :param max_tokens: 令牌上限，避免长时间空闲后积攒过多令牌
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 10, max_tokens: float = 100):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated_at) * self.min_per_second)
+        self._updated_at = now
+
+    def deposit(self) -> None:
+        """记录一次请求"""
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """申请一次重试，预算不足时返回 False"""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+def request_not_sent(error: BaseException) -> bool:
+    """请求是否确定没有到达上游（建立连接阶段失败），此时即使是非幂等请求也可以安全重试"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    if aiohttp is not None and isinstance(error, aiohttp.ClientConnectorError):
+        return True
+    return False
+
+
+class RetryPolicy:
+    """重试策略
+
+    :param max_attempts: 最多尝试次数（含第一次），总时长同时受调用 deadline 限制
+    :param backoff_base: 第一次重试前的最大等待时间（秒），之后每次翻倍
+    :param backoff_max: 单次等待时间上限（秒）
+    :param retryable_status_codes: 可以重试的 HTTP 状态码
+    :param retryable_exceptions: 可以重试的异常类型
+    :param budget: 重试预算，为 None 时不限制
+    """
+    RETRYABLE_STATUS_CODES = frozenset({502, 503, 504})
+    RETRYABLE_EXCEPTIONS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError, gevent.Timeout,
+                            asyncio.TimeoutError) + ((aiohttp.ClientConnectionError,) if aiohttp else ())
+
+    def __init__(self, max_attempts: int = 5, backoff_base: float = 0.05, backoff_max: float = 1.0,
+                 retryable_status_codes: FrozenSet[int] = None,
+                 retryable_exceptions: Tuple[Type[BaseException], ...] = None,
+                 budget: Optional[RetryBudget] = None):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retryable_status_codes = retryable_status_codes if retryable_status_codes is not None \
+            else self.RETRYABLE_STATUS_CODES
+        self.retryable_exceptions = retryable_exceptions if retryable_exceptions is not None \
+            else self.RETRYABLE_EXCEPTIONS
+        self.budget = budget
+
+    def backoff(self, attempt: int) -> float:
+        """第 `attempt` 次尝试失败后的等待时间"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+
+    def should_retry(self, attempt: int, idempotent: bool, error: BaseException = None,
+                     status_code: int = None) -> bool:
+        """第 `attempt` 次尝试失败后是否重试。失败原因为异常 `error` 或可重试的状态码 `status_code`"""
+        if attempt >= self.max_attempts:
+            return False
+        if error is not None:
+            if not isinstance(error, self.retryable_exceptions):
+                return False
+            if not idempotent and not request_not_sent(error):
+                return False
+        elif status_code is not None:
+            if not idempotent or status_code not in self.retryable_status_codes:
+                return False
+        else:
+            return False
+        if self.budget is not None and not self.budget.withdraw():
+            return False
+        return True
+
+    def on_request(self) -> None:
+        """每次调用开始时调用，用于重试预算计数"""
+        if self.budget is not None:
+            self.budget.deposit()
+
@@ -0,0 +1,190 @@
+"""
+本地空闲教室索引：由一个学期所有教室的课表构建占用位图，`Entity.get_available_room_ids` 由索引回答，不发出上游请求。
+
+索引按 校区 -> 楼栋 -> 教室 组织，每个教室保存 周次 -> 节次位图（第 d 天第 p 节对应第 `(d - 1) * PERIODS_PER_DAY + p - 1` 位），
+查询时只需对楼栋内每个教室做一次按位与。节次使用与 card 的 `lesson` 相同的格式，如 `10506` 表示周一第 5-6 节。
+
+索引在后台定期增量刷新：每次只重新查询一批教室的课表，依次轮换，一轮结束后重新获取教室列表（新增的教室优先查询）。
+索引未就绪、学期与 `Entity.CURRENT_SEMESTER` 不一致、楼栋不在索引中或有教室的课表未能查询时，查询返回 None。
+"""
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import gevent
+
+from everyclass import rpc as _rpc
+from everyclass.rpc.entity import Entity
+
+PERIODS_PER_DAY = 16  # 每天占用的位数，不小于一天的最大节次
+
+# 周次 -> 节次位图，为 None 表示课表未能查询
+Occupancy = Optional[Dict[int, int]]
+
+
+@lru_cache(maxsize=1024)
+def lesson_mask(lesson: str) -> int:
+    """将节次（如 `10506`，周一第 5-6 节）转换为位图，格式错误时抛出 ValueError"""
+    if len(lesson) != 5 or not lesson.isdigit():
+        raise ValueError(f'Invalid lesson {lesson!r}')
+    day, start, end = int(lesson[0]), int(lesson[1:3]), int(lesson[3:5])
+    if not 1 <= day <= 7 or not 1 <= start <= end <= PERIODS_PER_DAY:
+        raise ValueError(f'Invalid lesson {lesson!r}')
+    return ((1 << (end - start + 1)) - 1) << ((day - 1) * PERIODS_PER_DAY + start - 1)
+
+
+def occupancy_of(cards) -> Dict[int, int]:
+    """由教室课表中的 card 列表得到 周次 -> 节次位图"""
+    weeks: Dict[int, int] = {}
+    for card in cards:
+        try:
+            mask = lesson_mask(card.lesson)
+        except ValueError:
+            continue
+        for week in card.weeks:
+            weeks[week] = weeks.get(week, 0) | mask
+    return weeks
+
+
+class RoomIndex:
+    """空闲教室索引
+
+    :param semester: 索引的学期，默认为 `Entity.CURRENT_SEMESTER`（当前学期变化后自动重建）
+    :param refresh_interval: 两次增量刷新之间的间隔（秒）
+    :param refresh_batch: 每次增量刷新重新查询的教室数
+    :param entity: 使用的 `Entity` 类
+    """
+
+    def __init__(self, semester: str = None, refresh_interval: float = 60, refresh_batch: int = 50, entity=Entity):
+        self.fixed_semester = semester
+        self.refresh_interval = refresh_interval
+        self.refresh_batch = refresh_batch
+        self.entity = entity
+        self.semester: Optional[str] = None  # 已构建的索引所属的学期
+        self._campuses: Dict[str, Dict[str, Dict[str, Occupancy]]] = {}
+        self._queue: List[str] = []  # 本轮还未刷新的教室
+        self._greenlet: Optional[gevent.Greenlet] = None
+        self.ready = False
+        self.refreshed_at: Optional[float] = None
+
+    def _target_semester(self) -> str:
+        semester = self.fixed_semester or self.entity.CURRENT_SEMESTER
+        if not semester:
+            raise ValueError('Semester is required for room index, set it or Entity.CURRENT_SEMESTER')
+        return semester
+
+    def _fetch_rooms(self) -> Dict[str, Dict[str, List[str]]]:
+        self.entity.invalidate_cache(endpoint='rooms')
+        return self.entity.get_rooms()
+
+    def _load(self, semester: str, room_ids: List[str]) -> Dict[str, Dict[int, int]]:
+        """查询教室课表，返回查询成功的教室的占用位图。先使结果缓存失效（一次扫描），保证取得最新的课表"""
+        self.entity.invalidate_cache(endpoint='classroom_timetable', resource_id=room_ids, semester=semester)
+        result = self.entity.get_classroom_timetables(semester, room_ids)
+        if result.errors and _rpc._logger:
+            _rpc._logger.warning(f'Room index failed to load {len(result.errors)} room(s) of {semester}')
+        return {room_id: occupancy_of(timetable.cards)
+                for room_id, timetable in zip(result.ids, result) if timetable is not None}
+
+    def build(self) -> None:
+        """重新构建整个索引"""
+        semester = self._target_semester()
+        rooms = self._fetch_rooms()
+        room_ids = [room_id for buildings in rooms.values() for ids in buildings.values() for room_id in ids]
+        loaded = self._load(semester, room_ids)
+        self._campuses = {campus: {building: {room_id: loaded.get(room_id) for room_id in ids}
+                                   for building, ids in buildings.items()}
+                          for campus, buildings in rooms.items()}
+        self.semester = semester
+        self._queue = []
+        self.ready = True
+        self.refreshed_at = time.time()
+
+    def _reload_rooms(self) -> None:
+        """重新获取教室列表，保留已有教室的位图，新增的教室排在本轮刷新的最前面"""
+        rooms = self._fetch_rooms()
+        known = {room_id: occupancy for buildings in self._campuses.values()
+                 for building_rooms in buildings.values() for room_id, occupancy in building_rooms.items()}
+        self._campuses = {campus: {building: {room_id: known.get(room_id) for room_id in ids}
+                                   for building, ids in buildings.items()}
+                          for campus, buildings in rooms.items()}
+        room_ids = [room_id for buildings in rooms.values() for ids in buildings.values() for room_id in ids]
+        self._queue = [room_id for room_id in room_ids if room_id not in known] + \
+                      [room_id for room_id in room_ids if room_id in known]
+
+    def refresh(self) -> None:
+        """增量刷新一批教室。索引未构建或学期变化时重建整个索引"""
+        semester = self._target_semester()
+        if not self.ready or semester != self.semester:
+            self.build()
+            return
+        if not self._queue:
+            self._reload_rooms()
+        batch, self._queue = self._queue[:self.refresh_batch], self._queue[self.refresh_batch:]
+        loaded = self._load(semester, batch)
+        for buildings in self._campuses.values():
+            for building_rooms in buildings.values():
+                for room_id in building_rooms:
+                    if room_id in loaded:
+                        building_rooms[room_id] = loaded[room_id]
+        self.refreshed_at = time.time()
+
+    def available_rooms(self, week: int, session: str, campus: str, building: str) -> Optional[List[str]]:
+        """返回空闲教室的 ID 列表（顺序与 `Entity.get_rooms()` 相同），无法由索引回答时返回 None
+
+        :param week: 周次
+        :param session: 节次，如 `10506`
+        :param campus: 校区
+        :param building: 楼栋
+        """
+        if not self.ready:
+            return None
+        if not self.fixed_semester and self.semester != self.entity.CURRENT_SEMESTER:  # 学期变化后等待重建
+            return None
+        rooms = self._campuses.get(campus, {}).get(building)
+        if rooms is None:
+            return None
+        try:
+            mask = lesson_mask(str(session))
+            week = int(week)
+        except ValueError:
+            return None
+        available = []
+        for room_id, weeks in rooms.items():
+            if weeks is None:
+                return None
+            if not weeks.get(week, 0) & mask:
+                available.append(room_id)
+        return available
+
+    def stats(self) -> Dict:
+        """索引的学期、教室数、未能查询的教室数、本轮待刷新的教室数和最近刷新时间"""
+        rooms = [occupancy for buildings in self._campuses.values()
+                 for building_rooms in buildings.values() for occupancy in building_rooms.values()]
+        return {'ready'       : self.ready,
+                'semester'    : self.semester,
+                'rooms'       : len(rooms),
+                'missing'     : sum(1 for occupancy in rooms if occupancy is None),
+                'pending'     : len(self._queue),
+                'refreshed_at': self.refreshed_at}
+
+    def start(self) -> gevent.Greenlet:
+        """在后台协程中构建索引并定期增量刷新"""
+        self._greenlet = gevent.spawn(self._run)
+        return self._greenlet
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:  # 上游不可用等，下次刷新时重试
+                if _rpc._logger:
+                    _rpc._logger.warning(f'Room index refresh failed: {repr(e)}')
+            gevent.sleep(self.refresh_interval)
+
+    def stop(self) -> None:
+        """停止后台刷新"""
+        if self._greenlet is not None:
+            self._greenlet.kill(block=False)
+            self._greenlet = None
+
@@ -0,0 +1,105 @@
+"""
+按上游服务（scheme://host:port）复用 HTTP 会话与连接池。
+
+每个上游对应一个 `requests.Session`，会话内部的 urllib3 连接池保持长连接，避免每次 RPC 都重新建立 TCP 连接
+（对 HTTPS 上游还能省下 TLS 握手）。在 gevent monkey patch 之后 `threading.Lock` 会被替换为协程锁，
+因此注册表同时适用于多线程与多协程环境。
+"""
+import threading
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def base_url_of(url: str) -> str:
+    """取出 URL 中的 `scheme://netloc` 部分，作为上游服务的标识"""
+    parts = urlsplit(url)
+    if parts.scheme and parts.netloc:
+        return f'{parts.scheme}://{parts.netloc}'
+    return url.split('/', 1)[0]
+
+
+class SessionRegistry:
+    """上游服务到 `requests.Session` 的映射
+
+    :param pool_connections: 每个会话缓存的主机连接池数量
+    :param pool_maxsize: 每个主机保留的长连接数量
+    :param pool_block: 为 True 时连接数达到 `pool_maxsize` 后阻塞等待，而不是新建临时连接
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10, pool_block: bool = False):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, pool_connections: int = None, pool_maxsize: int = None, pool_block: bool = None) -> None:
+        """修改连接池参数。已经创建的会话会被关闭，下次调用时按新参数重建"""
+        if pool_connections is not None:
+            self.pool_connections = pool_connections
+        if pool_maxsize is not None:
+            self.pool_maxsize = pool_maxsize
+        if pool_block is not None:
+            self.pool_block = pool_block
+        self.close()
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block,
+                              max_retries=0)  # 重试由 HttpRpc 负责
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        return session
+
+    def get(self, url: str) -> requests.Session:
+        """获得 URL 所属上游服务的会话，不存在时创建"""
+        base_url = base_url_of(url)
+        session = self._sessions.get(base_url)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(base_url)
+                if session is None:
+                    session = self._new_session()
+                    self._sessions[base_url] = session
+        return session
+
+    def close(self) -> None:
+        """关闭所有会话及其连接"""
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def stats(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """连接池统计信息：上游服务 -> 主机 -> 计数
+
+        - `connections`: 累计新建的连接数
+        - `requests`: 累计发出的请求数
+        - `idle`: 当前空闲、可复用的长连接数
+        """
+        result = {}
+        for base_url, session in list(self._sessions.items()):
+            hosts = {}
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    idle = sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+                    hosts[f'{key.key_scheme}://{key.key_host}:{key.key_port}'] = {
+                        'connections': pool.num_connections,
+                        'requests'   : pool.num_requests,
+                        'idle'       : idle,
+                    }
+            result[base_url] = hosts
+        return result
+
+
+registry = SessionRegistry()
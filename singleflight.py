@@ -0,0 +1,45 @@
+"""
+合并相同的并发调用（single flight）。
+
+同一时刻以相同参数发起的多个调用只有第一个（leader）真正执行，其余调用等待并共享它的结果或异常。
+基于 gevent 的协作式调度：查找与登记之间没有切换点，因此不需要全局锁。
+"""
+from typing import Any, Callable, Dict, Hashable
+
+from gevent.event import AsyncResult
+
+_ABANDONED = object()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, AsyncResult] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """执行 `fn()`，如果已有相同 `key` 的调用正在进行，则等待并返回它的结果（或抛出它的异常）"""
+        call = self._calls.get(key)
+        if call is not None:
+            result = call.get()
+            if result is not _ABANDONED:
+                return result
+            return self.do(key, fn)  # leader 被取消，由当前调用重新发起
+
+        call = self._calls[key] = AsyncResult()
+        try:
+            result = fn()
+        except Exception as e:
+            self._calls.pop(key, None)
+            call.set_exception(e)
+            raise
+        except BaseException:
+            # leader 自身被 kill 或超时，不应把这类异常传给其他等待者
+            self._calls.pop(key, None)
+            call.set(_ABANDONED)
+            raise
+        self._calls.pop(key, None)
+        call.set(result)
+        return result
+
+    def in_flight(self) -> int:
+        """正在进行的调用数"""
+        return len(self._calls)
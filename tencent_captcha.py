@@ -4,6 +4,10 @@ from everyclass.rpc.http import HttpRpc
 
 
 class TencentCaptcha:
+    @classmethod
+    def _call(cls, decode, **kwargs):
+        return decode(HttpRpc.call(service='captcha', **kwargs))
+
     @classmethod
     def _verify(cls, ticket: str, rand_str: str, user_ip: str) -> bool:
         params = {
@@ -13,11 +17,11 @@ class TencentCaptcha:
             "Randstr"     : rand_str,
             "UserIP"      : user_ip
         }
-        resp = HttpRpc.call(method="GET",
-                            url='https://ssl.captcha.qq.com/ticket/verify',
-                            params=params,
-                            retry=True)
-        return bool(resp["response"])
+        return cls._call(lambda resp: bool(resp["response"]),
+                         method="GET",
+                         url='https://ssl.captcha.qq.com/ticket/verify',
+                         params=params,
+                         retry=True)
 
     @classmethod
     def verify(cls):
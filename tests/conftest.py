@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import pytest
+
+
+class Upstream:
+    """在后台线程运行的 HTTP 桩服务
+
+    `route(path, *replies)` 设置该路径依次返回的响应，每个响应为 `(status, body[, delay[, headers]])`，
+    body 为 bytes 或可 JSON 编码的对象，最后一个响应重复使用。未设置的路径返回 404。`requests` 按顺序记录收到的请求。
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, List[Tuple]] = {}
+        self.requests: List[Tuple[str, str, Dict[str, str], bytes]] = []
+        self._lock = threading.Lock()
+        handler = type('Handler', (_Handler,), {'upstream': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.daemon_threads = True
+        self.url = 'http://{}:{}'.format(*self.server.server_address)
+        threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+
+    def route(self, path: str, *replies: Tuple) -> None:
+        self.routes[path] = list(replies)
+
+    def next_reply(self, path: str) -> Tuple[int, object, float, Dict[str, str]]:
+        with self._lock:
+            replies = self.routes.get(path)
+            if not replies:
+                return 404, {}, 0, {}
+            reply = replies.pop(0) if len(replies) > 1 else replies[0]
+        status, body, delay, headers = reply + (0, {})[len(reply) - 2:]
+        return status, body, delay, headers
+
+    def calls(self, path: str) -> int:
+        """收到的该路径（不含查询参数）的请求数"""
+        return sum(1 for _, request_path, _, _ in self.requests if request_path.split('?', 1)[0] == path)
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 保持长连接，与真实上游一致
+    disable_nagle_algorithm = True
+    upstream: Upstream = None
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request_body = self.rfile.read(length) if length else b''
+        self.upstream.requests.append((self.command, self.path, dict(self.headers), request_body))
+        status, body, delay, headers = self.upstream.next_reply(self.path.split('?', 1)[0])
+        if delay:
+            time.sleep(delay)
+        data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+        try:
+            self.send_response(status)
+            for name, value in dict({'Content-Type': 'application/json'}, **headers).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):  # 客户端已超时断开
+            pass
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    from everyclass.rpc.session import registry
+    server = Upstream()
+    yield server
+    registry.close()
+    server.close()
+
+
+@pytest.fixture
+def entity(upstream, monkeypatch):
+    """把 `Entity` 的服务地址指向桩服务，同步与 asyncio 版本共用"""
+    from everyclass.rpc.entity import Entity
+    monkeypatch.setattr(Entity, 'BASE_URL', upstream.url)
+    return Entity
@@ -0,0 +1,144 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from everyclass.rpc import RpcResourceNotFound, RpcServerNotAvailable, RpcTimeout  # noqa: E402
+from everyclass.rpc import metrics  # noqa: E402
+from everyclass.rpc.aio.entity import Entity  # noqa: E402
+from everyclass.rpc.aio.http import AsyncHttpRpc  # noqa: E402
+from everyclass.rpc.aio.tencent_captcha import TencentCaptcha  # noqa: E402
+from everyclass.rpc.http import deadline_scope  # noqa: E402
+from everyclass.rpc.retry import RetryPolicy  # noqa: E402
+
+FAST_RETRY = RetryPolicy(max_attempts=3, backoff_base=0.001)
+
+
+def run(coroutine):
+    """在新的事件循环中执行，结束后关闭共享的会话"""
+
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await AsyncHttpRpc.close()
+
+    return asyncio.run(main())
+
+
+def _student(code: str) -> dict:
+    return {'status': 'success', 'name': f'学生{code}', 'student_code': code, 'campus': '校本部', 'deputy': '计算机学院',
+            'class': '软件1601', 'semester_list': ['2018-2019-1']}
+
+
+def test_call_retries_503_until_success(upstream):
+    upstream.route('/flaky', (503, {}), (503, {}), (200, {'status': 'OK'}))
+    assert run(AsyncHttpRpc.call('GET', f'{upstream.url}/flaky', retry_policy=FAST_RETRY)) == {'status': 'OK'}
+    assert upstream.calls('/flaky') == 3
+
+
+def test_call_raises_after_exhausting_retries_on_503(upstream):
+    upstream.route('/down', (503, {}))
+    with pytest.raises(RpcServerNotAvailable):
+        run(AsyncHttpRpc.call('GET', f'{upstream.url}/down', retry_policy=FAST_RETRY))
+    assert upstream.calls('/down') == 3
+
+
+def test_call_does_not_retry_post_after_response(upstream):
+    upstream.route('/flaky', (503, {}), (200, {'status': 'OK'}))
+    with pytest.raises(RpcServerNotAvailable):
+        run(AsyncHttpRpc.call('POST', f'{upstream.url}/flaky', data={'a': 1}, retry_policy=FAST_RETRY))
+    assert upstream.calls('/flaky') == 1
+
+
+def test_call_raises_for_error_status(upstream):
+    upstream.route('/missing', (404, {}))
+    with pytest.raises(RpcResourceNotFound):
+        run(AsyncHttpRpc.call('GET', f'{upstream.url}/missing'))
+
+
+@pytest.mark.parametrize('scoped', [False, True])
+def test_deadline_bounds_the_whole_call(upstream, scoped):
+    upstream.route('/slow', (200, {}, 1))
+
+    async def call():
+        if scoped:
+            with deadline_scope(0.2):
+                return await AsyncHttpRpc.call('GET', f'{upstream.url}/slow', deadline=5)
+        return await AsyncHttpRpc.call('GET', f'{upstream.url}/slow', deadline=0.2)
+
+    started = time.monotonic()
+    with pytest.raises(RpcTimeout):
+        run(call())
+    assert time.monotonic() - started < 0.8
+
+
+def test_cancelled_call_is_recorded_as_cancelled(upstream):
+    upstream.route('/slow', (200, {}, 1))
+
+    async def cancel():
+        task = asyncio.ensure_future(AsyncHttpRpc.call('GET', f'{upstream.url}/slow', service='aio-cancel'))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(cancel())
+    assert metrics.registry.stats()['aio-cancel /slow']['statuses'] == {metrics.STATUS_CANCELLED: 1}
+
+
+def test_entity_get_student(entity, upstream):
+    upstream.route('/student/1', (200, _student('1')))
+    student = run(Entity.get_student('1'))
+    assert student.student_id == '1' and student.klass == '软件1601'
+
+
+def test_entity_get_students_collects_errors(entity, upstream):
+    upstream.route('/student/1', (200, _student('1')))
+    upstream.route('/student/2', (200, _student('2')))
+    result = run(Entity.get_students(['1', '2', '3']))
+    assert [student.student_id if student else None for student in result] == ['1', '2', None]
+    assert isinstance(result.errors['3'], RpcResourceNotFound)
+
+
+def test_entity_search_iter(entity, upstream):
+    pages = [[{'group': 'student', 'code': str(i), 'name': str(i), 'semester_list': [], 'deputy': '', 'class': ''}
+              for i in range(start, start + 2)] for start in (0, 2)]
+    upstream.route('/search/query', (200, {'status': 'OK', 'data': pages[0]}),
+                   (200, {'status': 'OK', 'data': pages[1]}), (200, {'status': 'OK', 'data': []}))
+
+    async def collect():
+        return [item.student_id async for item in Entity.search_iter('x', page_size=2)]
+
+    assert run(collect()) == ['0', '1', '2', '3']
+
+
+def test_captcha_verify_old_is_awaitable(monkeypatch):
+    flask = pytest.importorskip('flask')
+    app = flask.Flask(__name__)
+    app.config.update(TENCENT_CAPTCHA_AID='aid', TENCENT_CAPTCHA_SECRET='secret')
+    calls = []
+
+    async def fake_call(**kwargs):
+        calls.append(kwargs['params'])
+        return {'response': 1}
+
+    monkeypatch.setattr(AsyncHttpRpc, 'call', fake_call)
+    with app.test_request_context(method='POST', data={}):
+        assert run(TencentCaptcha.verify_old()) is False
+    with app.test_request_context(method='POST', data={'captcha-ticket': 't', 'captcha-rand': 'r'}):
+        assert run(TencentCaptcha.verify_old()) is True
+    assert calls[0]['Ticket'] == 't' and calls[0]['Randstr'] == 'r'
+
+
+def test_entity_items_recovered_after_batch_404_are_not_reported_as_errors(entity, upstream, monkeypatch):
+    monkeypatch.setattr(Entity, 'BATCH_API', True)
+    monkeypatch.setattr(Entity, '_batch_api_retry_at', 0.0)
+    monkeypatch.setattr(Entity, 'BATCH_SIZE', 1)
+    upstream.route('/student/batch', (200, {'status': 'success', 'data': {'1': {'name': 'malformed'}}}), (404, {}))
+    upstream.route('/student/1', (200, _student('1')))
+    upstream.route('/student/2', (200, _student('2')))
+    result = run(Entity.get_students(['1', '2']))
+    assert [student.student_id for student in result] == ['1', '2'] and result.errors == {}
@@ -0,0 +1,50 @@
+import pytest
+
+from everyclass.rpc import RpcServerNotAvailable
+from everyclass.rpc.balancer import LEAST_OUTSTANDING, ROUND_ROBIN, LoadBalancer
+
+REPLICAS = ['http://10.0.0.11:8000', 'http://10.0.0.12:8000/']
+
+
+def test_round_robin_and_resolve():
+    balancer = LoadBalancer('entity', REPLICAS, strategy=ROUND_ROBIN)
+    picked = [balancer.pick() for _ in range(4)]
+    assert [replica.url for replica in picked] == ['http://10.0.0.11:8000', 'http://10.0.0.12:8000'] * 2
+    assert balancer.resolve('balanced://entity/student/1?a=1', picked[1]) == 'http://10.0.0.12:8000/student/1?a=1'
+    for replica in picked:
+        balancer.release(replica, True)
+    assert all(stats['outstanding'] == 0 and stats['requests'] == 2 for stats in balancer.stats().values())
+
+
+def test_least_outstanding_avoids_busy_replica():
+    balancer = LoadBalancer('entity', REPLICAS, strategy=LEAST_OUTSTANDING)
+    busy = balancer.pick()
+    assert balancer.pick() is not busy
+
+
+def test_replica_is_ejected_after_consecutive_failures():
+    balancer = LoadBalancer('entity', REPLICAS, strategy=ROUND_ROBIN, eject_after=2, eject_duration=60)
+    bad = balancer.pick()
+    balancer.release(bad, False)
+    balancer.release(balancer.pick(), True)
+    balancer.release(balancer.pick(), False)
+    assert balancer.stats()[bad.url]['ejected']
+    assert all(balancer.pick() is not bad for _ in range(5))
+
+
+def test_cancelled_calls_do_not_count_as_failures():
+    balancer = LoadBalancer('entity', REPLICAS[:1], eject_after=1)
+    for _ in range(3):
+        balancer.release(balancer.pick(), None)
+    assert balancer.stats()[REPLICAS[0]] == {'outstanding': 0, 'requests': 3, 'errors': 0, 'ejected': False}
+
+
+def test_no_replica_raises_server_not_available():
+    balancer = LoadBalancer('entity', resolver=lambda: [])
+    with pytest.raises(RpcServerNotAvailable):
+        balancer.pick()
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        LoadBalancer('entity', REPLICAS, strategy='random')
@@ -0,0 +1,55 @@
+import time
+
+from everyclass.rpc.cache import MISSING, TTLCache
+
+
+def test_get_returns_value_until_expired():
+    cache = TTLCache()
+    cache.set(('card', '1'), 'value', ttl=0.05)
+    assert cache.get(('card', '1')) == 'value'
+    time.sleep(0.06)
+    assert cache.get(('card', '1')) is MISSING
+    assert cache.stats()['card'] == {'hits': 1, 'misses': 1, 'evictions': 0, 'expirations': 1, 'invalidations': 0}
+
+
+def test_evicts_least_recently_used_entry_when_full():
+    cache = TTLCache(max_entries=2)
+    cache.set(('card', '1'), 1, ttl=60)
+    cache.set(('card', '2'), 2, ttl=60)
+    cache.get(('card', '1'))
+    cache.set(('card', '3'), 3, ttl=60)
+    assert cache.get(('card', '2')) is MISSING
+    assert cache.get(('card', '1')) == 1 and cache.get(('card', '3')) == 3
+    assert cache.stats()['card']['evictions'] == 1
+
+
+def test_evicts_by_bytes():
+    cache = TTLCache(max_bytes=100)
+    cache.set(('a', '1'), 1, ttl=60, size=60)
+    cache.set(('a', '2'), 2, ttl=60, size=60)
+    assert len(cache) == 1 and cache.bytes == 60
+    assert cache.get(('a', '2')) == 2
+
+
+def test_skips_oversized_values_and_zero_ttl():
+    cache = TTLCache(max_bytes=100)
+    cache.set(('a', '1'), 1, ttl=60, size=101)
+    cache.set(('a', '2'), 2, ttl=0)
+    assert len(cache) == 0
+
+
+def test_overwrite_updates_bytes():
+    cache = TTLCache()
+    cache.set(('a', '1'), 1, ttl=60, size=10)
+    cache.set(('a', '1'), 2, ttl=60, size=30)
+    assert cache.bytes == 30 and cache.get(('a', '1')) == 2
+
+
+def test_invalidate_by_predicate():
+    cache = TTLCache()
+    for key in [('card', '1'), ('card', '2'), ('student', '1')]:
+        cache.set(key, key, ttl=60, size=1)
+    assert cache.invalidate(lambda key: key[0] == 'card') == 2
+    assert len(cache) == 1 and cache.bytes == 1
+    assert cache.invalidate() == 1
+    assert len(cache) == 0
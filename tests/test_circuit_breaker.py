@@ -0,0 +1,70 @@
+import time
+
+from everyclass.rpc.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+
+
+def _open_breaker(**options) -> CircuitBreaker:
+    breaker = CircuitBreaker('http://upstream', min_calls=4, error_rate_threshold=0.5, open_duration=0.05,
+                             half_open_probes=2, **options)
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success, 0.01)
+    return breaker
+
+
+def test_opens_when_error_rate_reaches_threshold():
+    breaker = _open_breaker()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_stays_closed_below_min_calls():
+    breaker = CircuitBreaker('http://upstream', min_calls=4)
+    for _ in range(3):
+        breaker.record(False, 0.01)
+    assert breaker.state == CLOSED
+
+
+def test_opens_on_slow_calls():
+    breaker = CircuitBreaker('http://upstream', min_calls=2, slow_call_duration=0.5, slow_call_rate_threshold=0.5)
+    breaker.record(True, 1.0)
+    breaker.record(True, 1.0)
+    assert breaker.state == OPEN
+
+
+def test_half_open_allows_limited_probes_and_closes_after_successes():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True, 0.01)
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_reopens_on_failure():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+
+
+def test_release_returns_probe():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_registry_keys_by_upstream_or_endpoint():
+    registry = CircuitBreakerRegistry()
+    assert registry.get('http://a/student/1') is registry.get('http://a/teacher/2')
+    registry.configure(per_endpoint=True)
+    assert registry.key_of('http://a/student/1?x=1') == 'http://a/student'
+    assert registry.get('http://a/student/1') is not registry.get('http://a/teacher/2')
+    registry.configure(enabled=False)
+    assert registry.get('http://a/student/1') is None
@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+
+import pytest
+
+from everyclass.rpc import codec
+from everyclass.rpc.codec import JsonCodec, OrjsonCodec, make_codec
+
+
+@dataclass
+class Point:
+    x: int
+    y: str
+
+
+VALUE = {'name': '张三', 'weeks': [1, 2, 3], 'point': Point(1, 'a'), 'none': None}
+DECODED = {'name': '张三', 'weeks': [1, 2, 3], 'point': {'x': 1, 'y': 'a'}, 'none': None}
+
+
+@pytest.mark.parametrize('name', ['json', 'orjson'])
+def test_round_trip_with_dataclasses(name):
+    if name == 'orjson':
+        pytest.importorskip('orjson')
+    json_codec = make_codec(name)
+    data = json_codec.dumps(VALUE)
+    assert isinstance(data, bytes)
+    assert json_codec.loads(data) == DECODED
+    assert json_codec.loads(data.decode('utf-8')) == DECODED
+
+
+def test_codecs_produce_identical_values():
+    pytest.importorskip('orjson')
+    data = OrjsonCodec().dumps(VALUE)
+    assert JsonCodec().loads(data) == OrjsonCodec().loads(JsonCodec().dumps(VALUE))
+
+
+def test_unserializable_values_raise_type_error():
+    with pytest.raises(TypeError):
+        JsonCodec().dumps({'value': object()})
+
+
+def test_make_and_set_codec(monkeypatch):
+    assert make_codec('json').name == 'json'
+    assert make_codec('auto').name == ('orjson' if codec.orjson is not None else 'json')
+    with pytest.raises(ValueError):
+        make_codec('yaml')
+    monkeypatch.setattr(codec, 'codec', codec.codec)
+    codec.set_codec('json')
+    assert codec.get_codec().name == 'json'
+    custom = JsonCodec()
+    codec.set_codec(custom)
+    assert codec.get_codec() is custom
+
+
+def test_msgpack_responses_are_decoded_by_content_type():
+    msgpack = pytest.importorskip('msgpack')
+    data = msgpack.packb({'card_id': 'c1', 'weeks': [1, 2], 1: b'\x00'}, use_bin_type=True)
+    assert codec.codec_for('application/msgpack; charset=utf-8').loads(data) == {'card_id': 'c1', 'weeks': [1, 2],
+                                                                                   1: b'\x00'}
+    assert codec.codec_for('application/json') is codec.get_codec()
+    assert codec.codec_for(None) is codec.get_codec()
@@ -0,0 +1,55 @@
+import pytest
+
+from everyclass.rpc import compression
+from everyclass.rpc.compression import CompressionSettings, DecompressionError, StreamDecoder, available_encodings
+
+BODY = ('{"status":"success","cards":[' + ','.join(f'{{"card_id":"{i}","name":"课程{i}"}}' for i in range(2000))
+        + ']}').encode('utf-8')
+
+
+def _chunks(data: bytes, size: int = 1000):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('encoding', available_encodings())
+def test_stream_round_trip(encoding):
+    compressed = compression.ENCODINGS[encoding].compress(BODY, None)
+    decoder = compression.decode_stream(encoding, _chunks(compressed))
+    assert decoder.finish() == BODY
+    assert decoder.wire_bytes == len(compressed) < len(BODY)
+
+
+def test_multiple_encodings_are_undone_in_reverse_order():
+    data = compression.ENCODINGS['deflate'].compress(compression.ENCODINGS['gzip'].compress(BODY, None), None)
+    assert compression.decode_stream('gzip, deflate', _chunks(data)).finish() == BODY
+
+
+@pytest.mark.parametrize('header', [None, '', 'identity', 'unknown'])
+def test_identity_and_unknown_encodings_pass_through(header):
+    decoder = StreamDecoder(header)
+    for chunk in _chunks(BODY):
+        decoder.feed(chunk)
+    assert decoder.finish() == BODY and decoder.seconds == 0
+
+
+def test_corrupted_body_raises_decompression_error():
+    with pytest.raises(DecompressionError):
+        compression.decode_stream('gzip', [b'not gzip at all']).finish()
+
+
+def test_compress_body_respects_threshold_and_gain():
+    settings = CompressionSettings(request_encoding='gzip', request_threshold=100)
+    assert settings.compress_body(b'x' * 100)[:2] == (b'x' * 100, None)
+    body, encoding, _ = settings.compress_body(BODY)
+    assert encoding == 'gzip' and compression.decode_stream('gzip', [body]).finish() == BODY
+    random_bytes = bytes(range(256))
+    assert settings.compress_body(random_bytes)[1] is None  # 压缩后没有变小
+
+
+def test_configure_accept_and_invalid_request_encoding():
+    settings = CompressionSettings(accept=('nope', 'gzip'))
+    assert settings.accept_header == 'gzip'
+    settings.configure(accept=())
+    assert settings.accept_header == 'identity'
+    with pytest.raises(ValueError):
+        settings.configure(request_encoding='nope')
@@ -0,0 +1,68 @@
+import logging
+from dataclasses import dataclass
+from typing import List
+
+import pytest
+
+from everyclass import rpc
+from everyclass.rpc import Decoder, add_slots, decodable
+
+
+@decodable(renames={'code': 'student_id', 'semester_list': 'semesters'}, converters={'semesters': sorted},
+           ignore=('group',))
+@add_slots
+@dataclass
+class Student:
+    student_id: str
+    name: str
+    semesters: List[str]
+
+
+@pytest.fixture
+def logger(monkeypatch):
+    logger = logging.getLogger('everyclass.rpc.tests')
+    monkeypatch.setattr(rpc, '_logger', logger)
+    monkeypatch.setattr(rpc, '_unexpected_field_warned', {})
+    return logger
+
+
+def test_renames_and_converts_fields():
+    student = Student._decode({'code': '3901160407', 'name': '张三', 'semester_list': ['2019-2020-1', '2018-2019-1']})
+    assert student == Student('3901160407', '张三', ['2018-2019-1', '2019-2020-1'])
+
+
+def test_ignored_fields_are_dropped_silently(logger, caplog):
+    with caplog.at_level(logging.WARNING, logger=logger.name):
+        Student._decode({'code': '1', 'name': 'a', 'semester_list': [], 'group': 'student'})
+    assert not caplog.records
+
+
+def test_unknown_fields_are_dropped_with_throttled_warning(logger, caplog):
+    with caplog.at_level(logging.WARNING, logger=logger.name):
+        for _ in range(3):
+            student = Student._decode({'code': '1', 'name': 'a', 'semester_list': [], 'extra': 1})
+    assert student == Student('1', 'a', [])
+    assert len(caplog.records) == 1
+    assert '`extra`' in caplog.records[0].getMessage()
+
+
+def test_explicit_values_override_response_fields():
+    student = Student._decode({'code': '1', 'name': 'a', 'semester_list': ['x']}, name='b')
+    assert student.name == 'b'
+
+
+def test_missing_fields_raise_type_error():
+    with pytest.raises(TypeError):
+        Student._decode({'code': '1'})
+
+
+def test_rejects_renames_to_unknown_fields():
+    with pytest.raises(ValueError):
+        Decoder(Student, renames={'code': 'no_such_field'})
+
+
+def test_add_slots_removes_instance_dict():
+    student = Student('1', 'a', [])
+    assert not hasattr(student, '__dict__')
+    with pytest.raises(AttributeError):
+        student.other = 1
@@ -0,0 +1,80 @@
+import pytest
+
+from everyclass.rpc.disk_cache import DiskCache
+
+KEY = ('card', 'c1', '2018-2019-1')
+RESPONSE = {'status': 'success', 'card_id': 'c1', 'name': '高等数学'}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'entity.db')
+
+
+def test_round_trip_survives_reopen(path):
+    cache = DiskCache(path)
+    assert cache.get(KEY) is None
+    cache.set(KEY, RESPONSE)
+    assert cache.get(KEY) == RESPONSE
+    cache.close()
+    reopened = DiskCache(path)
+    assert reopened.get(KEY) == RESPONSE
+    assert reopened.stats()['entries'] == 1
+
+
+def test_version_change_clears_entries(path):
+    cache = DiskCache(path, version='1')
+    cache.set(KEY, RESPONSE)
+    cache.close()
+    assert DiskCache(path, version='1').get(KEY) == RESPONSE
+    bumped = DiskCache(path, version='2')
+    assert bumped.get(KEY) is None
+    assert bumped.stats()['entries'] == 0
+
+
+def test_invalidate(path):
+    cache = DiskCache(path)
+    cache.set(KEY, RESPONSE)
+    cache.set(('card', 'c2', '2018-2019-1'), RESPONSE)
+    cache.set(('student_timetable', 's1', '2017-2018-1'), RESPONSE)
+    assert cache.invalidate(endpoint='card', resource_id='c1') == 1
+    assert cache.invalidate(semester='2017-2018-1') == 1
+    assert cache.invalidate() == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_evicts_least_recently_accessed_entries(path):
+    cache = DiskCache(path, max_bytes=2000, touch_interval=0)
+    for i in range(200):
+        cache.set(('card', str(i), 's'), {'status': 'success', 'i': i, 'padding': str(i) * 20})
+        cache.get(('card', '0', 's'))  # 保持第一个条目为最近访问
+    stats = cache.stats()
+    assert stats['evictions'] > 0 and stats['bytes'] <= 2000
+    assert cache.get(('card', '0', 's')) is not None
+    assert cache.get(('card', '1', 's')) is None
+
+
+def test_unserializable_values_are_skipped(path, monkeypatch):
+    from everyclass import rpc
+    warnings = []
+    logger = type('Logger', (), {'warning': lambda self, message: warnings.append(message)})()
+    monkeypatch.setattr(rpc, '_logger', logger)
+    cache = DiskCache(path)
+    cache.set(KEY, {'status': 'success', 'avatar': b'\x89PNG'})
+    assert cache.get(KEY) is None
+    assert cache.stats()['errors'] == 1 and cache.stats()['writes'] == 0
+    assert len(warnings) == 1 and 'write' in warnings[0]
+
+
+def test_entity_call_survives_unserializable_response(entity, upstream, tmp_path, monkeypatch):
+    msgpack = pytest.importorskip('msgpack')
+    card = {'status': 'success', 'name': '高等数学', 'card_code': 'c1', 'course_code': 'x', 'room': 'A-101',
+            'room_code': 'r1', 'week_list': [1, 3], 'lesson': '10102', 'teacher_list': [], 'student_list': [],
+            'semester': '2017-2018-1', 'cover': b'\x89PNG'}
+    upstream.route('/lesson/c1/timetable/2017-2018-1',
+                   (200, msgpack.packb(card, use_bin_type=True), 0, {'Content-Type': 'application/msgpack'}))
+    monkeypatch.setattr(entity, 'CURRENT_SEMESTER', '2018-2019-1')
+    monkeypatch.setattr(entity, 'DISK_CACHE', DiskCache(str(tmp_path / 'entity.db')))
+    result = entity.get_card('2017-2018-1', 'c1')
+    assert result.card_id == 'c1' and result.week_string == '1-3/单周'
+    assert entity.DISK_CACHE.stats()['errors'] == 1 and entity.DISK_CACHE.stats()['entries'] == 0
@@ -0,0 +1,85 @@
+import json
+import time
+
+import pytest
+
+from everyclass.rpc import RpcResourceNotFound, RpcTimeout
+from everyclass.rpc.cache import TTLCache
+from everyclass.rpc.http import deadline_scope
+
+
+def _student(code: str) -> dict:
+    return {'status': 'success', 'name': f'学生{code}', 'student_code': code, 'campus': '校本部', 'deputy': '计算机学院',
+            'class': '软件1601', 'semester_list': ['2018-2019-1']}
+
+
+def _batch_requests(upstream) -> list:
+    return [json.loads(body)['student_ids'] for method, path, _, body in upstream.requests if path == '/student/batch']
+
+
+@pytest.fixture
+def batch_api(entity, monkeypatch):
+    monkeypatch.setattr(entity, 'BATCH_API', True)
+    monkeypatch.setattr(entity, '_batch_api_retry_at', 0.0)
+    return entity
+
+
+def test_multi_get_keeps_order_and_collects_errors(entity, upstream):
+    upstream.route('/student/1', (200, _student('1')))
+    upstream.route('/student/2', (200, _student('2')))
+    result = entity.get_students(['2', '3', '1', '2'])
+    assert [student.student_id if student else None for student in result] == ['2', None, '1', '2']
+    assert list(result.errors) == ['3'] and isinstance(result.errors['3'], RpcResourceNotFound)
+    assert upstream.calls('/student/2') == 1
+
+
+def test_multi_get_fan_out_keeps_the_callers_deadline(entity, upstream):
+    upstream.route('/student/1', (200, _student('1'), 1))
+    upstream.route('/student/2', (200, _student('2'), 1))
+    started = time.monotonic()
+    with deadline_scope(0.2):
+        result = entity.get_students(['1', '2'])
+    assert time.monotonic() - started < 0.8
+    assert all(isinstance(error, RpcTimeout) for error in result.errors.values()) and len(result.errors) == 2
+
+
+def test_batch_api_skips_cached_items(batch_api, upstream, monkeypatch):
+    monkeypatch.setattr(batch_api, 'CACHE', TTLCache())
+    upstream.route('/student/1', (200, _student('1')))
+    upstream.route('/student/batch', (200, {'status': 'success', 'data': {'2': _student('2')}}))
+    batch_api.get_student('1')
+    result = batch_api.get_students(['1', '2'])
+    assert [student.student_id for student in result] == ['1', '2'] and not result.errors
+    assert _batch_requests(upstream) == [['2']]
+
+
+def test_items_recovered_after_batch_404_are_not_reported_as_errors(batch_api, upstream, monkeypatch):
+    monkeypatch.setattr(batch_api, 'BATCH_SIZE', 1)
+    upstream.route('/student/batch', (200, {'status': 'success', 'data': {'1': {'name': 'malformed'}}}), (404, {}))
+    upstream.route('/student/1', (200, _student('1')))
+    upstream.route('/student/2', (200, _student('2')))
+    result = batch_api.get_students(['1', '2'])
+    assert _batch_requests(upstream) == [['1'], ['2']]
+    assert [student.student_id for student in result] == ['1', '2']
+    assert result.errors == {}
+
+
+def _search_page(start: int, size: int) -> dict:
+    return {'status': 'OK', 'data': [{'group': 'student', 'code': str(i), 'name': str(i), 'semester_list': [],
+                                      'deputy': '', 'class': ''} for i in range(start, start + size)]}
+
+
+def test_search_iter_stops_on_short_page(entity, upstream):
+    upstream.route('/search/query', (200, _search_page(0, 2)), (200, _search_page(2, 1)))
+    assert [item.student_id for item in entity.search_iter('x', page_size=2)] == ['0', '1', '2']
+    assert upstream.calls('/search/query') == 2
+
+
+def test_search_iter_prefetch_keeps_the_callers_deadline(entity, upstream):
+    upstream.route('/search/query', (200, _search_page(0, 2)), (200, _search_page(2, 2), 1))
+    started = time.monotonic()
+    items = []
+    with deadline_scope(0.3), pytest.raises(RpcTimeout):
+        for item in entity.search_iter('x', page_size=2):
+            items.append(item.student_id)
+    assert items == ['0', '1'] and time.monotonic() - started < 0.8
@@ -0,0 +1,64 @@
+import time
+
+import gevent
+
+from everyclass.rpc.hedge import HedgePolicy
+
+KEY = 'entity /student/{id}'
+
+
+def _policy(**options) -> HedgePolicy:
+    options = dict(dict(min_samples=1, min_delay=0.01, max_delay=0.02, budget_ratio=1, max_burst=10), **options)
+    return HedgePolicy(**options)
+
+
+def test_fast_primary_is_not_hedged():
+    policy = _policy()
+    calls = []
+    assert policy.run(KEY, lambda: calls.append(1) or 'ok') == 'ok'
+    assert len(calls) == 1 and policy.stats()[KEY]['hedged'] == 0
+
+
+def test_hedge_wins_cancels_primary_and_records_censored_latency():
+    policy = _policy(max_delay=1, min_delay=0.01)
+    policy.observe(KEY, 0.05)
+    latencies = iter([1, 0])
+    finished = []
+
+    def call():
+        gevent.sleep(next(latencies))
+        finished.append(1)
+        return 'ok'
+
+    started = time.monotonic()
+    assert policy.run(KEY, call) == 'ok'
+    assert time.monotonic() - started < 0.5
+    stats = policy.stats()[KEY]
+    assert stats['hedged'] == 1 and stats['hedge_won'] == 1
+    samples = list(policy._windows[KEY].samples)
+    assert len(samples) == 2 and samples[-1] >= 0.05  # 先发出的调用被取消时已等待的时间，不小于当时的阈值
+    gevent.sleep(0.05)
+    assert finished == [1]  # 先发出的调用已被取消，不会执行完
+
+
+def test_primary_exception_is_raised_when_both_fail():
+    policy = _policy()
+    errors = iter([KeyError('primary'), KeyError('hedge')])
+
+    def call():
+        error = next(errors)
+        gevent.sleep(0.05)
+        raise error
+
+    try:
+        policy.run(KEY, call)
+    except KeyError as e:
+        assert e.args == ('primary',)
+    else:
+        raise AssertionError('expected KeyError')
+
+
+def test_budget_limits_hedging():
+    policy = _policy(budget_ratio=0, max_burst=0)
+    assert policy.run(KEY, lambda: gevent.sleep(0.05) or 'ok') == 'ok'
+    assert policy.stats()[KEY]['budget_exhausted'] == 1 and policy.stats()[KEY]['hedged'] == 0
@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+from everyclass.rpc import RpcResourceNotFound, RpcServerException, RpcTimeout
+from everyclass.rpc.http import DEADLINE_HEADER, HttpRpc, deadline_scope
+
+
+def test_deadline_header_carries_remaining_budget(upstream):
+    upstream.route('/ping', (200, {'status': 'OK'}))
+    HttpRpc.call('GET', f'{upstream.url}/ping', deadline=2)
+    assert 1000 < int(upstream.requests[0][2][DEADLINE_HEADER]) <= 2000
+
+
+def test_deadline_bounds_the_whole_call(upstream):
+    upstream.route('/slow', (200, {}, 1))
+    started = time.monotonic()
+    with pytest.raises(RpcTimeout):
+        HttpRpc.call('GET', f'{upstream.url}/slow', deadline=0.2, retry=False)
+    assert time.monotonic() - started < 0.8
+
+
+def test_deadline_scope_shortens_the_deadline(upstream):
+    upstream.route('/slow', (200, {}, 1))
+    started = time.monotonic()
+    with deadline_scope(0.2), pytest.raises(RpcTimeout):
+        HttpRpc.call('GET', f'{upstream.url}/slow', deadline=5, retry=False)
+    assert time.monotonic() - started < 0.8
+
+
+def test_error_status_codes_raise(upstream):
+    upstream.route('/missing', (404, {}))
+    upstream.route('/broken', (500, {}))
+    with pytest.raises(RpcResourceNotFound):
+        HttpRpc.call('GET', f'{upstream.url}/missing')
+    with pytest.raises(RpcServerException):
+        HttpRpc.call('GET', f'{upstream.url}/broken')
+    assert upstream.calls('/broken') == 1  # 500 不重试
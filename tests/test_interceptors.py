@@ -0,0 +1,59 @@
+from everyclass.rpc.interceptors import (HeaderInterceptor, Interceptor, InterceptorChain, RpcRequest, RpcResponse,
+                                         SamplingProfiler, responded_request)
+
+SERVICE = 'entity'
+ENDPOINT = '/student/{id}'
+
+
+def _request(endpoint: str = ENDPOINT) -> RpcRequest:
+    return RpcRequest('GET', 'http://entity/student/1', SERVICE, endpoint, headers={})
+
+
+def _response() -> RpcResponse:
+    return RpcResponse(200, {}, attempts=1, response_bytes=10, network_seconds=0.02, decode_seconds=0.001)
+
+
+def _call(chain: InterceptorChain, request: RpcRequest, construct: bool = True) -> None:
+    chain.before_request(request)
+    chain.after_response(request, _response())
+    if construct:
+        chain.after_construct(request.service, request.endpoint, 0.005)
+
+
+def test_responded_request_matches_only_the_same_endpoint():
+    chain = InterceptorChain()
+    request = _request()
+    seen = []
+
+    class Recorder(Interceptor):
+        def after_construct(self, service, endpoint, seconds):
+            seen.append((responded_request(service, endpoint), responded_request(service, '/other')))
+
+    chain.add(Recorder())
+    _call(chain, request)
+    assert seen == [(request, None)]
+    assert responded_request(SERVICE, ENDPOINT) is None  # after_construct 之后清除
+
+
+def test_sampling_profiler_pairs_constructs_with_sampled_calls():
+    profiler = SamplingProfiler(sample_rate=1)
+    chain = InterceptorChain([profiler])
+    for _ in range(3):
+        _call(chain, _request())
+    profiler.sample_rate = 0
+    for _ in range(3):
+        _call(chain, _request())
+    chain.after_construct(SERVICE, ENDPOINT, 1.0)  # 没有对应调用的构造（如磁盘缓存命中）不计入
+    profile = profiler.profile()[f'{SERVICE} {ENDPOINT}']
+    assert profile['samples'] == 3
+    assert abs(profile['construct'] - 0.005) < 1e-9 and abs(profile['network'] - 0.02) < 1e-9
+
+
+def test_header_interceptor_respects_services():
+    chain = InterceptorChain([HeaderInterceptor({'X-Env': 'test'}, services=['auth'])])
+    request = _request()
+    chain.before_request(request)
+    assert 'X-Env' not in request.headers
+    chain.set([HeaderInterceptor({'X-Env': 'test'})])
+    chain.before_request(request)
+    assert request.headers['X-Env'] == 'test'
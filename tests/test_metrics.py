@@ -0,0 +1,95 @@
+import pytest
+
+from everyclass.rpc.metrics import CallRecord, MetricsRegistry, MetricsSink, endpoint_template, service_of
+
+
+@pytest.mark.parametrize('url, template', [
+    ('http://everyclass-entity/student/3901160407/timetable/2018-2019-1', '/student/{id}/timetable/{semester}'),
+    ('http://everyclass-entity/lesson/abc123/timetable/2018-2019-1?x=1', '/lesson/{id}/timetable/{semester}'),
+    ('http://everyclass-entity/room/', '/room/'),
+    ('http://everyclass-entity/search/query?key=张三', '/search/query'),
+    ('http://everyclass-entity', '/'),
+    ('everyclass-entity/teacher/0001', '/teacher/{id}'),
+    ('balanced://entity/student/1', '/student/{id}'),
+])
+def test_endpoint_template(url, template):
+    assert endpoint_template(url) == template
+
+
+def test_service_of_uses_host():
+    assert service_of('http://everyclass-entity:8000/student/1') == 'everyclass-entity:8000'
+
+
+def _record(endpoint: str, status: str = '200', latency: float = 0.02, retries: int = 0) -> CallRecord:
+    return CallRecord(service='entity', endpoint=endpoint, method='GET', status=status, latency=latency,
+                      retries=retries, response_bytes=100, decode_seconds=0.001, wire_bytes=40,
+                      request_bytes_saved=10, compression_seconds=0.0005)
+
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry(buckets=(0.01, 0.1))
+    registry.record_call(_record('/student/{id}'))
+    registry.record_call(_record('/student/{id}', status='timeout', latency=0.5, retries=2))
+    registry.record_call(_record('/card/"{id}"\n'))
+    registry.record_construct('entity', '/student/{id}', 0.003)
+    return registry
+
+
+def test_stats(registry):
+    stats = registry.stats()['entity /student/{id}']
+    assert stats['calls'] == 2 and stats['statuses'] == {'200': 1, 'timeout': 1} and stats['timeouts'] == 1
+    assert stats['retries'] == 2 and stats['constructs'] == 1 and stats['bytes_saved'] == 2 * (100 - 40 + 10)
+
+
+def test_prometheus_families_are_contiguous_with_type_and_help(registry):
+    lines = registry.render_prometheus().splitlines()
+    families = []
+    for i, line in enumerate(lines):
+        if line.startswith('# TYPE '):
+            name = line.split()[2]
+            assert lines[i + 1].startswith(f'# HELP {name} ')
+            families.append(name)
+    assert len(families) == len(set(families))
+    current = None
+    for line in lines:
+        if line.startswith('# TYPE '):
+            current = line.split()[2]
+        elif not line.startswith('#'):
+            assert line.startswith(current), line  # 样本紧跟在所属指标族之后
+
+
+def test_prometheus_histogram_and_escaping(registry):
+    text = registry.render_prometheus()
+    labels = 'service="entity",endpoint="/student/{id}"'
+    assert f'everyclass_rpc_latency_seconds_bucket{{{labels},le="0.01"}} 0' in text
+    assert f'everyclass_rpc_latency_seconds_bucket{{{labels},le="0.1"}} 1' in text
+    assert f'everyclass_rpc_latency_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f'everyclass_rpc_latency_seconds_count{{{labels}}} 2' in text
+    assert f'everyclass_rpc_calls_total{{{labels},status="timeout"}} 1' in text
+    assert 'endpoint="/card/\\"{id}\\"\\n"' in text
+
+
+def test_prometheus_output_parses(registry):
+    parser = pytest.importorskip('prometheus_client.parser')
+    families = {family.name: family for family in parser.text_string_to_metric_families(registry.render_prometheus())}
+    assert families['everyclass_rpc_latency_seconds'].type == 'histogram'
+    assert families['everyclass_rpc_calls'].type == 'counter'
+    calls = {(sample.labels['endpoint'], sample.labels['status']): sample.value
+             for sample in families['everyclass_rpc_calls'].samples if sample.name.endswith('_total')}
+    assert calls[('/student/{id}', 'timeout')] == 1
+    assert calls[('/card/"{id}"\n', '200')] == 1
+
+
+def test_partial_sink_only_receives_what_it_implements():
+    constructs = []
+
+    class ConstructSink(MetricsSink):
+        def record_construct(self, service, endpoint, seconds):
+            constructs.append((service, endpoint))
+
+    registry = MetricsRegistry(sinks=[ConstructSink()])
+    registry.record_call(_record('/student/{id}'))
+    registry.record_construct('entity', '/student/{id}', 0.001)
+    assert constructs == [('entity', '/student/{id}')]
+    assert registry.stats()['entity /student/{id}']['calls'] == 1
@@ -0,0 +1,76 @@
+import pytest
+import requests
+
+from everyclass.rpc import RpcServerNotAvailable
+from everyclass.rpc.http import HttpRpc
+from everyclass.rpc.retry import RetryBudget, RetryPolicy
+
+
+def test_budget_limits_retries_to_ratio_of_requests():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=10)
+    budget._tokens = 0
+    for _ in range(4):
+        budget.deposit()
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+
+def test_budget_is_capped_at_max_tokens():
+    budget = RetryBudget(ratio=1, min_per_second=0, max_tokens=3)
+    for _ in range(10):
+        budget.deposit()
+    assert budget.tokens == 3
+    assert [budget.withdraw() for _ in range(4)] == [True, True, True, False]
+
+
+def test_budget_refills_over_time():
+    budget = RetryBudget(ratio=0, min_per_second=1000, max_tokens=5)
+    budget._tokens = 0
+    budget._updated_at -= 1  # 一秒前
+    assert budget.tokens == 5
+
+
+def test_policy_retries_idempotent_calls_on_retryable_status_codes():
+    policy = RetryPolicy(max_attempts=3)
+    assert policy.should_retry(1, idempotent=True, status_code=503)
+    assert not policy.should_retry(1, idempotent=True, status_code=500)
+    assert not policy.should_retry(1, idempotent=False, status_code=503)
+    assert not policy.should_retry(3, idempotent=True, status_code=503)
+
+
+def test_policy_retries_non_idempotent_calls_only_when_not_sent():
+    policy = RetryPolicy()
+    assert policy.should_retry(1, idempotent=True, error=requests.exceptions.ReadTimeout())
+    assert not policy.should_retry(1, idempotent=False, error=requests.exceptions.ReadTimeout())
+    assert policy.should_retry(1, idempotent=False, error=requests.exceptions.ConnectTimeout())
+    assert not policy.should_retry(1, idempotent=True, error=ValueError())
+
+
+def test_policy_stops_when_budget_is_exhausted():
+    budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+    policy = RetryPolicy(budget=budget)
+    assert policy.should_retry(1, idempotent=True, status_code=503)
+    assert not policy.should_retry(1, idempotent=True, status_code=503)
+
+
+@pytest.mark.parametrize('attempt', [1, 2, 5, 10])
+def test_backoff_is_bounded(attempt):
+    policy = RetryPolicy(backoff_base=0.05, backoff_max=0.3)
+    for _ in range(100):
+        assert 0 <= policy.backoff(attempt) <= min(0.3, 0.05 * 2 ** (attempt - 1))
+
+
+def test_call_retries_get_until_success(upstream):
+    upstream.route('/flaky', (503, {}), (503, {}), (200, {'status': 'OK'}))
+    policy = RetryPolicy(max_attempts=3, backoff_base=0.001)
+    assert HttpRpc.call('GET', f'{upstream.url}/flaky', retry_policy=policy) == {'status': 'OK'}
+    assert upstream.calls('/flaky') == 3
+
+
+def test_call_does_not_retry_post_after_response(upstream):
+    upstream.route('/flaky', (503, {}), (200, {'status': 'OK'}))
+    with pytest.raises(RpcServerNotAvailable):
+        HttpRpc.call('POST', f'{upstream.url}/flaky', data={'a': 1},
+                     retry_policy=RetryPolicy(max_attempts=3, backoff_base=0.001))
+    assert upstream.calls('/flaky') == 1
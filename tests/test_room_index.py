@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import pytest
+
+from everyclass.rpc import RpcServerException
+from everyclass.rpc.entity import BatchResult
+from everyclass.rpc.room_index import PERIODS_PER_DAY, RoomIndex, lesson_mask, occupancy_of
+
+SEMESTER = '2018-2019-1'
+
+
+def _card(lesson: str, weeks):
+    return SimpleNamespace(lesson=lesson, weeks=list(weeks))
+
+
+class FakeEntity:
+    CURRENT_SEMESTER = SEMESTER
+
+    def __init__(self):
+        self.rooms = {'校本部': {'A': ['a1', 'a2', 'a3']}, '南校区': {'B': ['b1']}}
+        self.timetables = {'a1': [_card('10102', [1, 2, 3])],  # 周一第 1-2 节，第 1-3 周
+                           'a2': [_card('10304', [2])],
+                           'a3': [],
+                           'b1': [_card('50910', range(1, 17))]}
+        self.failing = set()
+        self.loaded = []
+
+    def invalidate_cache(self, endpoint=None, resource_id=None, semester=None):
+        pass
+
+    def get_rooms(self):
+        return self.rooms
+
+    def get_classroom_timetables(self, semester, room_ids):
+        self.loaded.append(list(room_ids))
+        errors = {room_id: RpcServerException(500, '') for room_id in room_ids if room_id in self.failing}
+        results = [None if room_id in errors else SimpleNamespace(cards=self.timetables.get(room_id, []))
+                   for room_id in room_ids]
+        return BatchResult(ids=list(room_ids), results=results, errors=errors)
+
+
+@pytest.mark.parametrize('lesson, day, start, end', [('10102', 1, 1, 2), ('10506', 1, 5, 6), ('71112', 7, 11, 12)])
+def test_lesson_mask_sets_one_bit_per_period(lesson, day, start, end):
+    mask = lesson_mask(lesson)
+    expected = {(day - 1) * PERIODS_PER_DAY + period - 1 for period in range(start, end + 1)}
+    assert {bit for bit in range(7 * PERIODS_PER_DAY) if mask >> bit & 1} == expected
+
+
+@pytest.mark.parametrize('lesson', ['', '1010', '101020', '80102', '00102', '10201', '1ab02', '10117'])
+def test_lesson_mask_rejects_invalid_lessons(lesson):
+    with pytest.raises(ValueError):
+        lesson_mask(lesson)
+
+
+def test_occupancy_merges_cards_and_skips_invalid_lessons():
+    occupancy = occupancy_of([_card('10102', [1, 2]), _card('10304', [2]), _card('bad', [1])])
+    assert occupancy == {1: lesson_mask('10102'), 2: lesson_mask('10102') | lesson_mask('10304')}
+
+
+def test_available_rooms_matches_brute_force():
+    entity = FakeEntity()
+    index = RoomIndex(entity=entity)
+    index.build()
+    for week in range(1, 5):
+        for session in ('10102', '10203', '10304', '10506'):
+            expected = [room_id for room_id in entity.rooms['校本部']['A']
+                        if not any(week in card.weeks and lesson_mask(card.lesson) & lesson_mask(session)
+                                   for card in entity.timetables[room_id])]
+            assert index.available_rooms(week, session, '校本部', 'A') == expected, (week, session)
+    assert index.available_rooms(1, '50910', '南校区', 'B') == []
+    assert index.available_rooms(17, '50910', '南校区', 'B') == ['b1']
+
+
+def test_available_rooms_returns_none_when_index_cannot_answer():
+    entity = FakeEntity()
+    index = RoomIndex(entity=entity)
+    assert index.available_rooms(1, '10102', '校本部', 'A') is None  # 未构建
+    entity.failing = {'a2'}
+    index.build()
+    assert index.available_rooms(1, '10102', '校本部', 'A') is None  # a2 的课表未能查询
+    assert index.available_rooms(1, '10102', '南校区', 'B') == ['b1']  # b1 只在周五有课
+    assert index.available_rooms(1, '10102', '校本部', 'C') is None  # 楼栋不在索引中
+    assert index.available_rooms(1, 'bad', '南校区', 'B') is None
+    entity.CURRENT_SEMESTER = '2018-2019-2'
+    assert index.available_rooms(1, '10102', '南校区', 'B') is None  # 学期变化后等待重建
+
+
+def test_refresh_reloads_failed_and_new_rooms():
+    entity = FakeEntity()
+    entity.failing = {'a2'}
+    index = RoomIndex(entity=entity, refresh_batch=2)
+    index.build()
+    entity.failing = set()
+    entity.rooms['校本部']['A'].append('a4')
+    entity.timetables['a4'] = [_card('10102', [1])]
+    while index.available_rooms(1, '10102', '校本部', 'A') != ['a2', 'a3']:
+        index.refresh()
+        assert len(entity.loaded) < 10
+    assert entity.loaded[1] == ['a4', 'a1']  # 新增的教室优先刷新
+    assert index.stats()['missing'] == 0 and index.stats()['rooms'] == 5
+
+
+def test_entity_answers_from_the_index_only_through_get_available_room_ids(entity, upstream, monkeypatch):
+    fake = FakeEntity()
+    index = RoomIndex(entity=fake)
+    index.build()
+    monkeypatch.setattr(entity, 'ROOM_INDEX', None)
+    assert entity.get_available_room_ids(1, '10102', '校本部', 'A') is None
+    entity.set_room_index(index)
+    monkeypatch.setattr(entity, 'CURRENT_SEMESTER', SEMESTER)
+    assert entity.get_available_room_ids(1, '10304', '校本部', 'A') == ['a1', 'a2', 'a3']
+    assert upstream.requests == []
+    upstream.route('/room/available', (200, {'status': 'OK', 'available_room': [{'code': 'a3'}]}))
+    assert entity.get_available_rooms(1, '10304', '校本部', 'A') == [{'code': 'a3'}]  # 仍然请求上游，原样返回
+    assert upstream.calls('/room/available') == 1
@@ -0,0 +1,31 @@
+import pytest
+
+from everyclass.rpc.http import HttpRpc
+from everyclass.rpc.session import SessionRegistry, base_url_of, registry
+
+
+@pytest.mark.parametrize('url, base_url', [
+    ('http://everyclass-entity:8000/student/1?a=1', 'http://everyclass-entity:8000'),
+    ('https://ssl.captcha.qq.com/ticket/verify', 'https://ssl.captcha.qq.com'),
+    ('everyclass-entity/student/1', 'everyclass-entity'),
+])
+def test_base_url_of(url, base_url):
+    assert base_url_of(url) == base_url
+
+
+def test_one_session_per_upstream():
+    sessions = SessionRegistry()
+    assert sessions.get('http://a:1/x') is sessions.get('http://a:1/y')
+    assert sessions.get('http://a:1/x') is not sessions.get('http://a:2/x')
+    session = sessions.get('http://a:1/x')
+    sessions.configure(pool_maxsize=2)
+    assert sessions.get('http://a:1/x') is not session  # 修改参数后按新参数重建
+    assert sessions.get('http://a:1/x').get_adapter('http://a:1/x')._pool_maxsize == 2
+
+
+def test_calls_reuse_keep_alive_connection(upstream):
+    upstream.route('/ping', (200, {'status': 'OK'}))
+    for _ in range(3):
+        assert HttpRpc.call('GET', f'{upstream.url}/ping') == {'status': 'OK'}
+    (host_stats,) = registry.stats()[upstream.url].values()
+    assert host_stats['connections'] == 1 and host_stats['requests'] == 3 and host_stats['idle'] == 1
@@ -0,0 +1,48 @@
+import gevent
+
+from everyclass.rpc.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        gevent.sleep(0.01)
+        return 'result'
+
+    greenlets = [gevent.spawn(flight.do, 'key', fetch) for _ in range(5)]
+    gevent.joinall(greenlets, raise_error=True)
+    assert [greenlet.value for greenlet in greenlets] == ['result'] * 5
+    assert len(calls) == 1 and flight.in_flight() == 0
+
+
+def test_exception_is_shared_with_waiters():
+    flight = SingleFlight()
+
+    def fail():
+        gevent.sleep(0.01)
+        raise KeyError('boom')
+
+    greenlets = [gevent.spawn(flight.do, 'key', fail) for _ in range(3)]
+    gevent.joinall(greenlets)
+    assert all(isinstance(greenlet.exception, KeyError) for greenlet in greenlets)
+
+
+def test_killed_leader_hands_over_to_waiter():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        gevent.sleep(0.02)
+        return len(calls)
+
+    leader = gevent.spawn(flight.do, 'key', fetch)
+    gevent.sleep(0)
+    waiter = gevent.spawn(flight.do, 'key', fetch)
+    gevent.sleep(0.005)
+    leader.kill()
+    assert waiter.get(timeout=1) == 2
+    assert isinstance(leader.value, gevent.GreenletExit)
@@ -0,0 +1,61 @@
+import itertools
+import random
+
+import pytest
+
+from everyclass.rpc.entity import WeekSet, _mask_to_string, _weeks_to_string, weeks_to_string
+
+# 基线实现（位图缓存之前的 weeks_to_string）的输出
+BASELINE = [
+    ([1], '1/周'),
+    (list(range(1, 17)), '1-16/周'),
+    ([1, 3, 5, 7], '1-7/单周'),
+    ([2, 4, 6, 8], '2-8/双周'),
+    ([1, 2, 3, 5, 7, 9], '1-3/周, 5-9/单周'),
+    ([1, 5], '1, 5/周'),
+    ([1, 2, 3, 4, 6, 8, 10, 11, 12], '1-4/周, 6-10/双周, 11-12/周'),
+    ([3, 4, 5, 6, 7, 8, 10, 12, 14, 16, 17, 18], '3-8/周, 10-16/双周, 17-18/周'),
+]
+
+
+@pytest.mark.parametrize('weeks, expected', BASELINE)
+def test_weeks_to_string_matches_baseline(weeks, expected):
+    assert _weeks_to_string(weeks) == expected
+    assert weeks_to_string(weeks) == expected
+    assert WeekSet.from_weeks(weeks).to_string() == expected
+
+
+def test_bitmask_path_is_equivalent_for_every_subset_of_weeks_1_to_14():
+    for size in range(1, 15):
+        for weeks in itertools.combinations(range(1, 15), size):
+            weeks = list(weeks)
+            assert weeks_to_string(weeks) == _weeks_to_string(weeks), weeks
+
+
+def test_bitmask_path_is_equivalent_for_random_long_semesters():
+    rnd = random.Random(0)
+    for _ in range(5000):
+        weeks = sorted(rnd.sample(range(1, 26), rnd.randint(1, 25)))
+        assert weeks_to_string(weeks) == _weeks_to_string(weeks), weeks
+
+
+@pytest.mark.parametrize('weeks', [[3, 1, 2], [1, 1, 2], [0, 1, 2], [2, 2]])
+def test_non_increasing_input_falls_back_to_direct_conversion(weeks):
+    assert weeks_to_string(weeks) == _weeks_to_string(weeks)
+
+
+def test_mask_to_string_uses_bit_n_for_week_n():
+    assert _mask_to_string(0b1010) == '1-3/单周'
+    assert _mask_to_string(1 << 5 | 1 << 6) == '5-6/周'
+
+
+def test_week_set_operations():
+    odd = WeekSet.from_weeks([1, 3, 5])
+    low = WeekSet.from_weeks([1, 2, 3])
+    assert 3 in odd and 2 not in odd and -1 not in odd
+    assert list(odd & low) == [1, 3]
+    assert list(odd | low) == [1, 2, 3, 5]
+    assert odd.intersects(low) and not odd.intersects(WeekSet.from_weeks([2, 4]))
+    assert len(odd) == 3 and bool(odd) and not WeekSet()
+    assert odd == WeekSet.from_weeks([5, 3, 1]) and hash(odd) == hash(WeekSet(odd.mask))
+    assert odd.to_list() == [1, 3, 5]